@@ -0,0 +1,987 @@
+# -*- encoding: utf-8 -*-
+"""chinses_date_translator 的性能测试
+
+用法:
+    python benchmark.py
+"""
+
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import deque
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import regex as re
+
+import chinses_date_translator as cdt_module
+from chinses_date_translator import (RULES, cdt, cdt_batch, cdt_parallel, iter_dates, number_translator, segment, str2int,
+                                     word2number)
+
+SAMPLE_TEXTS = [
+    '2019年到18年',
+    '95年到14年',
+    '98年和14年',
+    '2000年第一季度',
+    '2018年4月',
+    '6月十五号',
+    '去年下半年',
+    '最近三个月',
+    '上周礼拜五',
+    '五号之前',
+    '18年4月十号到二零二零年5月4日',
+    '张飞和关羽三月份和七月份的饭量',
+    '今天房价如何?',
+    '这个人现在是这么状态?',
+]
+
+
+# 按类别分组的标注语料, 期望结果以`REFERENCE_DATE`为参考时间. 最初是`chinses_date_translator`
+# 的`__main__`中的例子, 每次跑性能测试之前先核对结果, 优化不能悄悄改变输出
+REFERENCE_DATE = '2021-07-14'
+CORPUS: Dict[str, Dict[str, List]] = {
+    'union': {
+        '2019年4月10日': [('=', '2019-04-10')],
+        '2019年4月10日到2020年5月16日': [('2019-04-10', '2020-05-16')],
+        '2018年到2019年': [('2018-01-01', '2019-12-31')],
+        '第1季度到第四季度': [('2021-01-01', '2021-12-31')],
+        '2018年第2季度到2021年第三季度': [('2018-04-01', '2021-09-30')],
+        '18年4月到二零二零年5月': [('2018-04-01', '2020-05-31')],
+        '4月19号到十二月7日': [('2021-04-19', '2021-12-07')],
+        '14年十二月八号至19年4月29日': [('2014-12-08', '2019-04-29')],
+        '18年4月十号到二零二零年5月4日': [('2018-04-10', '2020-05-04')],
+        '昨天到今天到明天': [('2021-07-13', '2021-07-14')],
+        '2019年到18年': [],
+        '95年到14年': [('1995-01-01', '2014-12-31')],
+        '2000年第一季度': [('2000-01-01', '2000-03-31')],
+        '2018年4月': [('2018-04-01', '2018-04-30')],
+        '6月十五号': [('=', '2021-06-15')],
+        '2016年十月三十号': [('=', '2016-10-30')],
+        '上周末': [('=', '2021-07-11')],
+        '2018年前两个季度': [('2018-01-01', '2018-06-30')],
+        '前三季度': [('2020-10-01', '2021-06-30')],
+        '20年前2个月': [('2020-01-01', '2020-02-29')],
+        '95年第一季度': [('1995-01-01', '1995-03-31')],
+        '08年第一场雪': [('2008-01-01', '2008-12-31')],
+        '2017年3月到6月': [('2017-03-01', '2017-06-30')],
+        '2018年第一季度到第三季度': [('2018-01-01', '2018-09-30')],
+        '2024年3月1号前': [('<=', '2024-02-29')],
+    },
+    'year': {
+        '一九年上半年': [('2019-01-01', '2019-06-30')],
+        '最近半年的天气咋样?': [('2021-01-14', '2021-07-14')],
+        '上半年': [('2021-01-01', '2021-06-30')],
+        '去年下半年': [('2020-07-01', '2020-12-31')],
+        '最近三年': [('2018-07-14', '2021-07-14')],
+        '前三年': [('2018-01-01', '2020-12-31')],
+        '5年前': [('2016-01-01', '2016-12-31')],
+        '5年后': [('>=', '2026-07-14')],
+        '5年内': [('2016-07-14', '2021-07-14')],
+        '今年': [('2021-01-01', '2021-12-31')],
+        '明年': [('2022-01-01', '2022-12-31')],
+        '前年': [('2019-01-01', '2019-12-31')],
+        '大前年': [('2019-01-01', '2019-12-31')],
+        '后年': [('2023-01-01', '2023-12-31')],
+        '半年前': [('2021-01-01', '2021-01-31')],
+        '半年后': [('>=', '2022-01-14')],
+        '2008年': [('2008-01-01', '2008-12-31')],
+    },
+    'season': {
+        '这个季度': [('2021-07-01', '2021-09-30')],
+        '第三季': [('2021-07-01', '2021-09-30')],
+        '最近1个季度': [('2021-04-01', '2021-06-30')],
+        '上个季度': [('2021-04-01', '2021-06-30')],
+        '前三个季度': [('2020-10-01', '2021-06-30')],
+        '去年前三个季度': [('2020-01-01', '2020-09-30')],
+        '这1季': [('2021-07-01', '2021-09-30')],
+        '春天': [],
+        '今年夏季': [('2021-04-01', '2021-06-30')],
+        '下个季度': [],
+    },
+    'month': {
+        '近三个月': [('2021-04-14', '2021-07-14')],
+        '这个月': [('2021-07-01', '2021-07-31')],
+        '本月': [('2021-07-01', '2021-07-31')],
+        '前三个月': [('2021-04-01', '2021-06-30')],
+        '五月份': [('2021-05-01', '2021-05-31')],
+        '4月前': [('<=', '2021-03-31')],
+        '4个月前': [('2021-03-01', '2021-03-31')],
+        '5月份以后': [('>=', '2021-05-01')],
+        '5个月后': [('>=', '2021-12-14')],
+        '去年5月前': [('<=', '2020-04-30')],
+        '一个月': [],
+        '上个月': [('2021-06-01', '2021-06-30')],
+        '下个月': [],
+        '12月前': [('<=', '2021-12-31')],
+        '2月': [('2021-02-01', '2021-02-28')],
+    },
+    'week': {
+        '这一周': [('2021-07-12', '2021-07-18')],
+        '周三': [('=', '2021-07-14')],
+        '这周': [('2021-07-12', '2021-07-18')],
+        '这周五': [('=', '2021-07-16')],
+        '最近一周': [('2021-07-07', '2021-07-14')],
+        '前1周': [('2021-07-05', '2021-07-11')],
+        '上周礼拜五': [('=', '2021-07-09')],
+        '上礼拜三到这星期五': [('2021-07-07', '2021-07-16')],
+        '上周周一到周四': [('2021-07-05', '2021-07-15')],
+        '三周前': [('2021-06-21', '2021-06-27')],
+        '前三周': [('2021-06-21', '2021-07-11')],
+        '三周后': [('>=', '2021-08-04')],
+        '下周': [('2021-07-12', '2021-07-18')],
+        '星期天': [('=', '2021-07-18')],
+        '上个周末': [('=', '2021-07-11')],
+    },
+    'day': {
+        '今天': [('=', '2021-07-14')],
+        '2号到今天': [('2021-07-02', '2021-07-14')],
+        '2号到30号': [('2021-07-02', '2021-07-30')],
+        '前五天': [('2021-07-09', '2021-07-14')],
+        '十八日': [('=', '2021-07-18')],
+        '五天前': [('=', '2021-07-09')],
+        '五号前': [('<=', '2021-07-04')],
+        '30号': [('=', '2021-07-30')],
+        '五月一号到三号': [('2021-05-01', '2021-05-03')],
+        '五月前十天': [('2021-05-01', '2021-05-10')],
+        '3天后': [('>=', '2021-07-17')],
+        '5月3号前': [('<=', '2021-05-02')],
+        '1月1日前': [('<=', '2020-12-31')],
+        '十五号到昨天': [],
+        '昨天': [('=', '2021-07-13')],
+        '前天': [('=', '2021-07-12')],
+        '大后天': [('=', '2021-07-17')],
+        '2月30号': [('=', '2021-02-28')],
+        '1号前': [('<=', '2021-06-30')],
+    },
+    '到': {
+        '6月到七月': [('2021-06-01', '2021-07-31')],
+        '18年6月1号到30号': [('2018-06-01', '2018-06-30')],
+        '19年第一季度到第二季度': [('2019-01-01', '2019-06-30')],
+        '去年到今天': [('2020-01-01', '2021-07-14')],
+        '去年到今年': [('2020-01-01', '2021-12-31')],
+        '去年一月一号到2021年7月13日': [('2020-01-01', '2021-07-13')],
+        '去年1月1号到今年': [('2020-01-01', '2021-12-31')],
+        '去年到现在': [('2020-01-01', '2021-07-14')],
+        '18到19年': [('2018-01-01', '2019-12-31')],
+        '六月2到3号': [('2021-06-02', '2021-06-03')],
+        '08年五到六月': [('2008-05-01', '2008-06-30')],
+    },
+    '和': {
+        '2019年八月1日和十月20日': [('=', '2019-08-01'), ('=', '2019-10-20')],
+        '2015年4月和去年3月': [('2015-04-01', '2015-04-30'), ('2020-03-01', '2020-03-31')],
+        '1号和5号': [('=', '2021-07-01'), ('=', '2021-07-05')],
+        '2019年和今年': [('2019-01-01', '2019-12-31'), ('2021-01-01', '2021-12-31')],
+        '98年和14年': [('1998-01-01', '1998-12-31'), ('2014-01-01', '2014-12-31')],
+        '张飞和关羽四月份的体重': [('2021-04-01', '2021-04-30')],
+        '张飞和关羽三月份和七月份的饭量': [('2021-03-01', '2021-03-31'), ('2021-07-01', '2021-07-31')],
+        '张飞和关羽去年三月到六月的运动量': [('2020-03-01', '2020-06-30')],
+        '第一季度': [('2021-01-01', '2021-03-31')],
+    },
+    '最近': {
+        '最近销量咋样啊': [('2021-07-04', '2021-07-14')],
+        '最近3天去哪儿玩了': [('2021-07-11', '2021-07-14')],
+        '最近': [('2021-07-04', '2021-07-14')],
+        '最近两个月': [('2021-05-14', '2021-07-14')],
+        '最近十天': [('2021-07-04', '2021-07-14')],
+    },
+    '现在': {
+        '今天房价如何?': [('=', '2021-07-14')],
+        '这个人现在是这么状态?': [],
+        '现在在哪?': [],
+        '现在': [],
+    },
+}
+EXAMPLE_TEXTS = [text for texts in CORPUS.values() for text in texts]
+
+
+# ------------------------ 旧版number_translator, 作为对照 ------------------------ #
+LEGACY_NUMBER_RULES = [
+    # (正则, 单位, 省略叫法)
+    (re.compile(r"[一二两三四五六七八九123456789]亿[一二两三四五六七八九123456789](?!(万|千|百|十))"), '亿', 10 ** 8),
+    (re.compile(r"[一二两三四五六七八九123456789]万[一二两三四五六七八九123456789](?!(千|百|十))"), '万', 10 ** 4),
+    (re.compile(r"[一二两三四五六七八九123456789]千[一二两三四五六七八九123456789](?!(百|十))"), '千', 1000),
+    (re.compile(r"[一二两三四五六七八九123456789]百[一二两三四五六七八九123456789](?!十)"), '百', 100),
+]
+LEGACY_DIGIT = re.compile(r"[零一二两三四五六七八九]")
+LEGACY_WEEKEND = re.compile(r"(?<=(周|星期))[末天日]")
+LEGACY_TEN = re.compile(r"(?<!(周|星期))0?[0-9]?十[0-9]?")
+LEGACY_UNIT_RULES = [
+    (re.compile(r"0?[1-9]百[0-9]?[0-9]?"), '百', 100),
+    (re.compile(r"0?[1-9]千[0-9]?[0-9]?[0-9]?"), '千', 1000),
+    (re.compile(r"[0-9]+万[0-9]?[0-9]?[0-9]?[0-9]?"), '万', 10 ** 4),
+    (re.compile(r"[0-9]+亿[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?"), '亿', 10 ** 8),
+]
+
+
+def legacy_number_translator(target: str) -> str:
+    """多次正则替换的旧实现, 只用于差异对比和性能对照
+    """
+    for pattern, unit, value in LEGACY_NUMBER_RULES:
+        for m in pattern.finditer(target):
+            s = list(filter(None, m.group().split(unit)))
+            num = 0
+            if len(s) == 2:
+                num += word2number(s[0]) * value + word2number(s[1]) * value // 10
+            target = pattern.sub(str(num), target, 1)
+    for m in LEGACY_DIGIT.finditer(target):
+        target = LEGACY_DIGIT.sub(str(word2number(m.group())), target, 1)
+    for m in LEGACY_WEEKEND.finditer(target):
+        target = LEGACY_WEEKEND.sub("7", target, 1)
+    for m in LEGACY_TEN.finditer(target):
+        s = m.group().split("十")
+        ten = str2int(s[0])
+        if ten == 0:
+            ten = 1
+        target = LEGACY_TEN.sub(str(ten * 10 + str2int(s[1])), target, 1)
+    for pattern, unit, value in LEGACY_UNIT_RULES:
+        for m in pattern.finditer(target):
+            s = list(filter(None, m.group().split(unit)))
+            num = 0
+            if len(s) == 1:
+                num += int(s[0]) * value
+            elif len(s) == 2:
+                num += int(s[0]) * value + int(s[1])
+            target = pattern.sub(str(num), target, 1)
+    return target
+
+
+# 旧的切分正则, 已由`segment`代替
+LEGACY_TOTAL_RULE = re.compile(r"(\S+年前*后*)?(\S+季前*后*)?(\S+月份*前*后*)?(\S*[0-9一二两三四五六七八九十]*周前*后*[1-7一二三四五六七]*)?(\S+[0-9一二两三四五六七八九十]*[号日天]前*后*)?")
+
+
+def chinese_number(n: int, liang: bool = False) -> str:
+    """生成标准的中文数字, 用于构造差异对比的样本
+    """
+    digits = '零一二三四五六七八九'
+
+    def below_10000(n: int, leading: bool) -> str:
+        res, zero, started = '', False, False
+        for value, unit in ((1000, '千'), (100, '百'), (10, '十'), (1, '')):
+            d = n // value % 10
+            if d == 0:
+                zero = zero or started
+                continue
+            if zero:
+                res += '零'
+                zero = False
+            # `十五`省略`一`, 但`一百一十五`不省略
+            res += unit if (value == 10 and d == 1 and not started and not leading) else digits[d] + unit
+            started = True
+        return res
+
+    def below_10e8(n: int, leading: bool) -> str:
+        wan, low = divmod(n, 10 ** 4)
+        res = below_10000(wan, leading) + '万' if wan else ''
+        if low:
+            res += ('零' if wan and low < 1000 else '') + below_10000(low, bool(wan) or leading)
+        return res
+
+    if n == 0:
+        return '零'
+    yi, low = divmod(n, 10 ** 8)
+    res = below_10e8(yi, False) + '亿' if yi else ''
+    if low:
+        res += ('零' if yi and low < 10 ** 7 else '') + below_10e8(low, bool(yi))
+    return res.replace('二', '两') if liang else res
+
+
+def number_samples(size: int = 20000, seed: int = 0) -> List[str]:
+    """差异对比的样本: 0~10^16-1 的标准中文数字, 省略叫法, 逐字数字和句子
+    """
+    rnd = random.Random(seed)
+    samples = [chinese_number(n) for n in range(10000)]
+    for _ in range(size):
+        n = rnd.randrange(10 ** rnd.randint(1, 16))
+        samples.append(chinese_number(n, liang=rnd.random() < 0.3))
+    short_digits = '一二两三四五六七八九123456789'
+    for d1 in short_digits:
+        for unit in '百千万亿':
+            for d2 in short_digits:
+                samples.append(d1 + unit + d2)
+    samples += [
+        '两万零六百五', '三千五万', '两百一十四', '两百十四', '一六零加一五八', '二零二零', '零八',
+        '千万', '百万', '周日', '星期天', '周末', '周十五', '这里有一千两百个人，六百零五个来自中国',
+        '18年4月十号到二零二零年5月4日', '最近3天', '百分之五十',
+    ]
+    return samples
+
+
+def check_number_translator(samples: Iterable[str] = None) -> int:
+    """`number_translator`与旧实现的差异对比, 打印并返回不一致的样本数
+    """
+    samples = number_samples() if samples is None else samples
+    diff = 0
+    for text in samples:
+        expected = legacy_number_translator(text)
+        actual = number_translator(text)
+        if expected != actual:
+            diff += 1
+            print(f'  {text!r}: legacy {expected!r}, new {actual!r}')
+    return diff
+
+
+class KeywordAutomaton(object):
+    """Aho-Corasick自动机, 一次扫描找出全部关键词, 作为前处理关键词匹配的对照
+
+    失败指针展开为完整的状态转移表, 每个字符只查一次字典
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        goto: List[Dict[str, int]] = [{}]
+        output: List[Tuple[str, ...]] = [()]
+        for word in dict.fromkeys(keywords):
+            state = 0
+            for ch in word:
+                if ch not in goto[state]:
+                    goto[state][ch] = len(goto)
+                    goto.append({})
+                    output.append(())
+                state = goto[state][ch]
+            output[state] += (word,)
+        self.delta = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque((child, 0) for child in goto[0].values())
+        while queue:
+            state, fail = queue.popleft()
+            output[state] += output[fail]
+            self.delta[state] = {**self.delta[fail], **goto[state]}
+            for ch, child in goto[state].items():
+                queue.append((child, self.delta[fail].get(ch, 0)))
+        self.output = output
+
+    def findall(self, text: str) -> List[Tuple[int, str]]:
+        """全部的(起始位置, 关键词), 包括互相重叠的
+        """
+        delta, output = self.delta, self.output
+        hits, state = [], 0
+        for end, ch in enumerate(text, 1):
+            state = delta[state].get(ch, 0)
+            for word in output[state]:
+                hits.append((end - len(word), word))
+        return hits
+
+
+LEGACY_WEEK_WORD = re.compile(r'星期|礼拜')
+LEGACY_WEEKEND_WORD = re.compile(r'周日|周末|周天')
+
+
+def legacy_text_preprocess(text: str) -> str:
+    """每一步都重新扫描全文的旧实现, 只用于差异对比和性能对照
+    """
+    text = LEGACY_WEEK_WORD.sub('周', text)
+    text = LEGACY_WEEKEND_WORD.sub('周七', text)
+    for old, new in (('至', '到'), ('到期', '过期'), ('之内', '内'), ('之前', '前'), ('以前', '前'),
+                     ('之后', '后'), ('以后', '后')):
+        text = text.replace(old, new)
+    if '现在' in text and '到' not in text:
+        text = text.replace('现在', 'now')
+    text = text.replace('现在', '今天')
+    for name in ('year_in', 'season_in', 'month_in', 'week_in', 'day_in'):
+        res = RULES[name].compiled.search(text)
+        if res:
+            groups = res.groups()
+            text = text.replace(groups[0] + groups[1] + groups[2], '最近' + groups[0] + groups[1])
+    if '年前' in text and RULES['year_before_mark'].compiled.search(text):
+        text = text.replace('年前', '年偂')
+    if '月前' in text and RULES['month_before_mark'].compiled.search(text):
+        text = text.replace('月前', '月偂')
+    if '到' in text or '和' in text:
+        for name, unit in (('com_year', '年'), ('com_season', '季'), ('com_month', '月'), ('com_day', '号')):
+            res = RULES[name].compiled.search(text)
+            if res:
+                text = text.replace(res.groups()[0], res.groups()[0] + unit)
+        res = RULES['com_year_season'].compiled.search(text)
+        if res:
+            text = text.replace(res.groups()[4], res.groups()[0] + res.groups()[4])
+        res = RULES['com_year_month'].compiled.search(text)
+        if res:
+            old = res.groups()[4] + res.groups()[5]
+            text = text.replace(old, res.groups()[0] + old)
+        res = RULES['com_year_month_day'].compiled.search(text)
+        if res:
+            l_year, l_month, l_day, _, r_year, r_month, r_day = res.groups()
+            if (l_month and l_day and r_day) and not (l_year or r_year or r_month):
+                text = text.replace(r_day, l_month + r_day)
+            if (l_year and l_month and l_day and r_month and r_day) and not r_year:
+                text = text.replace(r_month + r_day, l_year + r_month + r_day)
+            if (l_year and l_month and l_day and r_day) and not (r_year or r_month):
+                text = text.replace(r_day, l_year + l_month + r_day)
+        res = RULES['com_week'].compiled.search(text)
+        if res:
+            text = text.replace(res.groups()[3] + res.groups()[4], res.groups()[0] + res.groups()[4])
+    return text
+
+
+# 前处理的标准输出, 包括README中列出的说法
+PREPROCESS_GOLDEN = {
+    '2019年到18年': '2019年到18年',
+    '95年到14年': '95年到14年',
+    '98年和14年': '98年和14年',
+    '2000年第一季度': '2000年第一季度',
+    '2018年4月': '2018年4月',
+    '6月十五号': '6月十五号',
+    '礼拜天': '周七',
+    '这个星期天': '这个周七',
+    '六月2到3号': '六月2号到六月3号',
+    '08年五到六月': '08年五月到08年六月',
+    '18到19年': '18年到19年',
+    '三年内': '最近三年',
+    '最近两个季度内': '最近最近两个季度',
+    '三个月之内': '最近三个月',
+    '两周内': '最近两周',
+    '十天以内': '十天以内',
+    '三月前三天': '三月偂三天',
+    '去年前三个月': '去年偂三个月',
+    '上周一到周三': '上周一到上周三',
+    '18年4月到6月': '18年4月到18年6月',
+    '2018年第一季度到第三季度': '2018年第一季度到2018年第三季度',
+    '3月5日到7日': '3月5日到3月7日',
+    '2018年3月5日到7日': '2018年3月5日到2018年3月7日',
+    '五号之前': '五号前',
+    '现在': 'now',
+    '现在到下周': '今天到下周',
+    '合同至期时间': '合同过期时间',
+}
+
+
+def check_preprocess() -> int:
+    """`text_preprocess`与标准输出以及旧实现的差异对比, 打印并返回不一致的样本数
+    """
+    diff = 0
+    texts = list(PREPROCESS_GOLDEN) + SAMPLE_TEXTS + NON_DATE_TEXTS
+    for text in texts:
+        expected = PREPROCESS_GOLDEN.get(text, legacy_text_preprocess(text))
+        actual = cdt_module.text_preprocess(text)
+        if expected != actual or legacy_text_preprocess(text) != actual:
+            diff += 1
+            print(f'  {text!r}: expected {expected!r}, got {actual!r}')
+    return diff
+
+
+def check_corpus(reference_date: str = REFERENCE_DATE) -> int:
+    """`CORPUS`的转换结果与期望的差异对比, 打印并返回不一致的样本数
+    """
+    diff = 0
+    for category, texts in CORPUS.items():
+        for text, expected in texts.items():
+            actual = cdt(text, reference_date=reference_date)
+            if actual != expected:
+                diff += 1
+                print(f'  [{category}] {text!r}: expected {expected!r}, got {actual!r}')
+    return diff
+
+
+def percentile(costs: List[float], q: float) -> float:
+    """最近秩法的分位数, `q`为0到100
+    """
+    costs = sorted(costs)
+    return costs[min(len(costs) - 1, int(q / 100 * len(costs)))]
+
+
+def measure(texts: List[str], repeat: int) -> Tuple[List[float], float]:
+    """逐条调用`cdt`, 返回每次调用的耗时(微秒), 以及单次调用的平均内存峰值(字节)
+
+    内存由tracemalloc统计, 会拖慢调用, 所以和计时分开跑一遍
+    """
+    import tracemalloc
+
+    costs = []
+    for _ in range(repeat):
+        for text in texts:
+            st = time.perf_counter_ns()
+            cdt(text, reference_date=REFERENCE_DATE)
+            costs.append((time.perf_counter_ns() - st) / 1000)
+    peak = 0
+    tracemalloc.start()
+    for text in texts:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        cdt(text, reference_date=REFERENCE_DATE)
+        peak += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return costs, peak / len(texts)
+
+
+def bench_corpus(repeat: int = 200) -> int:
+    """按类别统计`CORPUS`的延迟分位数, 吞吐量和每次调用的内存峰值, 先核对结果
+
+    Returns:
+        int: 结果与期望不一致的样本数
+    """
+    cdt_module.warmup()
+    diff = check_corpus()
+    print(f'corpus ({len(EXAMPLE_TEXTS)} texts, {diff} differ from expected, reference date {REFERENCE_DATE})')
+    print(f'  {"category":<10}{"texts":>6}{"p50 us":>10}{"p99 us":>10}{"calls/s":>12}{"peak B":>10}')
+    groups = list(CORPUS.items()) + [('all', EXAMPLE_TEXTS)]
+    for category, texts in groups:
+        texts = list(texts)
+        costs, peak = measure(texts, repeat)
+        print(f'  {category:<10}{len(texts):>6}{percentile(costs, 50):10.1f}{percentile(costs, 99):10.1f}'
+              f'{len(costs) / sum(costs) * 1e6:12.0f}{peak:10.0f}')
+    return diff
+
+
+def timeit(func: Callable, texts: Iterable[str], repeat: int = 200) -> float:
+    """对每条文本调用`func`, 返回单次调用的平均耗时(微秒)
+    """
+    texts = list(texts)
+    st = time.perf_counter()
+    for _ in range(repeat):
+        for text in texts:
+            func(text)
+    cost = time.perf_counter() - st
+    return cost / (repeat * len(texts)) * 1e6
+
+
+def bench_rule_registry(texts: List[str] = SAMPLE_TEXTS, repeat: int = 200) -> None:
+    """预编译的规则注册表 vs 每次传入正则字符串
+
+    字符串方式依赖`regex`模块内部的缓存, 这里分别测试缓存命中和缓存被清空两种情况
+    """
+    rules = list(RULES.values())
+
+    def compiled_path(text):
+        for rule in rules:
+            rule.compiled.search(text)
+
+    def inline_path(text):
+        for rule in rules:
+            re.search(rule.pattern, text)
+
+    def evicted_path(text):
+        re.purge()
+        for rule in rules:
+            re.search(rule.pattern, text)
+
+    print(f'rule registry ({len(rules)} rules, us per text)')
+    print(f'  compiled        : {timeit(compiled_path, texts, repeat):10.2f}')
+    print(f'  inline (cached) : {timeit(inline_path, texts, repeat):10.2f}')
+    print(f'  inline (evicted): {timeit(evicted_path, texts, max(repeat // 20, 1)):10.2f}')
+    print(f'  cdt()           : {timeit(cdt, texts, repeat // 4):10.2f}')
+
+
+def bench_batch(texts: List[str] = SAMPLE_TEXTS, size: int = 5000) -> None:
+    """`cdt_batch` vs 逐条调用`cdt`的吞吐量
+    """
+    batch = [texts[i % len(texts)] for i in range(size)]
+
+    st = time.perf_counter()
+    for text in batch:
+        cdt(text)
+    scalar_cost = time.perf_counter() - st
+
+    st = time.perf_counter()
+    cdt_batch(batch)
+    batch_cost = time.perf_counter() - st
+
+    print(f'batch ({size} texts, texts per second)')
+    print(f'  cdt() loop : {size / scalar_cost:10.0f}')
+    print(f'  cdt_batch(): {size / batch_cost:10.0f}')
+
+
+def bench_cache(texts: List[str] = SAMPLE_TEXTS, repeat: int = 200) -> None:
+    """开启结果缓存前后`cdt`的耗时
+    """
+    no_cache = timeit(cdt, texts, repeat)
+    cdt_module.enable_cache(maxsize=1024)
+    try:
+        with_cache = timeit(cdt, texts, repeat)
+        info = cdt_module.cache_info()
+    finally:
+        cdt_module.disable_cache()
+    print('result cache (us per text)')
+    print(f'  disabled: {no_cache:10.2f}')
+    print(f'  enabled : {with_cache:10.2f}  {info}')
+
+
+def bench_number_translator(repeat: int = 20) -> None:
+    """单次扫描的`number_translator` vs 旧的多次正则替换, 以及备忘表命中 vs 直接扫描
+    """
+    samples = number_samples(size=2000)
+    fragments = ['三', '十五', '二零二零', '九十', '2', '一九']
+    # 第二遍全部走备忘表, 结果同样要一致
+    diff = check_number_translator(samples) + check_number_translator(samples)
+    print(f'number_translator ({len(samples)} samples, {diff} differ from legacy, us per call)')
+    print(f'  memo (fragments)       : {timeit(number_translator, fragments, repeat * 50):10.2f}')
+    print(f'  single scan (fragments): {timeit(cdt_module.number_scan, fragments, repeat * 50):10.2f}')
+    print(f'  legacy (fragments)     : {timeit(legacy_number_translator, fragments, repeat * 50):10.2f}')
+    print(f'  single scan (numbers)  : {timeit(number_translator, samples, repeat):10.2f}')
+    print(f'  legacy (numbers)       : {timeit(legacy_number_translator, samples, repeat):10.2f}')
+    # 随机样本会把备忘表冲掉, 命中率按例子统计
+    cdt_module.NUMBER_MEMO.clear()
+    for text in EXAMPLE_TEXTS:
+        cdt(text, REFERENCE_DATE)
+    info = cdt_module.number_memo_info()
+    print(f'  memo on examples: {info.currsize}/{info.maxsize} entries, hit rate {info.hit_rate:.1%}')
+
+
+def legacy_month_end(year: int, month: int) -> str:
+    """旧的月末: 先按31号拼出来, 再由`date_correct`逐级回退到合法日期
+    """
+    for day in (31, 30, 29, 28):
+        try:
+            return date(year, month, day).isoformat()
+        except ValueError:
+            continue
+
+
+def bench_calendar(repeat: int = 200) -> None:
+    """预先算好的`CalendarTable` vs 旧的试错回退
+    """
+    calendar = cdt_module.CALENDAR
+    months = [(year, month) for year in range(1990, 2030) for month in range(1, 13)]
+    diff = sum(calendar.month_end(year, month).isoformat() != legacy_month_end(year, month)
+               for year, month in months)
+    print(f'calendar ({len(months)} months, {diff} differ from legacy, us per call)')
+    print(f'  month_end (table) : {timeit(lambda ym: calendar.month_end(*ym), months, repeat):10.2f}')
+    print(f'  month_end (legacy): {timeit(lambda ym: legacy_month_end(*ym), months, repeat):10.2f}')
+    print(f'  quarter_bounds    : {timeit(lambda ym: calendar.quarter_bounds(ym[0], (ym[1] - 1) // 3 + 1), months, repeat):10.2f}')
+
+
+def bench_keywords(scales: Iterable[int] = (1, 10, 100), repeat: int = 100) -> None:
+    """前处理的词语改写: 一次`sub`的`rewrite_words` vs 纯Python的Aho-Corasick扫描(只找出关键词, 不含替换)
+
+    正则和`str.replace`/`in`都在C中完成, 在各种长度下都比逐字符的自动机快
+    """
+    words = (list(cdt_module.WORD_REWRITE) + ['现在', '到']
+             + list(cdt_module.YEAR_WORD) + list(cdt_module.SPECIAL_DAY))
+    automaton = KeywordAutomaton(words)
+    print('keywords (us per text)')
+    print(f'  {"scale":>8}{"rewrite":>12}{"automaton":>12}')
+    for scale in scales:
+        texts = [text * scale for text in SAMPLE_TEXTS + NON_DATE_TEXTS]
+        print(f'  {scale:>8}{timeit(cdt_module.rewrite_words, texts, repeat):12.2f}'
+              f'{timeit(automaton.findall, texts, repeat):12.2f}')
+
+
+def bench_preprocess(repeat: int = 500) -> None:
+    """按步骤跳过的`text_preprocess` vs 每一步都重新扫描的旧实现
+    """
+    diff = check_preprocess()
+    texts = list(PREPROCESS_GOLDEN) + SAMPLE_TEXTS + NON_DATE_TEXTS
+    print(f'text_preprocess ({len(texts)} texts, {diff} differ, us per text)')
+    print(f'  steps : {timeit(cdt_module.text_preprocess, texts, repeat):10.2f}')
+    print(f'  legacy: {timeit(legacy_text_preprocess, texts, repeat):10.2f}')
+
+
+def bench_segment(lengths: Iterable[int] = (10, 50, 100, 500, 1000, 2000), repeat: int = 10) -> None:
+    """`segment`与旧的切分正则在不同输入长度下的耗时
+
+    `sentence`为重复的普通句子, `numeral`为一长串数字后跟`天`, 后者会让旧正则大量回溯
+    """
+    unit = '张飞和关羽2018年第二季度4月上周三十号前后的饭量'
+    print('segment (us per call)')
+    print(f'  {"length":>8}{"sentence":>12}{"regex":>12}{"numeral":>12}{"regex":>12}')
+    for length in lengths:
+        row = f'  {length:>8}'
+        for text in ((unit * (length // len(unit) + 1))[:length], '一' * (length - 1) + '天'):
+            assert segment(text) == LEGACY_TOTAL_RULE.search(text).groups()
+            row += f'{timeit(segment, [text], repeat):12.2f}'
+            row += f'{timeit(lambda t: LEGACY_TOTAL_RULE.search(t).groups(), [text], repeat):12.2f}'
+        print(row)
+
+
+NON_DATE_TEXTS = [
+    '张飞和关羽的饭量',
+    '这款手机的价格是多少',
+    '帮我查一下订单物流',
+    '如何退货退款',
+]
+
+
+def bench_dispatch(repeat: int = 500) -> None:
+    """预过滤: 非日期文本的耗时, 以及各条路径的计数
+    """
+    cdt_module.reset_dispatch_info()
+    non_date = timeit(cdt, NON_DATE_TEXTS, repeat)
+    date = timeit(cdt, SAMPLE_TEXTS, repeat // 10)
+    print('dispatch (us per text)')
+    print(f'  non-date: {non_date:10.2f}')
+    print(f'  date    : {date:10.2f}')
+    print(f'  {cdt_module.dispatch_info()}')
+    cdt_module.reset_dispatch_info()
+
+
+MALFORMED_TEXTS = ['0号', '99月', '2月30号前', '13月5日']
+
+
+def bench_errors(repeat: int = 500) -> None:
+    """出错路径的耗时: 只计数 vs 登记了回调
+    """
+    cdt_module.reset_error_info()
+    silent = timeit(cdt, MALFORMED_TEXTS, repeat)
+    calls = []
+    cdt_module.set_error_hook(lambda where, text, exc: calls.append(where))
+    try:
+        hooked = timeit(cdt, MALFORMED_TEXTS, repeat)
+    finally:
+        cdt_module.set_error_hook(None)
+    print('errors (us per text)')
+    print(f'  counter only: {silent:10.2f}')
+    print(f'  with hook   : {hooked:10.2f}  {len(calls)} hook calls')
+    print(f'  {cdt_module.error_info()}')
+    cdt_module.reset_error_info()
+
+
+def bench_iter_dates(size: int = 2000) -> None:
+    """`iter_dates`流式抽取 vs 先按标点切句再逐句调用`cdt`
+    """
+    doc = '，'.join(SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(size))
+
+    st = time.perf_counter()
+    found = sum(1 for _ in iter_dates(doc))
+    stream_cost = time.perf_counter() - st
+
+    st = time.perf_counter()
+    split = sum(1 for sentence in re.split(r'[，。,.!?！？]', doc) if cdt(sentence))
+    split_cost = time.perf_counter() - st
+
+    print(f'iter_dates ({len(doc)} chars, chars per second)')
+    print(f'  iter_dates()  : {len(doc) / stream_cost:10.0f}  {found} matches')
+    print(f'  split + cdt() : {len(doc) / split_cost:10.0f}  {split} matches')
+
+
+def bench_parallel(workers: Iterable[int] = (1, 2, 4, 8), size: int = 20000, chunksize: int = 256) -> None:
+    """`cdt_parallel`在不同进程数下的吞吐量, 含进程池的启动开销
+    """
+    texts = [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(size)]
+    print(f'parallel ({size} texts, chunksize {chunksize}, {os.cpu_count()} cpus, texts per second)')
+    for n in workers:
+        st = time.perf_counter()
+        for _ in cdt_parallel(texts, workers=n, chunksize=chunksize, reference_date='2021-07-14'):
+            pass
+        cost = time.perf_counter() - st
+        print(f'  workers={n}: {size / cost:10.0f}')
+
+
+def bench_async(size: int = 5000) -> None:
+    """`acdt`: 并发请求合并提交 vs 每条请求一次`run_in_executor`
+    """
+    import asyncio
+
+    texts = [random.choice(SAMPLE_TEXTS) for _ in range(size)]
+
+    async def batched():
+        return await asyncio.gather(*(cdt_module.acdt(text, reference_date='2021-07-14') for text in texts))
+
+    async def unbatched():
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(None, cdt, text, '2021-07-14') for text in texts))
+
+    async def many():
+        return await cdt_module.acdt_many(texts, reference_date='2021-07-14')
+
+    print(f'async ({size} texts, texts/s)')
+    for name, func in (('acdt (batched)', batched), ('run_in_executor', unbatched), ('acdt_many', many)):
+        st = time.perf_counter()
+        asyncio.run(func())
+        print(f'  {name:<16}: {size / (time.perf_counter() - st):12.0f}')
+
+
+# 回溯严重或者很长的输入
+PATHOLOGICAL_TEXTS = [
+    '3月5日到' + '3' * 20000,
+    '和'.join(['张三3月5日'] * 5000),
+    ('十' * 50 + '年') * 400,
+    '号到' * 5000,
+    # 只有时间预算能限制的: 回溯发生在各个粒度的规则链中, 不在前处理
+    '1' * 20000 + '月',
+    '年' * 5000 + '1' * 5000 + '号',
+]
+
+
+def bench_budget(timeout: float = 0.05) -> None:
+    """`set_budget`: 病态输入在不限制, 只限制长度, 以及限制时间时的耗时(ms)
+    """
+    print('budget (ms per text)')
+    print(f'  {"length":>8}{"no budget":>12}{"max_length":>12}{"timeout":>12}')
+    for text in PATHOLOGICAL_TEXTS:
+        costs = []
+        for max_length, budget in ((None, None), (1024, None), (None, timeout)):
+            cdt_module.set_budget(max_length=max_length, timeout=budget)
+            st = time.perf_counter()
+            cdt(text)
+            costs.append((time.perf_counter() - st) * 1000)
+        print(f'  {len(text):>8}' + ''.join(f'{cost:12.1f}' for cost in costs))
+    cdt_module.set_budget()
+
+
+def bench_profile(top: int = 10, repeat: int = 200) -> None:
+    """埋点关闭和开启时`CORPUS`的耗时, 以及开启时耗时最多的规则和各个阶段的耗时
+    """
+    print(f'profiling ({len(EXAMPLE_TEXTS)} texts, us per call)')
+    print(f'  disabled: {timeit(cdt, EXAMPLE_TEXTS, repeat):10.2f}')
+    cdt_module.reset_profile_info()
+    cdt_module.enable_profiling()
+    try:
+        print(f'  enabled : {timeit(cdt, EXAMPLE_TEXTS, repeat):10.2f}')
+    finally:
+        cdt_module.disable_profiling()
+    print(f'  disabled: {timeit(cdt, EXAMPLE_TEXTS, repeat):10.2f}')
+    info = cdt_module.profile_info()
+    calls = repeat * len(EXAMPLE_TEXTS)
+    print(f'  {"stage":<24}{"calls":>10}{"us/text":>10}')
+    for stage, stats in info.stages.items():
+        print(f'  {stage:<24}{stats.calls:>10}{stats.seconds / calls * 1e6:10.2f}')
+    print(f'  {"rule":<24}{"attempts":>10}{"hit %":>10}{"us/text":>10}')
+    for name, stats in list(info.rules.items())[:top]:
+        print(f'  {name:<24}{stats.attempts:>10}{stats.hits / stats.attempts * 100:10.1f}'
+              f'{stats.seconds / calls * 1e6:10.2f}')
+
+
+# 落在可以重新排序的规则上的说法
+REORDER_TEXTS = ['前三个月', '上个月', '前五天', '近两个月', '过去3个月', '最近7天', '前两天', '最近三年']
+
+
+def bench_reorder(texts: List[str] = REORDER_TEXTS, repeat: int = 500) -> None:
+    """登记时的规则顺序 vs 按命中次数重新排序后的顺序, 重新排序后`CORPUS`的结果不变
+    """
+    cdt_module.reset_profile_info()
+    cdt_module.enable_profiling()
+    try:
+        for text in texts:
+            cdt(text)
+    finally:
+        cdt_module.disable_profiling()
+    default = timeit(cdt, texts, repeat)
+    cdt_module.reorder_rules()
+    try:
+        diff = check_corpus()
+        reordered = timeit(cdt, texts, repeat)
+    finally:
+        cdt_module.reset_rule_order()
+    print(f'rule order ({len(texts)} texts, {diff} corpus results differ after reordering, us per call)')
+    print(f'  default  : {default:10.2f}')
+    print(f'  reordered: {reordered:10.2f}')
+
+
+# 各个粒度函数收到的分段, 以及不匹配任何规则的分段
+CHAIN_TEXTS = {
+    'year': ['2019年', '去年', '最近三年', '19年上半年', '三年前'],
+    'season': ['第一季度', '上个季度', '春季'],
+    'month': ['4月', '上个月', '最近三个月', '这个月', '3个月前', '4月前'],
+    'week': ['上周三', '周五', '三周前', '最近两周'],
+    'day': ['十五号', '昨天', '5天前', '前5天', '3号前'],
+}
+CHAIN_MISSES = ['个月', '周周末', '年年', '号号']
+
+
+def bench_chains(repeat: int = 2000) -> None:
+    """规则链: 合并后的正则按`lastgroup`分派 vs 逐条搜索
+    """
+    ctx = cdt_module.get_date_context(REFERENCE_DATE)
+    print('rule chains (us per call)')
+    print(f'  {"chain":<8}{"hit seq":>10}{"merged":>10}{"miss seq":>10}{"merged":>10}')
+    for granularity, texts in CHAIN_TEXTS.items():
+        chain = cdt_module.CHAINS[granularity]
+        costs = []
+        for sample in (texts, CHAIN_MISSES):
+            for merged in (False, True):
+                chain.merged = merged
+                costs.append(timeit(lambda text: chain.run(text, ctx), sample, repeat))
+        chain.merged = True
+        print(f'  {granularity:<8}' + ''.join(f'{cost:10.2f}' for cost in costs))
+
+
+def show_examples(texts: Iterable[str] = EXAMPLE_TEXTS) -> None:
+    """打印例子的转换结果, 用于人工检查
+    """
+    for text in texts:
+        print(f'{text}: {cdt(text)}')
+
+
+def import_time(code: str = 'import chinses_date_translator') -> int:
+    """在新进程中用`python -X importtime`测量导入耗时, 返回模块的累计导入耗时(微秒)
+    """
+    env = dict(os.environ)
+    # 需要写入字节码缓存, 否则测到的主要是源码编译的耗时
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    cwd = os.path.dirname(os.path.abspath(cdt_module.__file__))
+    cmd = [sys.executable, '-X', 'importtime', '-c', code]
+    subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, check=True)
+    stderr = subprocess.run(cmd, cwd=cwd, env=env, capture_output=True, check=True, text=True).stderr
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == 'chinses_date_translator':
+            return int(fields[1])
+    raise RuntimeError(f'no importtime record in: {stderr}')
+
+
+def first_call_time(code: str) -> float:
+    """在新进程中测量导入之后执行`code`的耗时(毫秒)
+    """
+    script = ('import time, chinses_date_translator as m; st = time.perf_counter(); '
+              f'{code}; print((time.perf_counter() - st) * 1000)')
+    cwd = os.path.dirname(os.path.abspath(cdt_module.__file__))
+    res = subprocess.run([sys.executable, '-c', script], cwd=cwd, capture_output=True, check=True, text=True)
+    return float(res.stdout.split()[-1])
+
+
+def bench_import() -> None:
+    """冷启动: 导入耗时, 以及导入后第一次转换和`warmup`的耗时
+    """
+    print('cold start')
+    print(f'  {"import (-X importtime)":<22}: {import_time() / 1000:10.2f} ms')
+    cases = [
+        ('warmup()', 'm.warmup()'),
+        ('first cdt()', "m.cdt('去年下半年')"),
+        ('warmup() + cdt()', "m.warmup(); m.cdt('去年下半年')"),
+    ]
+    for name, code in cases:
+        print(f'  {name:<22}: {first_call_time(code):10.2f} ms')
+
+
+def bench_frame(rows: int = 200000) -> None:
+    """`cdt_frame` vs `Series.apply(cdt)`, 行数很多而不同取值很少
+    """
+    try:
+        import pandas as pd
+    except ImportError:
+        print('frame: pandas is not installed, skipped')
+        return
+    series = pd.Series([SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(rows)])
+
+    st = time.perf_counter()
+    series.apply(cdt_module.cdt)
+    apply_cost = time.perf_counter() - st
+
+    st = time.perf_counter()
+    cdt_module.cdt_frame(series)
+    frame_cost = time.perf_counter() - st
+
+    print(f'frame ({rows} rows, {series.nunique()} unique, rows per second)')
+    print(f'  apply(cdt)  : {rows / apply_cost:12.0f}')
+    print(f'  cdt_frame() : {rows / frame_cost:12.0f}')
+
+
+if __name__ == '__main__':
+    # 结果不对时性能数字没有意义
+    if check_number_translator():
+        print('number_translator differs from legacy')
+        sys.exit(1)
+    if check_preprocess():
+        print('text_preprocess differs from golden output')
+        sys.exit(1)
+    if bench_corpus():
+        sys.exit(1)
+    bench_import()
+    bench_rule_registry()
+    bench_number_translator()
+    bench_calendar()
+    bench_keywords()
+    bench_preprocess()
+    bench_segment()
+    bench_batch()
+    bench_cache()
+    bench_dispatch()
+    bench_profile()
+    bench_reorder()
+    bench_chains()
+    bench_errors()
+    bench_budget()
+    bench_iter_dates()
+    bench_parallel()
+    bench_async()
+    bench_frame()
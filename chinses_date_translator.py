@@ -1,14 +1,537 @@
 # -*- encoding: utf-8 -*-
 
-import traceback
-from typing import List, Tuple, Optional
+import os
+import sys
+import time
+import itertools
+import datetime
+import threading
+import weakref
+from collections import Counter, OrderedDict, deque
+from functools import cached_property, wraps
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, NamedTuple, Tuple, TextIO, Optional, Union
 
-import arrow
-import regex as re
-from loguru import logger
+# regex在第一次编译规则时导入, arrow只在解析非标准格式的参考时间时导入, 进程池和命令行的
+# 依赖也在用到时才导入, 保证`import chinses_date_translator`足够快
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Executor
+
+    import arrow
+    import regex as re
 
 OP = {'>=', '<=', '='}
-SMALL_MONTH = ['04', '06', '09', '11']
+
+ReferenceDate = Union['arrow.Arrow', datetime.datetime, datetime.date, str, None]
+
+NUMBER_WORD = {
+    "零": 0,
+    "0": 0,
+    "一": 1,
+    "1": 1,
+    "二": 2,
+    "两": 2,
+    "2": 2,
+    "三": 3,
+    "3": 3,
+    "四": 4,
+    "4": 4,
+    "五": 5,
+    "5": 5,
+    "六": 6,
+    "6": 6,
+    "七": 7,
+    "7": 7,
+    "八": 8,
+    "8": 8,
+    "九": 9,
+    "9": 9,
+}
+NUMBER_UNIT = {'十': 10, '百': 100, '千': 1000, '万': 10 ** 4, '亿': 10 ** 8}
+NUMBER_CHAR = frozenset(NUMBER_WORD) | frozenset(NUMBER_UNIT)
+# 没有单位的数字逐字转换, 如`一六零` -> `160`, `零八` -> `08`
+DIGIT_TABLE = str.maketrans('零一二两三四五六七八九', '01223456789')
+
+# 能触发日期规则的字符, 包括前处理会转成`周`的`星期`, `礼拜`, 以及`最近`, `现在`.
+# 不含这些字符的文本不可能转换出结果, 直接返回[]
+TRIGGER_CHAR = frozenset('年季月周号日天期拜最现')
+
+# 分派的计数: `rejected`为预过滤直接返回的次数, `translated`为完整处理的次数,
+# 其余为各个粒度的函数被调用的次数
+DISPATCH_STATS = Counter()
+
+# 出错的计数, 键为出错的函数名. 出错时只计数并调用`set_error_hook`登记的回调, 不打印
+ERROR_STATS = Counter()
+ErrorHook = Callable[[str, str, Exception], None]
+_ERROR_HOOK: Optional[ErrorHook] = None
+
+
+class Rule(object):
+    """登记的规则, 正则在第一次用到时才编译
+
+    Attributes:
+        name (str): 规则名, 全局唯一
+        granularity (str): 规则所属的粒度, 如`year`, `month`, `preprocess`
+        pattern (str): 原始的正则字符串
+        compiled (re.Pattern): 编译后的正则
+    """
+
+    def __init__(self, name: str, granularity: str, pattern: str):
+        self.name = name
+        self.granularity = granularity
+        self.pattern = pattern
+
+    # 编译后存入实例的__dict__, 之后的访问就是普通的属性查找
+    @cached_property
+    def compiled(self) -> 're.Pattern':
+        import regex as re
+        return re.compile(self.pattern)
+
+    def __repr__(self) -> str:
+        return f'Rule(name={self.name!r}, granularity={self.granularity!r}, pattern={self.pattern!r})'
+
+
+# 规则注册表, 各个函数按规则名查找. 正则在第一次用到时编译, 或者由`warmup`一次性编译
+RULES: Dict[str, Rule] = {}
+
+
+def register_rule(name: str, granularity: str, pattern: str) -> Rule:
+    """登记一条规则
+
+    Args:
+        name (str): 规则名
+        granularity (str): 规则所属的粒度
+        pattern (str): 正则字符串
+
+    Returns:
+        Rule: 登记后的规则
+    """
+    assert name not in RULES, f'规则名重复: {name}'
+    rule = Rule(name, granularity, pattern)
+    RULES[name] = rule
+    return rule
+
+
+def set_error_hook(hook: Optional[ErrorHook]) -> None:
+    """登记出错时的回调, None表示不回调
+
+    Args:
+        hook (Optional[ErrorHook]): 回调, 参数为(出错的函数名, 输入文本, 异常)
+
+    Examples:
+        >>> set_error_hook(lambda where, text, exc: logging.warning(f'{where}: {text}', exc_info=exc))
+        >>> set_error_hook(lambda where, text, exc: traceback.print_exception(exc))  # 原先的行为
+    """
+    global _ERROR_HOOK
+    _ERROR_HOOK = hook
+
+
+def report_error(where: str, text: str, exc: Exception) -> None:
+    """记录一次出错, 由各个函数的`except`分支调用
+    """
+    ERROR_STATS[where] += 1
+    if _ERROR_HOOK is not None:
+        _ERROR_HOOK(where, text, exc)
+
+
+def error_info() -> Dict[str, int]:
+    """返回各个函数出错次数的快照
+    """
+    return dict(ERROR_STATS)
+
+
+def reset_error_info() -> None:
+    """清空出错的计数
+    """
+    ERROR_STATS.clear()
+
+
+class BudgetExceeded(list):
+    """超出预算时`cdt`的返回值, 和[]一样为假, 用`isinstance`区分
+
+    Attributes:
+        reason (str): `length`为输入超长, `timeout`为超时
+    """
+
+    def __init__(self, reason: str):
+        super().__init__()
+        self.reason = reason
+
+    def __repr__(self) -> str:
+        return f'BudgetExceeded({self.reason!r})'
+
+
+class BudgetExceededError(TimeoutError):
+    """时间预算用完, 由`remaining_budget`抛出. regex超时抛出的是TimeoutError, 两者一并处理
+    """
+
+
+class BudgetState(threading.local):
+    # 当前调用的截止时间(perf_counter), 没有预算时为None
+    deadline: Optional[float] = None
+
+
+# 输入的最大长度和每次调用的时间预算(秒), None表示不限制. 默认都不限制, 由`set_budget`开启
+_MAX_TEXT_LENGTH: Optional[int] = None
+_TIME_BUDGET: Optional[float] = None
+_BUDGET = BudgetState()
+
+
+def set_budget(max_length: Optional[int] = None, timeout: Optional[float] = None) -> None:
+    """设置每次`cdt`调用的预算, 超出时返回`BudgetExceeded`, 一条坏输入不会拖住整个进程
+
+    超时由整段文本上的前处理正则(regex的`timeout=`)和`到`/`和`的逐段切分检查.
+    `cdt_parallel`会把设置传给子进程, 自己创建的进程池以`warm_worker`和`worker_settings()`为initializer
+
+    Args:
+        max_length (Optional[int], optional): 输入的最大字符数. Defaults to None, 即不限制.
+        timeout (Optional[float], optional): 每次调用的秒数. Defaults to None, 即不限制.
+
+    Examples:
+        >>> set_budget(max_length=256, timeout=0.05)
+        >>> cdt('3月5日到' + '3' * 20000)
+        BudgetExceeded('length')
+    """
+    global _MAX_TEXT_LENGTH, _TIME_BUDGET
+    assert max_length is None or max_length > 0, f'max_length <= 0'
+    assert timeout is None or timeout > 0, f'timeout <= 0'
+    _MAX_TEXT_LENGTH = max_length
+    _TIME_BUDGET = timeout
+
+
+def remaining_budget() -> Optional[float]:
+    """当前调用剩余的秒数, 作为regex的`timeout=`. 没有时间预算时为None
+
+    Raises:
+        BudgetExceededError: 预算已经用完
+    """
+    deadline = _BUDGET.deadline
+    if deadline is None:
+        return None
+    left = deadline - time.perf_counter()
+    if left <= 0:
+        raise BudgetExceededError('time budget exceeded')
+    return left
+
+
+def warmup() -> int:
+    """提前编译全部规则, 避免第一次转换时的编译耗时, 适合在服务启动或者进程池初始化时调用
+
+    Returns:
+        int: 规则数
+    """
+    for rule in RULES.values():
+        rule.compiled
+    for chain in CHAINS.values():
+        for end in range(chain.leading + 1, len(chain.order) + 1):
+            chain.prefix(end)
+        chain.bases
+    return len(RULES)
+
+
+def rules_of(granularity: str) -> List[Rule]:
+    """按登记顺序返回某个粒度下的全部规则
+    """
+    return [rule for rule in RULES.values() if rule.granularity == granularity]
+
+
+# 规则命中后的处理, 参数为(匹配, 文本, 参考时间的锚点, 粒度函数的flag), 返回None表示继续尝试后面的规则
+RuleHandler = Callable[[Optional['re.Match'], str, 'DateContext', bool], Optional[List]]
+
+
+class ChainMatch(object):
+    """合并后的正则中一条规则的匹配, 分组的序号换算回规则自己的序号, 与单独`search`的结果相同
+    """
+    __slots__ = ('m', 'base', 'size')
+
+    def __init__(self, m: 're.Match', base: int, size: int):
+        self.m = m
+        self.base = base
+        self.size = size
+
+    def group(self, idx: int = 0) -> Optional[str]:
+        return self.m.group(self.base + idx)
+
+    def groups(self) -> Tuple[Optional[str], ...]:
+        return self.m.groups()[self.base:self.base + self.size]
+
+    def start(self, idx: int = 0) -> int:
+        return self.m.start(self.base + idx)
+
+    def end(self, idx: int = 0) -> int:
+        return self.m.end(self.base + idx)
+
+
+class RuleChain(object):
+    """一个粒度函数的规则链, 第一条给出结果的规则即为结果
+
+    规则分为若干组, 组之间的先后顺序固定. 同一组内的规则互斥(一个说法最多有一条给出结果),
+    可以由`reorder_rules`按命中次数重新排序, 只有一条规则的组位置固定. 一段文本里堆了两个相互
+    冲突的说法时(如`上个月3月后`), 重新排序后可能取到另一个.
+    规则名为None的处理函数不需要正则, 只能放在最前面, 每次都调用, 匹配为None
+
+    全部规则合并为一个按顺序排列的命名分组的正则`(?P<规则名>...)|...`, 扫描一遍就能知道最左边
+    匹配的是哪条规则, 按`lastgroup`分派. 排在前面的规则可能在更右边匹配, 所以再用排在它前面的
+    规则合并的正则搜索右边剩下的部分, 直到没有更优先的规则, 结果与逐条搜索完全相同. 不匹配的
+    文本只扫描一遍. 处理函数放弃时, 按顺序逐条尝试后面的规则. 埋点时不合并, 逐条搜索以便统计
+
+    Attributes:
+        granularity (str): 粒度
+        groups (Tuple): 登记的分组, 每组为((规则名, 处理函数), ...)
+        order (Tuple): 当前的尝试顺序, ((Rule, 处理函数), ...)
+        merged (bool): 是否使用合并后的正则
+    """
+
+    def __init__(self, granularity: str, groups: Tuple[Tuple[Tuple[Optional[str], RuleHandler], ...], ...]):
+        self.granularity = granularity
+        self.groups = groups
+        self.merged = True
+        self.reset()
+
+    def set_order(self, order: List[Tuple[Optional[str], RuleHandler]]) -> None:
+        self.order = tuple((RULES[name] if name else None, handler) for name, handler in order)
+        # 不需要正则的处理函数的个数
+        self.leading = sum(rule is None for rule, _ in self.order)
+        assert all(rule is None for rule, _ in self.order[:self.leading]), f'不需要正则的处理函数只能放在最前面'
+        self.index = {rule.name: idx for idx, (rule, _) in enumerate(self.order) if rule is not None}
+        # 顺序变了, 合并的正则需要重新编译
+        self.__dict__.pop('combined', None)
+        self.__dict__.pop('bases', None)
+        self.prefixes = {}
+
+    def reset(self) -> None:
+        """恢复登记时的顺序
+        """
+        self.set_order([item for group in self.groups for item in group])
+
+    def reorder(self, hits: Dict[str, int]) -> None:
+        """组内按命中次数从多到少排序, 次数相同的保持登记时的顺序
+        """
+        order = []
+        for group in self.groups:
+            if len(group) > 1:
+                group = sorted(group, key=lambda item: -hits.get(item[0], 0))
+            order.extend(group)
+        self.set_order(order)
+
+    def names(self) -> List[Optional[str]]:
+        """当前的尝试顺序
+        """
+        return [rule.name if rule else None for rule, _ in self.order]
+
+    @cached_property
+    def bases(self) -> Dict[str, Tuple[int, int]]:
+        """每条规则在合并后的正则中的分组序号和分组数, 各个前缀合并的正则中都相同
+        """
+        bases = {}
+        base = 1
+        for rule, _ in self.order[self.leading:]:
+            size = rule.compiled.groups
+            bases[rule.name] = (base, size)
+            base += size + 1
+        return bases
+
+    @cached_property
+    def combined(self) -> 're.Pattern':
+        return self.prefix(len(self.order))
+
+    def prefix(self, end: int) -> 're.Pattern':
+        """第`end`条之前的规则合并的正则
+        """
+        pattern = self.prefixes.get(end)
+        if pattern is None:
+            import regex as re
+            pattern = re.compile('|'.join(f'(?P<{rule.name}>{rule.pattern})'
+                                          for rule, _ in self.order[self.leading:end]))
+            self.prefixes[end] = pattern
+        return pattern
+
+    def run(self, text: str, ctx: 'DateContext', flag: bool = False) -> List:
+        order = self.order
+        for idx in range(self.leading):
+            res = order[idx][1](None, text, ctx, flag)
+            if res is not None:
+                return res
+        if not self.merged:
+            return self.run_from(self.leading, text, ctx, flag)
+
+        m = self.combined.search(text, timeout=remaining_budget())
+        if m is None:
+            return []
+        idx, pos = self.index[m.lastgroup], m.start()
+        # 左边和同一位置都没有更优先的规则, 只需要在右边找
+        while idx > self.leading:
+            prior = self.prefix(idx).search(text, pos + 1, timeout=remaining_budget())
+            if prior is None:
+                break
+            m = prior
+            idx, pos = self.index[m.lastgroup], m.start()
+        rule, handler = order[idx]
+        res = handler(ChainMatch(m, *self.bases[rule.name]), text, ctx, flag)
+        if res is not None:
+            return res
+        return self.run_from(idx + 1, text, ctx, flag)
+
+    def run_from(self, start: int, text: str, ctx: 'DateContext', flag: bool) -> List:
+        """从第`start`条规则开始逐条搜索
+        """
+        for rule, handler in self.order[start:]:
+            m = rule.compiled.search(text, timeout=remaining_budget())
+            if m is None:
+                continue
+            res = handler(m, text, ctx, flag)
+            if res is not None:
+                return res
+        return []
+
+
+# 各个粒度的规则链, 由`register_chain`登记
+CHAINS: Dict[str, RuleChain] = {}
+
+
+def register_chain(granularity: str, *groups: Tuple[Tuple[Optional[str], RuleHandler], ...]) -> RuleChain:
+    """登记一个粒度的规则链
+
+    Args:
+        granularity (str): 粒度
+        groups (Tuple[Tuple[Optional[str], RuleHandler], ...]): 按先后顺序的分组,
+                         每组为((规则名, 处理函数), ...), 组内的规则必须互斥
+
+    Returns:
+        RuleChain: 登记后的规则链
+    """
+    assert granularity not in CHAINS, f'规则链重复: {granularity}'
+    chain = RuleChain(granularity, groups)
+    CHAINS[granularity] = chain
+    return chain
+
+
+def reorder_rules(profile: Optional[Dict[str, int]] = None) -> Dict[str, List[Optional[str]]]:
+    """按命中次数调整各个规则链中可以重排的组, 常见的说法一两次搜索就能找到
+
+    `周`的规则链整体固定, 见规则注册表的说明
+
+    Args:
+        profile (Optional[Dict[str, int]], optional): 规则名 -> 命中次数, 如`load_rule_profile`
+                                    读入的统计. Defaults to None, 即`enable_profiling`记录的命中次数.
+
+    Returns:
+        Dict[str, List[Optional[str]]]: 各个规则链新的顺序
+    """
+    hits = RULE_HITS if profile is None else profile
+    for chain in CHAINS.values():
+        chain.reorder(hits)
+    return rule_order()
+
+
+def reset_rule_order() -> None:
+    """恢复全部规则链登记时的顺序
+    """
+    for chain in CHAINS.values():
+        chain.reset()
+
+
+def rule_order() -> Dict[str, List[Optional[str]]]:
+    """各个规则链当前的尝试顺序
+    """
+    return {granularity: chain.names() for granularity, chain in CHAINS.items()}
+
+
+def save_rule_profile(path: str) -> Dict[str, int]:
+    """把`enable_profiling`记录的命中次数保存为json, 供`load_rule_profile`使用
+
+    Returns:
+        Dict[str, int]: 保存的命中次数
+    """
+    import json
+
+    profile = dict(RULE_HITS)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    return profile
+
+
+def load_rule_profile(path: str) -> Dict[str, List[Optional[str]]]:
+    """读入`save_rule_profile`保存的命中次数, 并按其调整规则链的顺序
+
+    `cdt_parallel`会把调整后的顺序传给子进程, 自己创建的进程池以`warm_worker`和`worker_settings()`为initializer
+
+    Returns:
+        Dict[str, List[Optional[str]]]: 各个规则链新的顺序
+    """
+    import json
+
+    with open(path, encoding='utf-8') as f:
+        return reorder_rules(json.load(f))
+
+
+# ---------------------------------- 年 ----------------------------------- #
+register_rule('year_before', 'year', r'([0-9半一二两三四五六七八九十]+年)(前)')
+register_rule('year_after', 'year', r'([0-9半一二两三四五六七八九十]+年)(后)')
+register_rule('recent_year', 'year', r'(最近|近|过去)([0-9半一二两三四五六七八九十]+年)')
+register_rule('before_year', 'year', r'(前)([0-9一二两三四五六七八九十]+年)')
+register_rule('specific_year', 'year', r"([0-9零一二两三四五六七八九十]{2,4})(年)")
+register_rule('half_year', 'year', r"([前|去|昨|今|明|后]年)*([上|下|前|后])*(半年)")
+register_rule('special_year', 'year', r"([前|去|昨|今|明|后]+)(年)")
+
+# ---------------------------------- 季 ----------------------------------- #
+register_rule('poem_season', 'season', r'[春夏秋冬]+[季天]+')
+register_rule('common_num_season', 'season', r'([0-9零一二两三四五六七八九十]+)(季|个季)')
+register_rule('this_season', 'season', r'(本|这|这一|这1|当)+个*季')
+register_rule('last_season', 'season', r'(上|上个)+个*季')
+register_rule('year_flag_season', 'season', r'(偂)([1-4一二两三四])+(季|个季)')
+register_rule('recent_season', 'season', r'(最近|近|前|上|过去)+([0-9零一二两三四五六七八九十]*)(季|个季)')
+
+# ---------------------------------- 月 ----------------------------------- #
+register_rule('this_month', 'month', r'[本|这|当]+[1|一]*个*月')
+register_rule('recent_month_num', 'month', r'(最近|近)([0-9一二两三四五六七八九十]+)(月|个月)')
+register_rule('before_month_num', 'month', r'(过去|前|上)([0-9一二两三四五六七八九十]*)(月|个月)')
+register_rule('several_month_before', 'month', r'([0-9一二两三四五六七八九十]+)(个月)(前)')
+register_rule('several_month_after', 'month', r'([0-9一二两三四五六七八九十]+)(个月)(后)')
+register_rule('specific_month_before', 'month', r'([0-9一二两三四五六七八九十]{1,2})(月|月份)(前)')
+register_rule('specific_month_after', 'month', r'([0-9一二两三四五六七八九十]{1,2})(月|月份)(后)')
+register_rule('year_flag_month', 'month', r'(偂)([0-9一二两三四五六七八九十]+)(月|个月)')
+register_rule('specific_month_num', 'month', r'([0-9一二两三四五六七八九十]+)(月)')
+
+# ---------------------------------- 周 ----------------------------------- #
+#! 前后顺序有关系, 匹配范围更大, 更一般的放后面. `周`的规则链整体固定, 不参与重新排序
+register_rule('recent_week', 'week', r'(最近|近)([0-9一二两三四五六七八九十]+)(周)')
+register_rule('before_week', 'week', r'(过去|前)([0-9一二两三四五六七八九十]+)(周)')
+register_rule('week_before', 'week', r'([0-9一二两三四五六七八九十]+)(周前)')
+register_rule('week_after', 'week', r'([0-9一二两三四五六七八九十]+)(周后)')
+register_rule('recent_weekday', 'week', r'(上|上个|上一)+(周)+([1-7一二三四五六七])*')
+register_rule('this_weekday', 'week', r'(这|这个|本)*(周)+([1-7一二三四五六七])*')
+
+# ---------------------------------- 日 ----------------------------------- #
+register_rule('month_flag_day', 'day', r'(偂)([0-9一二两三四五六七八九十]+)(天|日)')
+register_rule('recent_day_num', 'day', r'(最近|近|前|这|过去)([0-9一二两三四五六七八九十]+)(天|日)')  # `+`放里面才能匹配'九十'天
+register_rule('several_day_before', 'day', r'([0-9一二两三四五六七八九十]+)(天)(前)')
+register_rule('several_day_after', 'day', r'([0-9一二两三四五六七八九十]+)(天)(后)')
+register_rule('specific_day_before', 'day', r'([0-9一二两三四五六七八九十]+)(号|日)(前)')
+register_rule('specific_day_after', 'day', r'([0-9一二两三四五六七八九十]+)(号|日)(后)')
+register_rule('specific_day_num', 'day', r'([0-9一二两三四五六七八九十]+)(号|日)')
+
+# --------------------------------- 前处理 --------------------------------- #
+register_rule('year_in', 'preprocess', r'([0-9半一二两三四五六七八九十]+)(年)(内)')
+register_rule('season_in', 'preprocess', r'([0-9一二两三四五六七八九十]+)(个季节|个季度)(内)')
+register_rule('month_in', 'preprocess', r'([0-9一二两三四五六七八九十]+)(个月)(内)')
+register_rule('week_in', 'preprocess', r'([0-9一二两三四五六七八九十]+)(周|个周)(内)')
+register_rule('day_in', 'preprocess', r'([0-9一二两三四五六七八九十]+)(天|日)(内)')
+register_rule('year_before_mark', 'preprocess', r'[0-9一二两三四五六七八九十]+(个季|季|月|个月)')
+register_rule('month_before_mark', 'preprocess', r'[0-9一二两三四五六七八九十]+(天|日)')
+register_rule('com_year', 'preprocess', r'([0-9零一二两三四五六七八九十]+)(到|和)+(\S+年)')
+register_rule('com_season', 'preprocess', r'([1-4一二三四]+)(到|和)+(\S+季)')
+register_rule('com_month', 'preprocess', r'([0-9零一二两三四五六七八九十]+)(到|和)+(\S+月)')
+register_rule('com_day', 'preprocess', r'([0-9零一二两三四五六七八九十]+)(到|和)+(\S+[日号天])')
+register_rule('com_year_season', 'preprocess', r'([0-9去今明零一二两三四五六七八九十]+年)(第*[1-4一二三四春夏秋冬]+个*)(季节|季度|季)(到|和)(第*[1-4一二三四春夏秋冬]+个*)(季节|季度|季)')
+register_rule('com_year_month', 'preprocess', r'([0-9去今明零一二两三四五六七八九十]+年)(第*[0-9一二两三四五六七八九十]+)(月|个月|月份)(到|和)+(第*[0-9一二两三四五六七八九十]+)(月|个月|月份)')
+register_rule('com_year_month_day', 'preprocess', r'([0-9去今明零一二两三四五六七八九十]+年)*([0-9一二两三四五六七八九十]+月)([0-9一二两三四五六七八九十]+[号|日])(到|和)([0-9零一二两三四五六七八九十]+年)*([0-9一二两三四五六七八九十]+月)*([0-9一二两三四五六七八九十]+[号|日])')
+register_rule('com_week', 'preprocess', r'(上周|下周)([1-7一二三四五六七]+)(到)(周)([1-7一二三四五六七]+)')
+
+# --------------------------------- 抽取 ---------------------------------- #
+# 长文本中可能构成日期说法的连续字符: 数字, 日期单位, 修饰词和`到`, `和`
+register_rule('date_span', 'extract', r'[0-9零一二两三四五六七八九十百千年季度节月份周星期礼拜号日天末'
+                                      r'最近过去前后上下个第本这当今明昨半春夏秋冬内之以到至和现在]+')
 
 
 def str2int(s: str) -> int:
@@ -32,29 +555,122 @@ def word2number(s: str) -> int:
     
     :return: 对应的整形数，如果不是数字返回-1
     """
-    return {
-        "零": 0,
-        "0": 0,
-        "一": 1,
-        "1": 1,
-        "二": 2,
-        "两": 2,
-        "2": 2,
-        "三": 3,
-        "3": 3,
-        "四": 4,
-        "4": 4,
-        "五": 5,
-        "5": 5,
-        "六": 6,
-        "6": 6,
-        "七": 7,
-        "7": 7,
-        "八": 8,
-        "8": 8,
-        "九": 9,
-        "9": 9,
-    }.get(s, -1)
+    return NUMBER_WORD.get(s, -1)
+
+
+def number_run_translator(run: str, after_week: bool = False) -> str:
+    """方法number_translator的辅助方法, 将一段连续的数字字符(含单位)转为阿拉伯数字
+
+    从左往右扫描一遍, 按`亿`, `万`, `万以下`三段累加. 支持下列不规则的说法:
+    省略叫法`六万五`, `两万零六百五`, 即单位后面只有一位数字, 且该单位前面紧挨着非零数字;
+    省略`一`的`十`, 如`十五`; 缺少系数的`百千万亿`(如`千万`)不做转换, 原样保留
+
+    :param run: 连续的数字字符
+    :param after_week: 前面是否紧挨着`周`或`星期`, 此时开头的`十`不做转换
+    :return: 转化完毕后的字符串
+    """
+    pieces = []
+    total = section = small = num = 0
+    num_len = 0
+    last_unit = 0
+    short_ok = False        # 上一个单位前紧挨着非零数字, 后面的一位数字可以按省略叫法处理
+    prev_nonzero = False    # 上一个字符是否为非零数字
+    has_number = False      # 当前是否有待输出的数字
+    for idx, ch in enumerate(run):
+        digit = NUMBER_WORD.get(ch)
+        if digit is not None:
+            num = num * 10 + digit
+            num_len += 1
+            prev_nonzero = digit != 0
+            has_number = True
+            continue
+        unit = NUMBER_UNIT[ch]
+        # 缺少系数的单位原样保留
+        if (num_len == 0 and (
+                (unit == 10 and idx == 0 and after_week)
+                or unit in (100, 1000)
+                or (unit == 10 ** 4 and small == 0)
+                or (unit == 10 ** 8 and section == 0 and small == 0))):
+            if has_number:
+                pieces.append(str(total + section + small + num))
+            pieces.append(ch)
+            total = section = small = num = 0
+            last_unit = 0
+            short_ok = prev_nonzero = has_number = False
+            continue
+        # 省略叫法: 三千五万
+        if num_len == 1 and num and short_ok and unit > last_unit:
+            num = num * last_unit // 10
+        if unit < 10 ** 4:
+            small += (num if num_len else 1) * unit
+        elif unit == 10 ** 4:
+            section += (small + num) * unit
+            small = 0
+        else:
+            total = (total + section + small + num) * unit
+            section = small = 0
+        short_ok = unit >= 100 and prev_nonzero
+        last_unit = unit
+        num = num_len = 0
+        prev_nonzero = False
+        has_number = True
+    if has_number:
+        # 省略叫法: 六万五
+        if num_len == 1 and num and short_ok:
+            num = num * last_unit // 10
+        pieces.append(str(total + section + small + num))
+    return ''.join(pieces)
+
+
+class NumberMemo(object):
+    """`number_translator`的有界备忘表, 键为较短的片段
+
+    各个规则传入的多是`三`, `十五`, `二零二零`这样的短片段, 取值范围小且重复多, 查表一次即可.
+    满了之后整个清空, 不维护LRU顺序, 命中时只有一次字典查找. 多线程下计数可能略有出入
+    """
+
+    def __init__(self, maxsize: int = 4096, max_length: int = 8):
+        assert maxsize > 0, f'maxsize <= 0'
+        self.maxsize = maxsize
+        self.max_length = max_length
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.data: Dict[str, str] = {}
+
+    def put(self, key: str, res: str) -> None:
+        data = self.data
+        if len(data) >= self.maxsize:
+            self.evictions += len(data)
+            data.clear()
+        data[key] = res
+
+    def clear(self) -> None:
+        self.data.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> 'CacheInfo':
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self.data))
+
+
+NUMBER_MEMO = NumberMemo()
+
+
+def number_memo_info() -> 'CacheInfo':
+    """`number_translator`备忘表的命中, 未命中, 淘汰次数和大小, 命中率见`hit_rate`
+    """
+    return NUMBER_MEMO.info()
+
+
+def set_number_memo(maxsize: int = 4096, max_length: int = 8) -> None:
+    """替换`number_translator`的备忘表, 原有的记录和计数一并丢弃
+
+    Args:
+        maxsize (int, optional): 最多记录的片段数. Defaults to 4096.
+        max_length (int, optional): 超过该长度的字符串不记录. Defaults to 8.
+    """
+    global NUMBER_MEMO
+    NUMBER_MEMO = NumberMemo(maxsize, max_length)
 
 
 def number_translator(target: str) -> str:
@@ -68,388 +684,632 @@ def number_translator(target: str) -> str:
     一六零加一五八可以转化为160+158
     该方法目前支持的正确转化范围是: 0 ~ 10^16 - 1
     该功能模块具有良好的复用性
+
+    不超过`NUMBER_MEMO.max_length`的片段先查备忘表, 没有再交给`number_scan`
     
     :param target: 待转化的字符串
     :return: 转化完毕后的字符串
     """
-    # logger.debug(f"before number_translator: {target}")
-    
-    # 省略叫法: 六亿五
-    pattern = re.compile(r"[一二两三四五六七八九123456789]亿[一二两三四五六七八九123456789](?!(万|千|百|十))")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("亿")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 2:
-            num += word2number(s[0]) * 10 ** 8 + word2number(s[1]) * 10 ** 7
-        target = pattern.sub(str(num), target, 1)
-    
-    # 省略叫法: 六万五
-    pattern = re.compile(r"[一二两三四五六七八九123456789]万[一二两三四五六七八九123456789](?!(千|百|十))")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("万")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 2:
-            num += word2number(s[0]) * 10000 + word2number(s[1]) * 1000
-        target = pattern.sub(str(num), target, 1)
-        
-    # 省略叫法: 六千五
-    pattern = re.compile(r"[一二两三四五六七八九123456789]千[一二两三四五六七八九123456789](?!(百|十))")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("千")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 2:
-            num += word2number(s[0]) * 1000 + word2number(s[1]) * 100
-        target = pattern.sub(str(num), target, 1)
-
-    # 省略叫法: 六百五
-    pattern = re.compile(r"[一二两三四五六七八九123456789]百[一二两三四五六七八九123456789](?!十)")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("百")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 2:
-            num += word2number(s[0]) * 100 + word2number(s[1]) * 10
-        target = pattern.sub(str(num), target, 1)
-
-
-    # 将单位前的文字先转为数字
-    pattern = re.compile(r"[零一二两三四五六七八九]")
-    match = pattern.finditer(target)
-    for m in match:
-        target = pattern.sub(str(word2number(m.group())), target, 1)
-
-    # 星期天表达式替换为星期7
-    pattern = re.compile("(?<=(周|星期))[末天日]")
-    match = pattern.finditer(target)
-    for m in match:
-        target = pattern.sub("7", target, 1)
-
-    # 转化单位`十`
-    pattern = re.compile("(?<!(周|星期))0?[0-9]?十[0-9]?")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("十")
-        num = 0
-        ten = str2int(s[0])
-        if ten == 0:
-            ten = 1
-        unit = str2int(s[1])
-        num = ten * 10 + unit
-        target = pattern.sub(str(num), target, 1)
-        
-    # 转化单位`百`
-    pattern = re.compile("0?[1-9]百[0-9]?[0-9]?")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("百")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 1:
-            hundred = int(s[0])
-            num += hundred * 100
-        elif len(s) == 2:
-            hundred = int(s[0])
-            num += hundred * 100
-            num += int(s[1])
-        target = pattern.sub(str(num), target, 1)
-        
-    # 转化单位`千`
-    pattern = re.compile("0?[1-9]千[0-9]?[0-9]?[0-9]?")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("千")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 1:
-            thousand = int(s[0])
-            num += thousand * 1000
-        elif len(s) == 2:
-            thousand = int(s[0])
-            num += thousand * 1000
-            num += int(s[1])
-        target = pattern.sub(str(num), target, 1)
-        
-    # 转化单位`万`
-    pattern = re.compile("[0-9]+万[0-9]?[0-9]?[0-9]?[0-9]?")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("万")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 1:
-            tenthousand = int(s[0])
-            num += tenthousand * 10000
-        elif len(s) == 2:
-            tenthousand = int(s[0])
-            num += tenthousand * 10000
-            num += int(s[1])
-        target = pattern.sub(str(num), target, 1)
-        
-    # 转化单位`亿`
-    pattern = re.compile("[0-9]+亿[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?[0-9]?")
-    match = pattern.finditer(target)
-    for m in match:
-        group = m.group()
-        s = group.split("亿")
-        s = list(filter(None, s))
-        num = 0
-        if len(s) == 1:
-            yi = int(s[0])
-            num += yi * 10 ** 8
-        elif len(s) == 2:
-            yi = int(s[0])
-            num += yi * 10 ** 8
-            num += int(s[1])
-        target = pattern.sub(str(num), target, 1)
-    # logger.debug(f"after number_translator: {target}")
-    return target
-
-
-def year_trans(text: str) -> List:
-    """年份的转换, 返回一个时间段, 粒度为`天` 
-    
+    memo = NUMBER_MEMO
+    res = memo.data.get(target)
+    if res is not None:
+        memo.hits += 1
+        return res
+    res = number_scan(target)
+    if len(target) <= memo.max_length:
+        memo.misses += 1
+        memo.put(target, res)
+    return res
+
+
+def number_scan(target: str) -> str:
+    """方法number_translator的辅助方法, 只从左往右扫描一遍, 连续的数字字符交给`number_run_translator`处理,
+    `周末`, `星期天`等表达式替换为`周7`, `星期7`
+
+    :param target: 待转化的字符串
+    :return: 转化完毕后的字符串
+    """
+    pieces = []
+    start = 0
+    idx = 0
+    length = len(target)
+    while idx < length:
+        ch = target[idx]
+        if ch in NUMBER_CHAR:
+            end = idx + 1
+            while end < length and target[end] in NUMBER_CHAR:
+                end += 1
+            run = target[idx:end]
+            if idx > start:
+                pieces.append(target[start:idx])
+            if any(c in NUMBER_UNIT for c in run):
+                after_week = target[idx - 1:idx] == '周' or target[idx - 2:idx] == '星期'
+                pieces.append(number_run_translator(run, after_week))
+            else:
+                pieces.append(run.translate(DIGIT_TABLE))
+            start = idx = end
+            continue
+        # 星期天表达式替换为星期7
+        if ch in '末天日' and (target[idx - 1:idx] == '周' or target[idx - 2:idx] == '星期'):
+            if idx > start:
+                pieces.append(target[start:idx])
+            pieces.append('7')
+            start = idx + 1
+        idx += 1
+    if start == 0:
+        return target
+    pieces.append(target[start:])
+    return ''.join(pieces)
+
+
+# ---------------------------------- 关键词 ---------------------------------- #
+# 前处理的词语改写, 一次`sub`完成, 同一位置取最长的词.
+# 原先依次替换时前一步的结果会参与后一步, 如`星期天` -> `周天` -> `周七`, `至期` -> `到期` -> `过期`,
+# `以之前` -> `以前` -> `前`, 这些连锁的情况单独列出
+WORD_REWRITE = {
+    '星期': '周',
+    '礼拜': '周',
+    '周日': '周七',
+    '周末': '周七',
+    '周天': '周七',
+    '星期日': '周七',
+    '星期末': '周七',
+    '星期天': '周七',
+    '礼拜日': '周七',
+    '礼拜末': '周七',
+    '礼拜天': '周七',
+    '至': '到',
+    '至期': '过期',
+    '到期': '过期',
+    '之内': '内',
+    '之前': '前',
+    '以前': '前',
+    '以之前': '前',
+    '之后': '后',
+    '以后': '后',
+    '以之后': '后',
+}
+register_rule('word_rewrite', 'preprocess', '|'.join(sorted(WORD_REWRITE, key=len, reverse=True)))
+# 推理年份的词语及其相对今年的偏移, 按判断的优先级排列
+YEAR_WORD = {
+    '今年': 0,
+    '现在': 0,
+    '去年': -1,
+    '昨年': -1,
+    '上一年': -1,
+    '前年': -2,
+    '明年': 1,
+    '后年': 2,
+}
+# 特殊的日子及其相对今天的偏移, 同时出现时以后面的为准(`大前天`中也有`前天`)
+SPECIAL_DAY = {
+    '前天': -2,
+    '大前天': -3,
+    '昨天': -1,
+    '今天': 0,
+    '明天': 1,
+    '后天': 2,
+    '大后天': 3,
+}
+SPECIAL_DAY_PRIORITY = tuple(reversed(SPECIAL_DAY))
+
+
+def rewrite_word(m: 're.Match') -> str:
+    return WORD_REWRITE[m.group()]
+
+
+def rewrite_words(text: str) -> str:
+    """前处理的词语改写, 结果和原先依次`re.sub`, `str.replace`相同
+
+    `现在`单独出现时转为`now`(即不转换), 在`到`的时间段中转为`今天`
+    """
+    text = RULES['word_rewrite'].compiled.sub(rewrite_word, text, timeout=remaining_budget())
+    if '现在' in text:
+        text = text.replace('现在', '今天' if '到' in text else 'now')
+    return text
+
+
+# ---------------------------------- 日期运算 ---------------------------------- #
+# 各个函数内部只用datetime.date做日期运算, 字符串只在输出时生成
+MONTH_DAYS = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+def is_leap_year(year: int) -> bool:
+    """闰年判断
+    """
+    return (year % 4 == 0 and year % 100 != 0) or (year % 400 == 0)
+
+
+class CalendarTable(object):
+    """预先计算的日历表: 每月的天数, 以及由此得到的月末和季度的起止
+
+    只覆盖[first_year, last_year], 范围外的年份按公式计算, 结果相同
+
+    Examples:
+        >>> CALENDAR.month_end(2024, 2)
+        datetime.date(2024, 2, 29)
+
+        >>> CALENDAR.quarter_bounds(2021, 2)
+        (datetime.date(2021, 4, 1), datetime.date(2021, 6, 30))
+    """
+
+    def __init__(self, first_year: int = 1900, last_year: int = 2100):
+        assert 1 <= first_year <= last_year <= 9999, f'年份范围不合法: {first_year}~{last_year}'
+        self.first_year = first_year
+        self.last_year = last_year
+        # 下标为(year - first_year) * 12 + month - 1
+        self.month_days = [29 if month == 2 and is_leap_year(year) else MONTH_DAYS[month]
+                           for year in range(first_year, last_year + 1) for month in range(1, 13)]
+
+    def days_in_month(self, year: int, month: int) -> int:
+        """某年某月的天数, 月份不在1~12时抛出ValueError
+        """
+        if not 1 <= month <= 12:
+            raise ValueError(f'month must be in 1..12: {month}')
+        if self.first_year <= year <= self.last_year:
+            return self.month_days[(year - self.first_year) * 12 + month - 1]
+        return 29 if month == 2 and is_leap_year(year) else MONTH_DAYS[month]
+
+    def month_end(self, year: int, month: int) -> datetime.date:
+        """某年某月的最后一天
+        """
+        return datetime.date(year, month, self.days_in_month(year, month))
+
+    def quarter_bounds(self, year: int, quarter: int) -> Tuple[datetime.date, datetime.date]:
+        """某年第n季度的第一天和最后一天
+        """
+        month = quarter * 3 - 2
+        return datetime.date(year, month, 1), self.month_end(year, month + 2)
+
+
+CALENDAR = CalendarTable()
+
+
+def set_calendar_range(first_year: int, last_year: int) -> CalendarTable:
+    """重新生成日历表, 覆盖[first_year, last_year]
+
+    Args:
+        first_year (int): 第一年
+        last_year (int): 最后一年
+
+    Returns:
+        CalendarTable: 新的日历表
+    """
+    global CALENDAR
+    CALENDAR = CalendarTable(first_year, last_year)
+    return CALENDAR
+
+
+def month_end(day: datetime.date) -> datetime.date:
+    """所在月份的最后一天
+    """
+    return CALENDAR.month_end(day.year, day.month)
+
+
+def make_date(year: int, month: int, day: int) -> datetime.date:
+    """某年某月某日, 超过该月天数的日期取月末, 如`2月30日`为`2月28日`或者`2月29日`
+    """
+    return datetime.date(year, month, min(day, CALENDAR.days_in_month(year, month)))
+
+
+class UnclampedDate(NamedTuple):
+    """日可能超过该月天数的年月日, 如`6月31日`
+
+    `n号前/后`在组合上月份之前不知道是哪个月, 先用它保存日, 由`combine_result`截断为datetime.date
+    """
+    year: int
+    month: int
+    day: int
+
+
+# 转换过程中的日期, 只在`cdt`返回时才转为字符串或结果对象
+DateLike = Union[datetime.date, UnclampedDate]
+
+
+def shift_months(day: datetime.date, months: int) -> datetime.date:
+    """往前或往后推算n个月, 目标月份没有这一天时取月末, 如`3月31日`往前推1个月为`2月28日`
+
+    年份超出1~9999时抛出ValueError
+    """
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    month += 1
+    return day.replace(year=year, month=month, day=min(day.day, CALENDAR.days_in_month(year, month)))
+
+
+def shift_days(day: datetime.date, days: int) -> datetime.date:
+    """往前或往后推算n天
+    """
+    return datetime.date.fromordinal(day.toordinal() + days)
+
+
+def format_date(day: datetime.date) -> str:
+    """'YYYY-MM-DD'
+    """
+    return '%04d-%02d-%02d' % (day.year, day.month, day.day)
+
+
+def get_reference_date(reference_date: ReferenceDate = None) -> datetime.date:
+    """得到参考日期, 所有相对的说法(`去年`, `上周`, `最近三天`等)都以此推算
+
+    Args:
+        reference_date (ReferenceDate, optional): arrow对象, datetime, date 或者
+                                                  'YYYY-MM-DD'等arrow可解析的字符串, 只有非
+                                                  'YYYY-MM-DD'的字符串才会导入arrow.
+                                                  Defaults to None, 即今天.
+
+    Returns:
+        datetime.date: 参考日期
+    """
+    if reference_date is None:
+        return datetime.date.today()
+    if isinstance(reference_date, datetime.datetime):
+        return reference_date.date()
+    if isinstance(reference_date, datetime.date):
+        return reference_date
+    if isinstance(reference_date, str):
+        try:
+            return datetime.date.fromisoformat(reference_date)
+        except ValueError:
+            pass
+    import arrow
+    # arrow.Arrow和arrow可解析的其他格式
+    return arrow.get(reference_date).date()
+
+
+class DateContext(NamedTuple):
+    """由参考时间推算出的锚点, 一次转换或者一批转换共用, 避免每个函数重复推算
+
+    Attributes:
+        now (datetime.date): 参考日期
+        today (str): 参考日期, 'YYYY-MM-DD'
+        this_year (int): 当年
+        this_month (int): 当月
+        this_season_st (int): 当前季度的开始月份
+        last_sunday (datetime.date): 上周日
+    """
+    now: datetime.date
+    today: str
+    this_year: int
+    this_month: int
+    this_season_st: int
+    last_sunday: datetime.date
+
+
+def get_date_context(reference_date: Union[ReferenceDate, DateContext] = None) -> DateContext:
+    """根据参考时间计算各个锚点, 已经是DateContext的直接返回
+
+    Args:
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间. Defaults to None,
+                                                                      即当前时间.
+
+    Returns:
+        DateContext: 参考时间的锚点
+    """
+    if isinstance(reference_date, DateContext):
+        return reference_date
+    now = get_reference_date(reference_date)
+    this_month = now.month
+    return DateContext(
+        now=now,
+        today=format_date(now),
+        this_year=now.year,
+        this_month=this_month,
+        this_season_st=(this_month - 1) // 3 * 3 + 1,
+        last_sunday=shift_days(now, -(now.weekday() + 1)),
+    )
+
+
+def year_completion(str_year: str) -> str:
+    """将省略的年份补充为完整的年份
+
+    2位年份小于40的认为是21世纪, 否则为是20世纪
+    3位年份小于100的认为是21世纪, 否则认为是10世纪~20世纪
+
+    Args:
+        input (str): 阿拉伯数字表示的年份, 允许2位数字到4位数字
+
+    Return:
+        return (str): 补全后的年份
+
+    Examples:
+        >>> '08'
+        '2008'
+
+        >>> '207'
+        '1207'
+    """
+    year_len = len(str_year)
+    assert 2 <= year_len <= 4, f'数字年份长度不符合要求'
+    if year_len == 2:
+        num_year = int(str_year)
+        res = '20' + str_year if num_year <=40 else '19' + str_year
+        return res
+    if year_len == 3:
+        num_year = int(str_year)
+        res = '2' + str_year if num_year <=100 else '1' + str_year
+        return res
+    if year_len == 4:
+        return str_year
+    return -1
+
+
+def infer_year(text: str, this_year: int) -> int:
+    """ 一些特殊年份写法的推理
+    """
+    for word, offset in YEAR_WORD.items():
+        if word in text:
+            return this_year + offset
+    return -1
+
+
+## -------------------------------- 隐含时间段 --------------------------------- ##
+def handle_year_before(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n年前
+    now = ctx.now
+    groups = m.groups()
+    # 半年前
+    if groups[0] == '半年':
+        month = shift_months(now, -6)
+        return [month.replace(day=1), month_end(month)]
+    pure_num = number_translator(groups[0][:-1]) if groups[0] else 0
+    # 3年前
+    if len(pure_num) <= 3:
+        year_ago = shift_months(now, -12 * int(pure_num)).year
+        return [datetime.date(year_ago, 1, 1), datetime.date(year_ago, 12, 31)]
+    # 2020年前
+    if len(pure_num) == 4:
+        return ['<=', datetime.date(int(pure_num) - 1, 12, 31)]
+    return None
+
+
+def handle_year_after(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n年后
+    now = ctx.now
+    groups = m.groups()
+    # 半年后
+    if groups[0] == '半年':
+        return ['>=', shift_months(now, 6)]
+    pure_num = number_translator(groups[0][:-1]) if groups[0] else 0
+    # 3年后
+    if len(pure_num) <= 3:
+        return ['>=', shift_months(now, 12 * int(pure_num))]
+    # 2020年后
+    if len(pure_num) == 4:
+        return ['>=', datetime.date(int(pure_num), 1, 1)]
+    return None
+
+
+def handle_recent_year(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # `最近`等的表述, 此处是从现在往前推, 含`半年`
+    res = m.groups()
+    if res[1] == '半年':
+        return [shift_months(ctx.now, -6), ctx.now]
+    shift_year = int(number_translator(res[1][:-1]))
+    return [shift_months(ctx.now, -12 * shift_year), ctx.now]
+
+
+def handle_before_year(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # `前3年`等的表述, 是去上一个年度的整年, 此处没有`半年`
+    res = m.groups()
+    shift_year = int(number_translator(res[1])[:-1])
+    year_st = shift_months(ctx.now, -12 * shift_year).year
+    year_ed = shift_months(ctx.now, -12).year
+    return [datetime.date(year_st, 1, 1), datetime.date(year_ed, 12, 31)]
+
+
+## --------------------------------- 指明年份 --------------------------------- ##
+def handle_specific_year(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 有数字的和特殊年份等, 此种情况可以带`上半年` , `下半年`等
+    str_year = number_translator(m.group(1))
+    year = int(year_completion(str_year))
+    if '上半年' in text or '前半年' in text:
+        return half_year(year, True)
+    elif '下半年'in text or '后半年' in text:
+        return half_year(year, False)
+    else:
+        return [datetime.date(year, 1, 1), datetime.date(year, 12, 31)]
+
+
+## --------------------------------- 特殊年份 --------------------------------- ##
+def half_year(year: int, first: bool) -> List[datetime.date]:
+    """某年的上半年或者下半年
+    """
+    if first:
+        return [datetime.date(year, 1, 1), datetime.date(year, 6, 30)]
+    return [datetime.date(year, 7, 1), datetime.date(year, 12, 31)]
+
+
+def handle_half_year(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 去年上半年, 下半年
+    res = m.groups()
+    if res[0] is not None:
+        year = infer_year(res[0], ctx.this_year)
+        if res[1] == '上' or res[1] == '前':
+            return half_year(year, True)
+        elif res[1] == '下' or res[1] == '后':
+            return half_year(year, False)
+        return None
+    # 半年: 默认为最近半年
+    if not res[1]:
+        return [shift_months(ctx.now, -6), ctx.now]
+    # 上半年
+    if res[1] == '上' or res[1] == '前':
+        return half_year(ctx.this_year, True)
+    # 下半年
+    elif res[1] == '下' or res[1] == '后':
+        return half_year(ctx.this_year, False)
+    return None
+
+
+def handle_special_year(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 去年, 明年
+    year = infer_year(text, ctx.this_year)
+    return [datetime.date(year, 1, 1), datetime.date(year, 12, 31)]
+
+
+# `n年前/后`, `最近n年`, `前n年`互斥, 可以重新排序; 之后的规则匹配范围更大, 顺序固定
+YEAR_CHAIN = register_chain(
+    'year',
+    (('year_before', handle_year_before),
+     ('year_after', handle_year_after),
+     ('recent_year', handle_recent_year),
+     ('before_year', handle_before_year)),
+    (('specific_year', handle_specific_year),),
+    (('half_year', handle_half_year),),
+    (('special_year', handle_special_year),),
+)
+
+
+def year_trans(text: str, reference_date: Union[ReferenceDate, DateContext] = None) -> List:
+    """年份的转换, 返回一个时间段, 粒度为`天`
+
     `最近3年`, 从当天往前推算3年
     `前3年`, 计算本年之前三个完整年份
-    
+
     `n年前`, n = {1,2,3}, 返回往前推算n年的整个年份; n = {4}, 返回该年度上一年的最后一天
     `n年后`, n = {1,2,3}, 返回大于往后推算n年的今; n = {4}, 返回大于该年度的1号
 
     Args:
         text (str): 输入文本
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间或其锚点.
+                                    Defaults to None, 即当前时间.
 
     Returns:
         List: 年份的开始和结束年月日
-        
+
     Examples:
         >>> year_trans('去年下半年')
-        ['2020-07-01', '2020-12-31']
-        
+        [datetime.date(2020, 7, 1), datetime.date(2020, 12, 31)]
+
         >>> year_trans('最近半年')
-        ['2021-01-05', '2021-07-05']
-        
+        [datetime.date(2021, 1, 5), datetime.date(2021, 7, 5)]
+
         >>> year_trans('前三年')
-        ['2018-01-01', '2020-12-31']
-        
+        [datetime.date(2018, 1, 1), datetime.date(2020, 12, 31)]
+
         >>> year_trans('三年后')
-        ['>=', '2024-07-09']
+        ['>=', datetime.date(2024, 7, 9)]
     """
-    
-    def infer_year(text) -> int:
-        """ 一些特殊年份写法的推理
-        """
-        year = -1
-        
-        if '今年' in text or '现在' in text:
-            year = this_year
-        elif '去年' in text or '昨年' in text or '上一年' in text:
-            year = this_year - 1                
-        elif '前年' in text:
-            year = this_year - 2
-        elif '明年' in text:
-            year = this_year + 1   
-        elif '后年' in text:
-            year = this_year + 2
-        return year
-        
-    def year_completion(str_year: str) -> str:
-        """将省略的年份补充为完整的年份
-        
-        2位年份小于40的认为是21世纪, 否则为是20世纪
-        3位年份小于100的认为是21世纪, 否则认为是10世纪~20世纪
-        
-        Args:
-            input (str): 阿拉伯数字表示的年份, 允许2位数字到4位数字
-            
-        Return:
-            return (str): 补全后的年份
-        
-        Examples:
-            >>> '08'
-            '2008'
-            
-            >>> '207'
-            '1207'
-        """
-        year_len = len(str_year)
-        assert 2 <= year_len <= 4, f'数字年份长度不符合要求'
-        if year_len == 2:
-            num_year = int(str_year)
-            res = '20' + str_year if num_year <=40 else '19' + str_year
-            return res
-        if year_len == 3:
-            num_year = int(str_year)
-            res = '2' + str_year if num_year <=100 else '1' + str_year
-            return res
-        if year_len == 4:
-            return str_year
-        return -1
-    
-    try:           
+    try:
         # logger.debug(text)
-        this_year = arrow.now().year
+        return YEAR_CHAIN.run(text, get_date_context(reference_date))
 
-        ## -------------------------------- 隐含时间段 --------------------------------- ##
-        # n年前
-        rule = r'([0-9半一二两三四五六七八九十]+年)(前)'
-        res = re.search(rule, text)
-        if res:
-            groups = res.groups()
-            print(groups)
-            # 半年前
-            if groups[0] == '半年':
-                month = arrow.now().shift(months=-6).format('YYYY-MM')
-                st = month + '-01'
-                ed = month + '-31'              
-                return [st, ed]
-            pure_num = number_translator(groups[0][:-1]) if groups[0] else 0
-            # 3年前
-            if len(pure_num) <= 3:
-                year_ago = arrow.now().shift(years=-int(pure_num)).format('YYYY')
-                year_st = year_ago + '-01-01'
-                year_ed = year_ago + '-12-31'
-                return [year_st, year_ed]
-            # 2020年前
-            if len(pure_num) == 4:
-                return ['<=', str(int(pure_num)-1) + '-12-31']
-                
-        # n年后
-        rule = r'([0-9半一二两三四五六七八九十]+年)(后)'
-        res = re.search(rule, text)
-        if res:
-            groups = res.groups()
-            print(groups)
-            
-            # 半年后
-            if groups[0] == '半年':
-                return ['>=', arrow.now().shift(months=+6).format('YYYY-MM-DD')]
-            pure_num = number_translator(groups[0][:-1]) if groups[0] else 0
-            # 3年后
-            if len(pure_num) <= 3:
-                return ['>=', arrow.now().shift(years=+int(pure_num)).format('YYYY-MM-DD')]
-            # 2020年后
-            if len(pure_num) == 4:
-                return ['>=', str(pure_num) + '-01-01']
-        
-        # `最近`等的表述, 此处是从现在往前推, 含`半年`
-        rule = r'(最近|近|过去)([0-9半一二两三四五六七八九十]+年)'
-        res = re.search(rule, text)
-        if res:
-            res = res.groups()
-            # print(res)
-            if len(res) == 2:
-                if res[1] == '半年':    
-                    recent_st = arrow.now().shift(months=-6).format('YYYY-MM-DD')
-                    recent_ed = arrow.now().format('YYYY-MM-DD')
-                    return [recent_st, recent_ed]
-                shift_year = int(number_translator(res[1][:-1]))
-                recent_st = arrow.now().shift(years=-shift_year).format('YYYY-MM-DD')
-                recent_ed = arrow.now().format('YYYY-MM-DD')
-                return [recent_st, recent_ed]
-            
-        # `前3年`等的表述, 是去上一个年度的整年, 此处没有`半年`
-        rule = r'(前)([0-9一二两三四五六七八九十]+年)'
-        res = re.search(rule, text)
-        # print(res)
-        if res:
-            res = res.groups()
-            if len(res) == 2:
-                shift_year = int(number_translator(res[1])[:-1])
-                year_st = str(arrow.now().shift(years=-shift_year).year)
-                year_ed = str(arrow.now().shift(years=-1).year)
-                return [year_st + '-01-01', year_ed + '-12-31'] 
-
-        ## --------------------------------- 指明年份 --------------------------------- ##
-        # 有数字的和特殊年份等, 此种情况可以带`上半年` , `下半年`等
-        rule = r"([0-9零一二两三四五六七八九十]{2,4})(年)"
-        res = re.search(rule, text)
-        # print(f'specific year: {res}')
-        if res:
-            res = res.groups()
-            if res:
-                str_year = number_translator(res[0])
-                year = year_completion(str_year)
-                # print(year)
-                if '上半年' in text or '前半年' in text:
-                    year = str(year) if year != -1 else str(this_year)
-                    year_st = year + '-01-01'
-                    year_ed = year + '-06-30'
-                    return [year_st, year_ed]
-                elif '下半年'in text or '后半年' in text:
-                    year = str(year) if year != -1 else str(this_year)
-                    year_st = year + '-07-01'
-                    year_ed = year + '-12-31'
-                    return [year_st, year_ed]
-                else:
-                    year_st = year + '-01-01'
-                    year_ed = year + '-12-31'
-                    return [year_st, year_ed]
-                
-        ## --------------------------------- 特殊年份 --------------------------------- ##
-        # # 去年上半年, 下半年
-        rule = r"([前|去|昨|今|明|后]年)*([上|下|前|后])*(半年)"
-        res = re.search(rule, text)
-        if res:
-            res = res.groups()
-            # print(res)
-            if len(res) == 3 and res[0] is not None:
-                year = str(infer_year(res[0]))
-                if res[1] == '上' or res[1] == '前':
-                    year_st = year + '-01-01'
-                    year_ed = year + '-06-30'
-                    return [year_st, year_ed]
-                elif res[1] == '下' or res[1] == '后':
-                    year_st = year + '-07-01'
-                    year_ed = year + '-12-31'
-                    return [year_st, year_ed]
-            if len(res) == 3 and res[0] is None:
-                year = str(this_year)
-                # 半年: 默认为最近半年
-                if not res[1]:  #
-                    year_st = arrow.now().shift(months=-6).format('YYYY-MM-DD')
-                    year_ed = arrow.now().format('YYYY-MM-DD')
-                    return [year_st, year_ed]
-                # 上半年
-                if res[1] == '上' or res[1] == '前':
-                    year_st = year + '-01-01'
-                    year_ed = year + '-06-30'
-                    return [year_st, year_ed]
-                # 下半年
-                elif res[1] == '下' or res[1] == '后':
-                    year_st = year + '-07-01'
-                    year_ed = year + '-12-31'
-                    return [year_st, year_ed]
-                
-        # 去年, 明年
-        rule = r"([前|去|昨|今|明|后]+)(年)"
-        res = re.search(rule, text)
-        if res:
-            year = str(infer_year(text))
-            return [year + '-01-01', year + '-12-31']
-        return [] 
-    
-    except Exception:
-        traceback.print_exc()
+    except TimeoutError:
+        # 超时交给`cdt`处理
+        raise
+    except Exception as e:
+        report_error('year_trans', text, e)
         return []
 
 
-def season_trans(text: str, year_flag: bool = False) -> List:
-    """季节的转换, 返回一个时间段 
-    
+# 季度的数字
+SEASON = {'1': 1, '2': 2, '3': 3, '4': 4}
+# 为了和第n季度保持一致, 这里约定春季1~3月, 夏季为4~6月, 秋季为7~9, 冬季为10~12月
+POEM_SEASON = {'春': 1, '夏': 2, '秋': 3, '冬': 4}
+
+
+def get_poem_season(text: str, this_year: int) -> Optional[List]:
+    """得到`春夏秋冬`的开始结束日期
+
+    Args:
+        text (str): 带季节的文字
+        this_year (int): 当年
+
+    Returns:
+        Optional[List]: 季节的开始结束日期, 没有季节的为None
+    """
+    for word, season in POEM_SEASON.items():
+        if word in text:
+            return list(CALENDAR.quarter_bounds(this_year, season))
+    return None
+
+
+def infer_month_by_season(season_num: int, ctx: DateContext) -> List:
+    """根据季节数往前推, 找到目标季节的开始结束日期
+
+    Args:
+        season_num (int): 往前推的季节数
+        ctx (DateContext): 参考时间的锚点
+
+    Returns:
+        List: 季节的开始结束日期
+    """
+    assert season_num >= 0, f'season_num < 0'
+    now = ctx.now
+    # 计算本季度
+    if season_num == 0:
+        return list(CALENDAR.quarter_bounds(ctx.this_year, ctx.this_season_st // 3 + 1))
+    # 计算当前月和当前季节开始月的差距, 如六月, 差距为 6 - 4 = 2个月
+    month_dist = ctx.this_month - ctx.this_season_st
+    # 月份偏移量
+    month_shift = month_dist + season_num * 3
+    # 目标开始年月
+    start = shift_months(now, -month_shift).replace(day=1)
+    # 目标结束年月
+    end = month_end(shift_months(now, -(month_dist+1)))
+    return [start, end]
+
+
+def handle_poem_season(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 春夏秋冬表明的季度
+    return get_poem_season(m.group(), ctx.this_year)
+
+
+def handle_this_season(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 特殊字符: 这个季度
+    return infer_month_by_season(0, ctx)
+
+
+def handle_last_season(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 特殊字符: 上个季度
+    return infer_month_by_season(1, ctx)
+
+
+def handle_common_num_season(m: 're.Match', text: str, ctx: DateContext, year_flag: bool) -> Optional[List]:
+    # 数字表明的季度
+    this_year = ctx.this_year
+    season_number = number_translator(m.group())[0]
+    if not season_number:
+        return None
+    # 特殊字符: 前n季度 前面带年
+    year_flag_season_res = RULES['year_flag_season'].compiled.search(text, timeout=remaining_budget())
+    if year_flag and year_flag_season_res:
+        groups = year_flag_season_res.groups()
+        text_season_number = groups[1]
+        pure_season_num = number_translator(text_season_number)  # 只能是1,2,3,4
+        if pure_season_num in SEASON:
+            return [datetime.date(this_year, 1, 1), CALENDAR.quarter_bounds(this_year, SEASON[pure_season_num])[1]]
+
+    # 特殊字符: 前|最近...|n季度
+    #! 这里往前推可能会改变年份
+    season_num_res = RULES['recent_season'].compiled.search(text, timeout=remaining_budget())
+    if season_num_res:
+        pure_season_num = season_num_res.group(2)
+        # 中间没有数字的, 默认为1
+        if pure_season_num == '':
+            return infer_month_by_season(1, ctx)
+        # 中间有数字的
+        pure_season_num = number_translator(pure_season_num)
+        return infer_month_by_season(int(pure_season_num), ctx)
+    # 纯数字
+    if season_number in SEASON:
+        return list(CALENDAR.quarter_bounds(this_year, SEASON[season_number]))
+    return None
+
+
+# `春夏秋冬`, `这个季度`, `上个季度`互斥, 可以重新排序; `这1季`也能被数字季度匹配, 数字季度固定在最后
+SEASON_CHAIN = register_chain(
+    'season',
+    (('poem_season', handle_poem_season),
+     ('this_season', handle_this_season),
+     ('last_season', handle_last_season)),
+    (('common_num_season', handle_common_num_season),),
+)
+
+
+def season_trans(text: str, year_flag: bool = False, reference_date: Union[ReferenceDate, DateContext] = None) -> List:
+    """季节的转换, 返回一个时间段
+
     涉及到`近`和`最近`的不能直接按照当天推, 从上季度结束往前推
     此函数中, `春夏秋冬` 和 `一二三四` 季度等价
 
@@ -457,180 +1317,141 @@ def season_trans(text: str, year_flag: bool = False) -> List:
         text (str): 输入文本
         year_flag (bool, optional): 季节前面是否有年份, 有的话在'前三个季度'这种处理会变为当
                                     年的前三季度. Defaults to False.
-                                    
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间或其锚点.
+                                    Defaults to None, 即当前时间.
+
     Returns:
         List: 季度的开始和结束年月日
-        
-    Example: 
+
+    Example:
         >>> season_trans('前三个季度')
-        ['2020-10-01', '2021-06-31']
-        
+        [datetime.date(2020, 10, 1), datetime.date(2021, 6, 30)]
+
         >>> season_trans('去年前三个季度')
-        ['2020-01-01', '2020-09-30']
-        
+        [datetime.date(2020, 1, 1), datetime.date(2020, 9, 30)]
+
         >>> season_trans('春季')
-        ['2021-01-01', '2021-03-31']
-        
+        [datetime.date(2021, 1, 1), datetime.date(2021, 3, 31)]
+
         >>> season_trans('上个季度')
-        ['2021-04-01', '2021-06-31']
+        [datetime.date(2021, 4, 1), datetime.date(2021, 6, 30)]
     """
-    
-    SEASON = {
-        '1': ['01-01', '03-31'],
-        '2': ['04-01', '06-30'],
-        '3': ['07-01', '09-30'],
-        '4': ['10-01', '12-31'],
-    }
-    
-    def get_poem_season(text: str) -> List:
-        """得到`春夏秋冬`的开始结束日期
-        
-        为了和第n季度保持一致, 这里约定春季1~3月, 夏季为4~6月, 秋季为7~9, 冬季为10~12月
-
-        Args:
-            text (str): 带季节的文字
-            
-        Returns:
-            List: 季节的开始结束日期
-        """
-        this_year = arrow.now().format('YYYY')
-        season = ['1', '1']
-        if '春' in text:
-            season = SEASON.get('1')
-        elif '夏' in text:
-            season = SEASON.get('2')
-        elif '秋' in text:
-            season = SEASON.get('3')
-        elif '冬' in text:
-            season = SEASON.get('4')
-        season = [this_year + '-' + season[0], this_year + '-' + season[1]]
-        return season
-        
-    def infer_month_by_season(season_num: int) -> List:
-        """根据季节数往前推, 找到目标季节的开始结束日期
-        
-        Args:
-            season_num (int): 往前推的季节数
-            
-        Returns:
-            List: 季节的开始结束日期    
-        """
-        assert season_num >= 0, f'season_num < 0'
-        year_shift = 0
-        this_month = arrow.now().month
-        his_year = arrow.now().format('YYYY')
-        # 计算当前季度的开始月份
-        if this_month <= 3:
-            this_season_st = '01'
-        elif this_month <= 6:
-            this_season_st = '04'
-        elif this_month <= 9:
-            this_season_st = '07'
-        elif this_month <= 12:
-            this_season_st = '10'
-            
-        # 计算本季度
-        if season_num == 0:
-            start = this_year + '-' + this_season_st + '-01'
-            month_end = int(this_season_st) + 2
-            month_end = '0' + str(month_end) if month_end < 10 else str(month_end)
-            end = this_year + '-' + month_end + '-31'
-            return [start, end]     
-        # 计算当前月和当前季节开始月的差距, 如六月, 差距为 6 - 4 = 2个月
-        month_dist = this_month - int(this_season_st)
-        # 月份偏移量
-        month_shift = month_dist + season_num * 3
-        # 目标开始年月
-        year_st = arrow.now().shift(months=-month_shift).format('YYYY')
-        month_st = arrow.now().shift(months=-month_shift).format('MM')
-        # 目标结束年月
-        year_ed = arrow.now().shift(months=-(month_dist+1)).format('YYYY')
-        month_ed = arrow.now().shift(months=-(month_dist+1)).format('MM')
-        start = year_st + '-' + month_st + '-01'
-        end = year_ed + '-' + month_ed + '-31'
-        return [start, end]
-    
     try:
         # logger.debug(text)
-        this_year = arrow.now().format('YYYY')
-        
-        poem_season_rule = r'[春夏秋冬]+[季天]+'
-        common_num_season_rule = r'([0-9零一二两三四五六七八九十]+)(季|个季)'
-                    
-        # 春夏秋冬表明的季度
-        poem_season_word = re.search(poem_season_rule, text)
-        if poem_season_word:
-            season_st, season_ed = get_poem_season(poem_season_word.group())
-            return [season_st, season_ed]
-        
-        # 特殊字符: 这个季度
-        this_season_rule = r'(本|这|这一|这1|当)+个*季'
-        this_season_res = re.search(this_season_rule, text)
-        if this_season_res:
-            res = infer_month_by_season(0)
-            return res
-        
-        # 特殊字符: 上个季度
-        this_season_rule = r'(上|上个)+个*季'
-        this_season_res = re.search(this_season_rule, text)
-        if this_season_res:
-            res = infer_month_by_season(1)
-            return res
-        
-        # 数字表明的季度 
-        season_num = re.search(common_num_season_rule, text)
-        if season_num:
-            season_number = number_translator(season_num.group())[0]
-            this_month = arrow.now().month
-            if season_number:
-                # 特殊字符: 前n季度 前面带年
-                year_flag_season_rule = r'(偂)([1-4一二两三四])+(季|个季)'
-                year_flag_season_res = re.search(year_flag_season_rule, text)
-                if year_flag and year_flag_season_res:
-                    groups = year_flag_season_res.groups()
-                    text_season_number = groups[1]
-                    pure_season_num = number_translator(text_season_number)  # 只能是1,2,3,4
-                    if pure_season_num in SEASON:
-                        season_st = SEASON.get('1')[0]
-                        season_ed = SEASON.get(pure_season_num)[1]
-                        return [this_year + '-' + season_st, this_year + '-' + season_ed]
-
-                # 特殊字符: 前|最近...|n季度
-                #! 这里往前推可能会改变年份
-                recent_season_rule = r'(最近|近|前|上|过去)+([0-9零一二两三四五六七八九十]*)(季|个季)'
-                season_num_res = re.search(recent_season_rule, text)
-                if season_num_res:
-                    season_num_group = season_num_res.groups()
-                    if len(season_num_group) == 3:
-                        pure_season_num = season_num_group[1]
-                        # 中间没有数字的, 默认为1
-                        if pure_season_num == '':
-                            res = infer_month_by_season(1)  
-                        # 中间有数字的
-                        else:
-                            pure_season_num = number_translator(pure_season_num)
-                            res = infer_month_by_season(int(pure_season_num))                        
-                        return res
-                # 纯数字
-                season_st, season_ed = SEASON.get(season_number, [None, None])
-                if season_st and season_ed:
-                    return [this_year + '-' + season_st, this_year + '-' + season_ed]  
-        return []
-    
-    except Exception:
-        traceback.print_exc()
+        return SEASON_CHAIN.run(text, get_date_context(reference_date), year_flag)
+
+    except TimeoutError:
+        # 超时交给`cdt`处理
+        raise
+    except Exception as e:
+        report_error('season_trans', text, e)
         return []
 
 
-def month_trans(text: str, year_flag: bool = False) -> List:
-    """月份的转换, 返回一个时间段 
-    
+def handle_this_month(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 这个月 本月 ...
+    return [ctx.now.replace(day=1), month_end(ctx.now)]
+
+
+def handle_recent_month_num(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 最近几个月 #!可能跨过年份  从今天往前推
+    pure_month_num = m.group(2)
+    shift_month = int(number_translator(pure_month_num)) if pure_month_num else 1
+    return [shift_months(ctx.now, -shift_month), ctx.now]
+
+
+def handle_several_month_before(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n个月前
+    shift_month = int(number_translator(m.group(1)))
+    month = shift_months(ctx.now, -shift_month)
+    return [month.replace(day=1), month_end(month)]
+
+
+def handle_several_month_after(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n个月后
+    shift_month = int(number_translator(m.group(1)))
+    return ['>=', shift_months(ctx.now, shift_month)]
+
+
+def handle_specific_month_before(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n月前
+    month = int(number_translator(m.group(1)))
+    if month == 1:
+        return ['<=', datetime.date(ctx.this_year - 1, 12, 31)]
+    if 2 <= month <= 10:
+        return ['<=', CALENDAR.month_end(ctx.this_year, month - 1)]
+    if 11 <= month <=12:
+        return ['<=', CALENDAR.month_end(ctx.this_year, month)]
+    return None
+
+
+def handle_specific_month_after(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n月后
+    month = int(number_translator(m.group(1)))
+    if 1 <= month <= 12:
+        return ['>=', datetime.date(ctx.this_year, month, 1)]
+    return None
+
+
+def handle_year_flag_month(m: 're.Match', text: str, ctx: DateContext, year_flag: bool) -> Optional[List]:
+    # 前n个月 前面带年
+    pure_month_num = m.group(2)
+    if year_flag and pure_month_num:
+        month_num = int(number_translator(pure_month_num))
+        if 1 <= month_num <= 12:
+            return [datetime.date(ctx.this_year, 1, 1), CALENDAR.month_end(ctx.this_year, month_num)]
+    return None
+
+
+def handle_before_month_num(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 前几个月  #!可能跨过年份   从上个月末往前推
+    pure_month_num = m.group(2)
+    shift_month = int(number_translator(pure_month_num)) if pure_month_num else 1
+    return [shift_months(ctx.now, -shift_month).replace(day=1), month_end(shift_months(ctx.now, -1))]
+
+
+class InvalidMonth(list):
+    """月份超出1~12(如`13月`, `0月`)时`month_trans`的返回值, 和[]一样为假
+
+    `combine_result`遇到它整体返回[], 不再用年, 日等其余部分拼出一个看似正确的结果
+    """
+
+    def __repr__(self) -> str:
+        return 'InvalidMonth()'
+
+
+def handle_specific_month_num(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 具体数字月份
+    month = int(number_translator(m.group())[:-1])
+    if not 1 <= month <= 12:
+        return InvalidMonth()
+    return [datetime.date(ctx.this_year, month, 1), CALENDAR.month_end(ctx.this_year, month)]
+
+
+# 具体数字月份能匹配其余大部分说法, 固定在最后; 其余的规则互斥, 可以重新排序
+MONTH_CHAIN = register_chain(
+    'month',
+    (('this_month', handle_this_month),
+     ('recent_month_num', handle_recent_month_num),
+     ('several_month_before', handle_several_month_before),
+     ('several_month_after', handle_several_month_after),
+     ('specific_month_before', handle_specific_month_before),
+     ('specific_month_after', handle_specific_month_after),
+     ('year_flag_month', handle_year_flag_month),
+     ('before_month_num', handle_before_month_num)),
+    (('specific_month_num', handle_specific_month_num),),
+)
+
+
+def month_trans(text: str, year_flag: bool = False, reference_date: Union[ReferenceDate, DateContext] = None) -> List:
+    """月份的转换, 返回一个时间段
+
     `最近3月`等词, 从当天往前推算3个月
     `前三月`等词, 计算本月之前三个完整月份
-    
+
     `n月前`, n = {1, 2}, 返回本年度该月份前一个月的31号之前
     `n月后`, n = {1, 2}, 返回本年度该月份前一个月的1号之后
-    
+
     `n个月前`, n = {1,2,3}, 返回当前时间往前推算n个月的整个月份
     `n个月后`, n = {1,2,3}, 返回当前时间往后推算n个月的1号
 
@@ -638,409 +1459,427 @@ def month_trans(text: str, year_flag: bool = False) -> List:
         text (str): 输入文本
         year_flag (bool, optional): 月份前面是否有年份, 有的话在'前三个月'这种处理会变为当
                                     年的前三个月. Defaults to False.
-                                    
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间或其锚点.
+                                    Defaults to None, 即当前时间.
+
     Returns:
-        List: 月份的开始和结束年月日 
-        
-    Example:         
+        List: 月份的开始和结束年月日
+
+    Example:
         >>> month_trans('本月')
-        ['2021-07-01', '2021-07-31']
-        
+        [datetime.date(2021, 7, 1), datetime.date(2021, 7, 31)]
+
         >>> month_trans('最近三个月')
-        ['2021-04-05', '2021-07-05']
-        
+        [datetime.date(2021, 4, 5), datetime.date(2021, 7, 5)]
+
         >>> month_trans('前三个月')
-        ['2021-04-01', '2021-06-31']   
-        
+        [datetime.date(2021, 4, 1), datetime.date(2021, 6, 30)]
+
         >>> month_trans('四个月前')
-        [('2021-03-01', '2021-03-31')]     
+        [(datetime.date(2021, 3, 1), datetime.date(2021, 3, 31))]
     """
     try:
         # logger.debug(text)
-        
-        this_year = arrow.now().format('YYYY')
-        this_month = arrow.now().format('MM')
-        
-        this_month_rule = r'[本|这|当]+[1|一]*个*月'
-        recent_month_num_rule = r'(最近|近)([0-9一二两三四五六七八九十]+)(月|个月)'
-        before_month_num_rule = r'(过去|前|上)([0-9一二两三四五六七八九十]*)(月|个月)'
-        several_month_before_rule = r'([0-9一二两三四五六七八九十]+)(个月)(前)'
-        several_month_after_rule = r'([0-9一二两三四五六七八九十]+)(个月)(后)'
-        specific_month_before_rule = r'([0-9一二两三四五六七八九十]{1,2})(月|月份)(前)'
-        specific_month_after_rule = r'([0-9一二两三四五六七八九十]{1,2})(月|月份)(后)'
-        year_flag_month_rule = r'(偂)([0-9一二两三四五六七八九十]+)(月|个月)'
-        specific_month_num_rule = r'([0-9一二两三四五六七八九十]+)(月)'
-        
-        # 这个月 本月 ...
-        this_month_res = re.search(this_month_rule, text)
-        if this_month_res:
-            month_st = this_year + '-' + this_month + '-01'
-            month_ed = this_year + '-' + this_month + '-31'
-            return [month_st, month_ed]
-        
-        # 最近几个月 #!可能跨过年份  从今天往前推
-        recent_month_res = re.search(recent_month_num_rule, text)
-        if recent_month_res:
-            recent_month_group = recent_month_res.groups()
-            if len(recent_month_group) == 3:
-                pure_month_num = recent_month_group[1]                
-                shift_month = int(number_translator(pure_month_num)) if pure_month_num else 1
-                month_st = arrow.now().shift(months=-shift_month).format('YYYY-MM-DD')
-                month_ed = arrow.now().format('YYYY-MM-DD')
-                return [month_st, month_ed] 
-            
-        # n个月前/后
-        several_month_before_res = re.search(several_month_before_rule, text)
-        if several_month_before_res:
-            groups = several_month_before_res.groups()
-            shift_month = int(number_translator(groups[0]))
-            month = arrow.now().shift(months=-shift_month).format('YYYY-MM')
-            month_st = month + '-01'
-            month_ed = month + '-31'
-            return [month_st, month_ed]
-        
-        several_month_after_res = re.search(several_month_after_rule, text)
-        if several_month_after_res:
-            groups = several_month_after_res.groups()
-            shift_month = int(number_translator(groups[0]))
-            month_day = arrow.now().shift(months=+shift_month).format('YYYY-MM-DD')
-            return ['>=', month_day]
-           
-        # n月前/后
-        specific_month_before_res = re.search(specific_month_before_rule, text)
-        if specific_month_before_res:
-            groups = specific_month_before_res.groups()
-            month = int(number_translator(groups[0]))
-            if month == 1:
-                return ['<=', str(int(this_year) - 1) + '-12-31']
-            if 2 <= month <= 10:
-                return ['<=', this_year + '-0' + str(month-1) + '-31']
-            if 11 <= month <=12:
-                return ['<=', this_year + '-' + str(month) + '-31']
-            
-        specific_month_after_res = re.search(specific_month_after_rule, text)
-        if specific_month_after_res:
-            groups = specific_month_after_res.groups()
-            month = int(number_translator(groups[0]))
-            if 1 <= month <= 9:
-                return ['>=', this_year + '-0' + str(month) + '-01']
-            if 10 <= month <= 12:
-                return ['>=', this_year + '-' + str(month) + '-01']
-            
-        # 前n个月 前面带年
-        year_flag_month_res = re.search(year_flag_month_rule, text)
-        if year_flag and year_flag_month_res:
-            groups = year_flag_month_res.groups()
-            pure_month_num = groups[1]
-            if pure_month_num:                
-                month_num = int(number_translator(pure_month_num))
-                if 1 <= month_num <= 12:
-                    month_res = '0' + str(month_num) if month_num < 10 else str(month_num)
-                    month_st = this_year + '-' + '01-01'
-                    month_ed = this_year + '-' + month_res + '-31'
-                    return [month_st, month_ed] 
-            
-        # 前几个月  #!可能跨过年份   从上个月末往前推
-        before_month_res = re.search(before_month_num_rule, text)
-        if before_month_res:
-            before_month_group = before_month_res.groups()
-            if len(before_month_group) == 3:
-                pure_month_num = before_month_group[1]                
-                shift_month = int(number_translator(pure_month_num)) if pure_month_num else 1
-                month_st = arrow.now().shift(months=-shift_month).format('YYYY-MM') + '-01' 
-                month_ed = arrow.now().shift(months=-1).format('YYYY-MM') + '-31' 
-                return [month_st, month_ed] 
-
-        # 具体数字月份
-        specific_month_res =  re.search(specific_month_num_rule, text) 
-        if specific_month_res:
-            month_res = number_translator(specific_month_res.group())[:-1]
-            month_res = '0' + month_res if len(month_res) == 1 else month_res
-            month_st = this_year + '-' + month_res + '-01'
-            month_ed = this_year + '-' + month_res + '-31'
-            return [month_st, month_ed]
-        return []
-    
-    except Exception:
-        traceback.print_exc()
+        return MONTH_CHAIN.run(text, get_date_context(reference_date), year_flag)
+
+    except TimeoutError:
+        # 超时交给`cdt`处理
+        raise
+    except Exception as e:
+        report_error('month_trans', text, e)
         return []
 
 
-def week_trans(text: str) -> List:
+def handle_recent_week(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 最近几周, 从今天开始往前推
+    shift_num = int(number_translator(m.group(2)))
+    week_st = shift_days(ctx.now, -7 * shift_num)
+    week_ed = ctx.now
+    return [week_st, week_ed]
+
+
+def handle_before_week(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 前几周, 推到上一个周末
+    shift_num = int(number_translator(m.group(2)))
+    last_monday = shift_days(ctx.last_sunday, 1)
+    week_st = shift_days(last_monday, -7 * shift_num)
+    week_ed = ctx.last_sunday
+    return [week_st, week_ed]
+
+
+def handle_week_before(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n周前
+    shift_week = int(number_translator(m.group(1)))
+    week_st = shift_days(ctx.last_sunday, -7 * shift_week + 1)
+    week_ed = shift_days(ctx.last_sunday, -7 * (shift_week-1))
+    return [week_st, week_ed]
+
+
+def handle_week_after(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n周后
+    shift_week = int(number_translator(m.group(1)))
+    week_day = shift_days(ctx.now, 7 * shift_week)
+    return ['>=', week_day]
+
+
+def handle_recent_weekday(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 上周某天/上周
+    last_2_sunday = shift_days(ctx.last_sunday, -7)
+    weekday = m.group(3)
+    # 上周,上一周
+    if not weekday:
+        week_st = shift_days(last_2_sunday, 1)
+        week_ed = shift_days(last_2_sunday, 7)
+        return [week_st, week_ed]
+    # 上周二
+    shift_num = int(number_translator(weekday))
+    week_day = shift_days(last_2_sunday, shift_num)
+    return ['=', week_day]
+
+
+def handle_this_weekday(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 这周某天/这周
+    weekday = m.group(3)
+    # 本周, 周
+    if not weekday:
+        week_st = shift_days(ctx.last_sunday, 1)
+        week_ed = shift_days(ctx.last_sunday, 7)
+        return [week_st, week_ed]
+    # 周三, 本周三
+    shift_num = int(number_translator(weekday))
+    week_day = shift_days(ctx.last_sunday, shift_num)
+    return ['=', week_day]
+
+
+#! 前后顺序有关系, 匹配范围更大, 更一般的放后面, 每条规则单独一组, 不参与重新排序
+WEEK_CHAIN = register_chain(
+    'week',
+    (('recent_week', handle_recent_week),),
+    (('before_week', handle_before_week),),
+    (('week_before', handle_week_before),),
+    (('week_after', handle_week_after),),
+    (('recent_weekday', handle_recent_weekday),),
+    (('this_weekday', handle_this_weekday),),
+)
+
+
+def week_trans(text: str, reference_date: Union[ReferenceDate, DateContext] = None) -> List:
     """周的转换, 返回一个时间段或时间点
-    
+
     `最近一周`等词, 从当天往前推算一周
     `前三周`等词, 返回本周之前三个完整周
-    
+
     `n周前`, 返回当前时间往前推算n周的整个周
     `n周后`, 返回大于当前时间往后推算n周的那天
-        
+
     不支持`某月第三周` , `某月前三周`等词语, 因为周的开始点不易确定
-    
-    
+
+
     Args:
         text (str): 输入文本
-                                    
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间或其锚点.
+                                    Defaults to None, 即当前时间.
+
     Returns:
-        List: 日期 或 周的开始和结束年月日 
-        
-    Example:         
+        List: 日期 或 周的开始和结束年月日
+
+    Example:
         >>> week_trans('周三')
-        ['=', '2021-07-14']
-        
+        ['=', datetime.date(2021, 7, 14)]
+
         >>> week_trans('前三周')
-        ['2021-06-21', '2021-07-11']
-        
+        [datetime.date(2021, 6, 21), datetime.date(2021, 7, 11)]
+
         >>> week_trans('三周前')
-        ['2021-06-21', '2021-06-27']
-        
+        [datetime.date(2021, 6, 21), datetime.date(2021, 6, 27)]
+
         >>> week_trans('上周礼拜五')
-        ['=', '2021-07-09']       
+        ['=', datetime.date(2021, 7, 9)]
     """
     try:
         # logger.debug(text)
-                
-        # 先找到上周日, 再找到上上周日, 在它们的基础上做加减
-        week_today = arrow.now().weekday()
-        shift_day_from_last_sunday = week_today + 1
-        last_sunday_arrow = arrow.now().shift(days=-shift_day_from_last_sunday)
-        last_monday_arrow = last_sunday_arrow.shift(days=+1)
-        last_2_sunday_arrow = last_sunday_arrow.shift(days=-7)
-        
-        # rule
-        #! 前后顺序有关系, 匹配范围更大, 更一般的放后面
-        recent_week_rule = r'(最近|近)([0-9一二两三四五六七八九十]+)(周)'
-        before_week_rule = r'(过去|前)([0-9一二两三四五六七八九十]+)(周)'
-        week_before_rule = r'([0-9一二两三四五六七八九十]+)(周前)'
-        week_after_rule = r'([0-9一二两三四五六七八九十]+)(周后)'
-        recent_weekday_rule = r'(上|上个|上一)+(周)+([1-7一二三四五六七])*'
-        this_weekday_rule = r'(这|这个|本)*(周)+([1-7一二三四五六七])*'
-        
-        # 最近几周, 从今天开始往前推
-        recent_week_res = re.search(recent_week_rule, text)
-        if recent_week_res:
-            groups = recent_week_res.groups()
-            # print(groups)
-            if len(groups) == 3:
-                shift_num = int(number_translator(groups[1]))
-                week_st = arrow.now().shift(weeks=-shift_num).format('YYYY-MM-DD')
-                week_ed = arrow.now().format('YYYY-MM-DD')
-                return [week_st, week_ed]
-            
-        # 前几周, 推到上一个周末
-        before_week_res = re.search(before_week_rule, text)
-        if before_week_res:        
-            groups = before_week_res.groups()
-            # print(groups)
-            if len(groups) == 3:
-                shift_num = int(number_translator(groups[1]))
-                week_st = last_monday_arrow.shift(weeks=-shift_num).format('YYYY-MM-DD')
-                week_ed = last_sunday_arrow.format('YYYY-MM-DD')
-                return [week_st, week_ed]
-            
-        # n周前/后
-        week_before_res = re.search(week_before_rule, text)
-        if week_before_res:
-            groups = week_before_res.groups()
-            shift_week = int(number_translator(groups[0]))
-            week_st = last_sunday_arrow.shift(weeks=-shift_week).shift(days=+1).format('YYYY-MM-DD')
-            week_ed = last_sunday_arrow.shift(weeks=-(shift_week-1)).format('YYYY-MM-DD')
-            return [week_st, week_ed]
-        
-        week_after_res = re.search(week_after_rule, text)
-        if week_after_res:
-            groups = week_after_res.groups()
-            shift_week = int(number_translator(groups[0]))
-            week_day = arrow.now().shift(weeks=+shift_week).format('YYYY-MM-DD')
-            return ['>=', week_day]
-
-        # 上周某天/上周
-        recent_weekday_res = re.search(recent_weekday_rule, text)
-        if recent_weekday_res:        
-            groups = recent_weekday_res.groups()
-            # print(groups)
-            if len(groups) == 3:
-                # 上周,上一周
-                if not groups[2]:
-                    week_st = last_2_sunday_arrow.shift(days=+1).format('YYYY-MM-DD')
-                    week_ed = last_2_sunday_arrow.shift(days=+7).format('YYYY-MM-DD')
-                    return [week_st, week_ed]
-                # 上周二
-                else:
-                    shift_num = int(number_translator(groups[2]))
-                    week_day = last_2_sunday_arrow.shift(days=+shift_num).format('YYYY-MM-DD')
-                    return ['=', week_day]
-                
-        # 这周某天/这周
-        this_weekday_res = re.search(this_weekday_rule, text)
-        if this_weekday_res:        
-            groups = this_weekday_res.groups()
-            # print(groups)
-            if len(groups) == 3:
-                # 本周, 周
-                if not groups[2]:
-                    week_st = last_sunday_arrow.shift(days=+1).format('YYYY-MM-DD')
-                    week_ed = last_sunday_arrow.shift(days=+7).format('YYYY-MM-DD')
-                    return [week_st, week_ed]
-                # 周三, 本周三
-                else:
-                    shift_num = int(number_translator(groups[2]))
-                    week_day = last_sunday_arrow.shift(days=+shift_num).format('YYYY-MM-DD')
-                return ['=', week_day]
-        return []
-    
-    except Exception:
-        traceback.print_exc()
+        # 在上周日的基础上做加减
+        return WEEK_CHAIN.run(text, get_date_context(reference_date))
+
+    except TimeoutError:
+        # 超时交给`cdt`处理
+        raise
+    except Exception as e:
+        report_error('week_trans', text, e)
         return []
-    
-      
-def day_trans(text: str, month_flag: bool = False) -> List:
+
+
+def handle_special_day(m: None, text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    """`昨天`, `大后天`等, 不需要正则
+    """
+    # 特殊的日子都以`天`结尾
+    if '天' not in text:
+        return None
+    for day in SPECIAL_DAY_PRIORITY:
+        if day in text:
+            offset = SPECIAL_DAY[day]
+            return ['=', shift_days(ctx.now, offset)]
+    return None
+
+
+def handle_month_flag_day(m: 're.Match', text: str, ctx: DateContext, month_flag: bool) -> Optional[List]:
+    # 特殊字符: 前n天, 前面有月份
+    pure_day_num = m.group(2)
+    if month_flag and pure_day_num:
+        pure_day_num = int(number_translator(pure_day_num))
+        if 1 <= pure_day_num <= 31: # 此处用replace 可能会报错
+            day_st = ctx.now.replace(day=1)
+            day_ed = ctx.now.replace(day=pure_day_num)
+            return [day_st, day_ed]
+    return None
+
+
+def handle_recent_day_num(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 特殊字符: 前n天
+    pure_day_num = m.group(2)
+    shift_day = int(number_translator(pure_day_num)) if pure_day_num else 1
+    day_st = shift_days(ctx.now, -shift_day)
+    day_ed = ctx.now
+    return [day_st, day_ed]
+
+
+def handle_several_day_before(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n天前
+    shift_day = int(number_translator(m.group(1)))
+    return ['=', shift_days(ctx.now, -shift_day)]
+
+
+def handle_several_day_after(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n天后
+    shift_day = int(number_translator(m.group(1)))
+    return ['>=', shift_days(ctx.now, shift_day)]
+
+
+def handle_specific_day_before(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n号前
+    today = ctx.now
+    day_num = int(number_translator(m.group(1)))
+    if day_num == 1:
+        return ['<=', month_end(shift_months(today, -1))]
+    # 日期先不按当月的天数截断, 和月份组合时才知道是哪个月, 见`combine_result`
+    if 2 <= day_num <= 32:
+        return ['<=', UnclampedDate(today.year, today.month, day_num - 1)]
+    return None
+
+
+def handle_specific_day_after(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # n号后
+    day_num = int(number_translator(m.group(1)))
+    # 同`n号前`, 在`combine_result`中截断
+    if 1 <= day_num <= 31:
+        return ['>=', UnclampedDate(ctx.now.year, ctx.now.month, day_num)]
+    return None
+
+
+def handle_specific_day_num(m: 're.Match', text: str, ctx: DateContext, flag: bool) -> Optional[List]:
+    # 具体天
+    day_num = int(number_translator(m.group(1)))
+    return ['=', ctx.now.replace(day=day_num)]
+
+
+# `昨天`等固定在最前, 具体天能匹配其余大部分说法, 固定在最后; 中间的规则互斥, 可以重新排序
+DAY_CHAIN = register_chain(
+    'day',
+    ((None, handle_special_day),),
+    (('month_flag_day', handle_month_flag_day),
+     ('recent_day_num', handle_recent_day_num),
+     ('several_day_before', handle_several_day_before),
+     ('several_day_after', handle_several_day_after),
+     ('specific_day_before', handle_specific_day_before),
+     ('specific_day_after', handle_specific_day_after)),
+    (('specific_day_num', handle_specific_day_num),),
+)
+
+
+def day_trans(text: str, month_flag: bool = False, reference_date: Union[ReferenceDate, DateContext] = None) -> List:
     """日期的转换, 返回一个时间段或时间点
-    
+
     `最近n天`, `前n天` 等词, 均从当天往前推算到今天
-    
+
     `n天前`, 返回等于当前时间往前推算n天的那天
     `n天后`, 返回大于当前时间往后推算n天的那天
-    
+
     `n号/日前`, 返回小于当月n-1号的那天
     `n号/日后`, 返回大于当月n号的那天
-    
+    这两种的日不按当月天数截断(如`2021-06-31`), 组合上月份之后由`combine_result`截断
+
     Args:
         text (str): 输入文本
         month_flag (bool, optional): 日期前面是否有月份, 有的话在'前20天'这种处理会
                                      变为当月的1-20天. Defaults to False.
-                                    
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间或其锚点.
+                                    Defaults to None, 即当前时间.
+
     Returns:
-        List: 日期 或 日期的开始和结束年月日 
-        
-    Example:         
+        List: 日期 或 日期的开始和结束年月日
+
+    Example:
         >>> day_trans('前五天')
-        ['2021-07-08', '2021-07-13']
-        
+        [datetime.date(2021, 7, 8), datetime.date(2021, 7, 13)]
+
         >>> day_trans('十八日')
-        ['=', '2021-07-18']
-        
+        ['=', datetime.date(2021, 7, 18)]
+
         >>> day_trans('五天前')
-        ['=', '2021-07-08'] 
-        
+        ['=', datetime.date(2021, 7, 8)]
+
         >>> day_trans('五号之前')
-        [('<=', '2021-07-04')]
+        [('<=', datetime.date(2021, 7, 4))]
     """
-    
-    SPECIAL_DAY = ['大前天', '前天', '昨天', '今天', '明天', '后天', '大后天']
-    
-    def special_day(text):
-        res_day = -1
-        today = arrow.now()
-        if '前天' in text:
-            res_day = today.shift(days=-2).format('YYYY-MM-DD')
-        if '大前天' in text:
-            res_day = today.shift(days=-3).format('YYYY-MM-DD')
-        if '昨天' in text:
-            res_day = today.shift(days=-1).format('YYYY-MM-DD')
-        if '今天' in text:
-            res_day = today.format('YYYY-MM-DD')
-        if '明天' in text:
-            res_day = today.shift(days=+1).format('YYYY-MM-DD')
-        if '后天' in text:
-            res_day = today.shift(days=+2).format('YYYY-MM-DD')  
-        if '大后天' in text:
-            res_day = today.shift(days=+3).format('YYYY-MM-DD')      
-        return res_day
-    
     try:
         # logger.debug(text)
-    
-        today_arrow = arrow.now()
-        # rule
-        recent_day_num_rule = r'(最近|近|前|这|过去)([0-9一二两三四五六七八九十]+)(天|日)'  # `+`放里面才能匹配'九十'天
-        several_day_before_rule = r'([0-9一二两三四五六七八九十]+)(天)(前)'
-        several_day_after_rule = r'([0-9一二两三四五六七八九十]+)(天)(后)'
-        specific_day_before_rule = r'([0-9一二两三四五六七八九十]+)(号|日)(前)'
-        specific_day_after_rule = r'([0-9一二两三四五六七八九十]+)(号|日)(后)'
-        sepcial_day_rule = r'[前|昨|今|明|后]天'
-        specific_day_num_rule = r'([0-9一二两三四五六七八九十]+)(号|日)'
-        month_flag_day_rule = r'(偂)([0-9一二两三四五六七八九十]+)(天|日)'
-        
-        # 特殊字符: 昨天等
-        for day in SPECIAL_DAY:
-            if day in text:
-                day_res = special_day(text)
-                return ['=', day_res]
-            
-        # 特殊字符: 前n天, 前面有月份    
-        month_flag_day_res = re.search(month_flag_day_rule, text)
-        if month_flag and month_flag_day_res:
-            groups = month_flag_day_res.groups()
-            pure_day_num = groups[1]                
-            if pure_day_num:
-                pure_day_num = int(number_translator(pure_day_num))
-                if 1 <= pure_day_num <= 31: # 此处用arrow.replace 可能会报错
-                    day_st = today_arrow.replace(day=1).format('YYYY-MM-DD')
-                    day_ed = today_arrow.replace(day=pure_day_num).format('YYYY-MM-DD')
-                    return [day_st, day_ed] 
-        
-        # 特殊字符: 前n天
-        recent_day_res = re.search(recent_day_num_rule, text)
-        if recent_day_res:
-            groups = recent_day_res.groups()
-            if len(groups) == 3:
-                pure_day_num = groups[1]                
-                shift_day = int(number_translator(pure_day_num)) if pure_day_num else 1
-                day_st = today_arrow.shift(days=-shift_day).format('YYYY-MM-DD')
-                day_ed = today_arrow.format('YYYY-MM-DD')
-                return [day_st, day_ed] 
-            
-        # n天前/后
-        several_day_before_res = re.search(several_day_before_rule, text)
-        if several_day_before_res:
-            groups = several_day_before_res.groups()
-            shift_day = int(number_translator(groups[0]))
-            day = today_arrow.shift(days=-shift_day).format('YYYY-MM-DD')
-            return ['=', day] 
-            
-        several_day_after_res = re.search(several_day_after_rule, text)
-        if several_day_after_res:
-            groups = several_day_after_res.groups()
-            shift_day = int(number_translator(groups[0]))
-            day = today_arrow.shift(days=+shift_day).format('YYYY-MM-DD')
-            return ['>=', day] 
-            
-        #n号前/后
-        specific_day_before_res = re.search(specific_day_before_rule, text)
-        if specific_day_before_res:
-            groups = specific_day_before_res.groups()
-            day_num = int(number_translator(groups[0]))
-            if day_num == 1:
-                day = today_arrow.shift(months=-1).format('YYYY-MM') + '-31'
-                return ['<=', day] 
-            if 2 <= day_num <= 32:
-                str_day = str(day_num - 1)
-                str_day = '0' + str_day if len(str_day) == 1 else str_day
-                day = today_arrow.format('YYYY-MM') + '-' + str_day
-                return ['<=', day] 
-        
-        specific_day_after_res = re.search(specific_day_after_rule, text)
-        if specific_day_after_res:
-            groups = specific_day_after_res.groups()
-            day_num = int(number_translator(groups[0]))
-            if 1 <= day_num <= 31:
-                str_day = '0' + str(day_num) if day_num < 10 else str(day_num)
-                return ['>=', today_arrow.format('YYYY-MM') + '-' + str_day]
-    
-        # 具体天
-        specific_day_res = re.search(specific_day_num_rule, text)
-        if specific_day_res:
-            groups = specific_day_res.groups()
-            day_num = int(number_translator(groups[0]))
-            day_res = today_arrow.replace(day=day_num).format('YYYY-MM-DD')
-            return ['=', day_res]
-        return []
-    
-    except Exception:
-        traceback.print_exc()
+        return DAY_CHAIN.run(text, get_date_context(reference_date), month_flag)
+
+    except TimeoutError:
+        # 超时交给`cdt`处理
+        raise
+    except Exception as e:
+        report_error('day_trans', text, e)
         return []
-    
+
+
+def rewrite_recent_in(rule_name: str) -> Callable[[str], str]:
+    """`内`的转化, `三年内` -> `最近三年`
+    """
+    def rewrite(text: str) -> str:
+        res = RULES[rule_name].compiled.search(text, timeout=remaining_budget())
+        if res:
+            groups = res.groups()
+            if groups[0] and groups[1] and groups[2]:
+                old = groups[0] + groups[1] + groups[2]
+                new = '最近' + groups[0] + groups[1]
+                text = text.replace(old, new)
+        return text
+    return rewrite
+
+
+def rewrite_year_before(text: str) -> str:
+    """`前`的转化, 以区别`三年前`和`三年前三个月`
+    """
+    if RULES['year_before_mark'].compiled.search(text, timeout=remaining_budget()):
+        text = text.replace('年前', '年偂')
+    return text
+
+
+def rewrite_month_before(text: str) -> str:
+    """`前`的转化, 以区别`三月前`和`三月前三天`
+    """
+    if RULES['month_before_mark'].compiled.search(text, timeout=remaining_budget()):
+        text = text.replace('月前', '月偂')
+    return text
+
+
+def complete_unit(rule_name: str, unit: str) -> Callable[[str], str]:
+    """后面补齐前面, `18到19年` -> `18年到19年`
+    """
+    def rewrite(text: str) -> str:
+        com_res = RULES[rule_name].compiled.search(text, timeout=remaining_budget())
+        if com_res:
+            old = com_res.groups()[0]
+            text = text.replace(old, old + unit)
+        return text
+    return rewrite
+
+
+def complete_year_season(text: str) -> str:
+    """前面补齐后面, `18年第一季度到第三季度` -> `18年第一季度到18年第三季度`
+    """
+    com_res = RULES['com_year_season'].compiled.search(text, timeout=remaining_budget())
+    if com_res:
+        groups = com_res.groups()
+        old = groups[4]
+        text = text.replace(old, groups[0] + old)
+    return text
+
+
+def complete_year_month(text: str) -> str:
+    """前面补齐后面, `18年4月到6月` -> `18年4月到18年6月`
+    """
+    com_res = RULES['com_year_month'].compiled.search(text, timeout=remaining_budget())
+    if com_res:
+        old = com_res.groups()[4] + com_res.groups()[5]
+        text = text.replace(old, com_res.groups()[0] + old)
+    return text
+
+
+def complete_year_month_day(text: str) -> str:
+    """前面补齐后面, `3月5日到7日` -> `3月5日到3月7日`
+    """
+    com_res = RULES['com_year_month_day'].compiled.search(text, timeout=remaining_budget())
+    if com_res:
+        groups = com_res.groups()  # (None, '3月', '5日', '到', None, None, '7日')
+        l_year = groups[0]
+        l_month = groups[1]
+        l_day = groups[2]
+        r_year = groups[4]
+        r_month = groups[5]
+        r_day = groups[6]
+        # 月日 到 日
+        if (l_month and l_day and r_day) and not (l_year or r_year or r_month):
+            old = r_day
+            text = text.replace(old, l_month + old)
+        # 年月日 到 月日
+        if (l_year and l_month and l_day and r_month and r_day) and not r_year:
+            old = r_month + r_day
+            text = text.replace(old, l_year + old)
+        # 年月日 到 日
+        if (l_year and l_month and l_day and r_day) and not (r_year or r_month):
+            old = r_day
+            text = text.replace(old, l_year + l_month + old)
+    return text
+
+
+def complete_week(text: str) -> str:
+    """前面补齐后面, `上周一到周三` -> `上周一到上周三`
+    """
+    com_res = RULES['com_week'].compiled.search(text, timeout=remaining_budget())
+    if com_res:
+        old = com_res.groups()[3] + com_res.groups()[4]
+        text = text.replace(old, com_res.groups()[0] + com_res.groups()[4])
+    return text
+
+
+# 前处理的改写步骤, 按顺序执行. 每一步的规则都必须含有某个字面量, 文本中一个都没有时
+# 直接跳过这一步, 不用调用正则. 字面量为`(任意一个, ...)`
+PREPROCESS_STEPS: Tuple[Tuple[Tuple[str, ...], Callable[[str], str]], ...] = (
+    (('年内',), rewrite_recent_in('year_in')),
+    (('季节内', '季度内'), rewrite_recent_in('season_in')),
+    (('个月内',), rewrite_recent_in('month_in')),
+    (('周内',), rewrite_recent_in('week_in')),
+    (('天内', '日内'), rewrite_recent_in('day_in')),
+    (('年前',), rewrite_year_before),
+    (('月前',), rewrite_month_before),
+)
+# 省略补全, 只针对`到`, `和`的情况
+COMPLETION_STEPS: Tuple[Tuple[Tuple[str, ...], Callable[[str], str]], ...] = (
+    # 后面补齐前面
+    (('年',), complete_unit('com_year', '年')),
+    (('季',), complete_unit('com_season', '季')),
+    (('月',), complete_unit('com_month', '月')),
+    (('日', '号', '天'), complete_unit('com_day', '号')),
+    # 前面补齐后面
+    (('季',), complete_year_season),
+    (('月',), complete_year_month),
+    (('月',), complete_year_month_day),
+    (('到周',), complete_week),
+)
+
+
+def apply_steps(text: str, steps: Tuple[Tuple[Tuple[str, ...], Callable[[str], str]], ...]) -> str:
+    """依次执行改写步骤, 跳过文本中没有所需字面量的步骤
+    """
+    for requires, rewrite in steps:
+        for word in requires:
+            if word in text:
+                text = rewrite(text)
+                break
+    return text
+
 
 def text_preprocess(text: str) -> str:
     """一些字符串的前处理, 包括词语的转换和一些省略说法的补全
@@ -1056,171 +1895,24 @@ def text_preprocess(text: str) -> str:
         '周七'
         
         >>> text_preprocess('六月2到3号')
-        '六月2号到3号'
+        '六月2号到六月3号'
         
         >>> text_preprocess('08年五到六月')
-        '08年五月到六月'
+        '08年五月到08年六月'
     """    
-
-    # 词语转换
-    week_rule = r'星期|礼拜'
-    weekend_rule = r'周日|周末|周天'
-    text = re.sub(week_rule, '周', text)
-    text = re.sub(weekend_rule, '周七', text)
-    text = text.replace('至', '到')
-    text = text.replace('到期', '过期')
-    text = text.replace('之内', '内')
-    text = text.replace('之前', '前')
-    text = text.replace('以前', '前')
-    text = text.replace('之后', '后')
-    text = text.replace('以后', '后')
-    # 单独的`现在`转为空, 时间段的`现在`不变
-    if '现在' in text and '到' not in text:
-        text = text.replace('现在', 'now')
-    text = text.replace('现在', '今天')
-    
-    # -------------------------------  `内`的转化  --------------------------------# 
-    year_in_rule = r'([0-9半一二两三四五六七八九十]+)(年)(内)'
-    res = re.search(year_in_rule, text)
-    if res:
-        groups = res.groups()
-        if groups[0] and groups[1] and groups[2]:
-            old = groups[0] + groups[1] + groups[2]
-            new = '最近' + groups[0] + groups[1] 
-            text = text.replace(old, new) 
-            
-    season_in_rule = r'([0-9一二两三四五六七八九十]+)(个季节|个季度)(内)'
-    res = re.search(season_in_rule, text)
-    if res:
-        groups = res.groups()
-        if groups[0] and groups[1] and groups[2]:
-            old = groups[0] + groups[1] + groups[2]
-            new = '最近' + groups[0] + groups[1] 
-            text = text.replace(old, new) 
-            
-    month_in_rule = r'([0-9一二两三四五六七八九十]+)(个月)(内)'
-    res = re.search(month_in_rule, text)
-    if res:
-        groups = res.groups()
-        if groups[0] and groups[1] and groups[2]:
-            old = groups[0] + groups[1] + groups[2]
-            new = '最近' + groups[0] + groups[1] 
-            text = text.replace(old, new) 
-            
-    week_in_rule = r'([0-9一二两三四五六七八九十]+)(周|个周)(内)'
-    res = re.search(week_in_rule, text)
-    if res:
-        groups = res.groups()
-        if groups[0] and groups[1] and groups[2]:
-            old = groups[0] + groups[1] + groups[2]
-            new = '最近' + groups[0] + groups[1] 
-            text = text.replace(old, new) 
-            
-    day_in_rule = r'([0-9一二两三四五六七八九十]+)(天|日)(内)'
-    res = re.search(day_in_rule, text)
-    if res:
-        groups = res.groups()
-        if groups[0] and groups[1] and groups[2]:
-            old = groups[0] + groups[1] + groups[2]
-            new = '最近' + groups[0] + groups[1] 
-            text = text.replace(old, new) 
-                
-    # ---------------------`前`的转化, 以区别`三月前`和`三月前三天` --------------------# 
-    if '年前' in text:
-        year_before_rule = r'[0-9一二两三四五六七八九十]+(个季|季|月|个月)'
-        res = re.search(year_before_rule, text)
-        if res:
-            text = text.replace('年前', '年偂')  
-            
-    if '月前' in text:
-        month_before_rule = r'[0-9一二两三四五六七八九十]+(天|日)'
-        res = re.search(month_before_rule, text)
-        if res:
-            text = text.replace('月前', '月偂')
-        
-    
-    # 省略补全, 只针对`到`, `和`的情况    
-    # if text.count('到') == 1 or text.count('和') == 1: 
-    if '到' in text or '和' in text: 
-        # ------------------------------ 后面补齐前面 ------------------------------#
-        # 年
-        com_rule = r'([0-9零一二两三四五六七八九十]+)(到|和)+(\S+年)'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            old = com_res.groups()[0]
-            text = text.replace(old, old + '年')
-            
-        # 季度
-        com_rule = r'([1-4一二三四]+)(到|和)+(\S+季)'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            old = com_res.groups()[0]
-            text = text.replace(old, old + '季')
-       
-        # 月份 
-        com_rule = r'([0-9零一二两三四五六七八九十]+)(到|和)+(\S+月)'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            old = com_res.groups()[0]
-            text = text.replace(old, old + '月')
-            
-        # 日
-        com_rule = r'([0-9零一二两三四五六七八九十]+)(到|和)+(\S+[日号天])'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            old = com_res.groups()[0]
-            text = text.replace(old, old + '号')
-            
-        # ------------------------------ 前面补齐后面 ------------------------------#
-        # 年/季度
-        com_rule = r'([0-9去今明零一二两三四五六七八九十]+年)(第*[1-4一二三四春夏秋冬]+个*)(季节|季度|季)(到|和)(第*[1-4一二三四春夏秋冬]+个*)(季节|季度|季)'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            groups = com_res.groups()  
-            old = groups[4]
-            text = text.replace(old,  groups[0] + old)
-            
-        # 年/月
-        com_rule = r'([0-9去今明零一二两三四五六七八九十]+年)(第*[0-9一二两三四五六七八九十]+)(月|个月|月份)(到|和)+(第*[0-9一二两三四五六七八九十]+)(月|个月|月份)'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            old = com_res.groups()[4] + com_res.groups()[5]
-            text = text.replace(old, com_res.groups()[0] + old)
-            
-        # 年月日
-        com_rule = r'([0-9去今明零一二两三四五六七八九十]+年)*([0-9一二两三四五六七八九十]+月)([0-9一二两三四五六七八九十]+[号|日])(到|和)([0-9零一二两三四五六七八九十]+年)*([0-9一二两三四五六七八九十]+月)*([0-9一二两三四五六七八九十]+[号|日])'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            groups = com_res.groups()  # (None, '3月', '5日', '到', None, None, '7日')
-            l_year = groups[0]
-            l_month = groups[1]
-            l_day = groups[2]
-            r_year = groups[4]
-            r_month = groups[5]
-            r_day = groups[6]
-            # 月日 到 日
-            if (l_month and l_day and r_day) and not (l_year or r_year or r_month):
-                old = r_day
-                text = text.replace(old, l_month + old)
-            # 年月日 到 月日
-            if (l_year and l_month and l_day and r_month and r_day) and not r_year:
-                old = r_month + r_day
-                text = text.replace(old, l_year + old)
-            # 年月日 到 日
-            if (l_year and l_month and l_day and r_day) and not (r_year or r_month):
-                old = r_day
-                text = text.replace(old,  l_year + l_month + old)
-                
-        com_rule = r'(上周|下周)([1-7一二三四五六七]+)(到)(周)([1-7一二三四五六七]+)'
-        com_res = re.search(com_rule, text)
-        if com_res:
-            old = com_res.groups()[3] + com_res.groups()[4]
-            text = text.replace(old, com_res.groups()[0] + com_res.groups()[4])
+    # 词语转换: 星期, 礼拜, 周末, 至, 到期, 之内, 之前, 以前, 之后, 以后, 以及现在
+    text = rewrite_words(text)
+    # `内`的转化, 以及`前`的转化
+    text = apply_steps(text, PREPROCESS_STEPS)
+    # 省略补全, 只针对`到`, `和`的情况
+    if '到' in text or '和' in text:
+        text = apply_steps(text, COMPLETION_STEPS)
     return text
 
 
 def get_legal_output(date: List) -> List:
-    """组织合理的返回结构, 并将一些不合规则的输入返回[]
+    """组织合理的返回结构, 并将一些不合规则的输入返回[]. 日期仍为datetime.date,
+    由`to_strings`或者`to_objects`在`cdt`返回时转换
     
     Args:
         date (List): 原始结果列表
@@ -1229,131 +1921,219 @@ def get_legal_output(date: List) -> List:
         List: 过滤后的列表
         
     Examples:
-        >>> get_legal_output(['2018-09-18', '2017-09-18'])
+        >>> get_legal_output([datetime.date(2018, 9, 18), datetime.date(2017, 9, 18)])
         []
         
-        >>> get_legal_output(['>=', '2018-9-18])
+        >>> get_legal_output(['>=', UnclampedDate(2018, 9, 31)])
         []
         
-        >>> get_legal_output(['2018-09-18', '2021-09-16'])
-        [('2018-09-18', '2021-09-16')]
+        >>> get_legal_output([datetime.date(2018, 9, 18), datetime.date(2021, 9, 16)])
+        [(datetime.date(2018, 9, 18), datetime.date(2021, 9, 16))]
     """
-    def is_leap_year(year: int) -> bool:
-        """闰年判断
-        """
-        if (year % 4 == 0 and year % 100 != 0) or (year % 400 == 0):
-            return True
-        return False
-        
-    
-    def date_correct(date_str: str) -> str:
-        """对具体月份日期的纠正, 考虑闰年的情况
-        Args:
-            date_str (str): 输入的年月日
-        
-        Returns:
-            str: 纠正后的日期年月日
-        """
-        # logger.debug(f'{date_str}')
-        year, month, day = date_str.split('-')
-        if int(day) >= 31 and month in SMALL_MONTH:
-            return date_str[:-2] + '30'
-        if month == '02' and int(day) >= 29:
-            if is_leap_year(int(year)):
-                return date_str[:-2] + '29'
-            return date_str[:-2] + '28'
-        return date_str
-            
-            
-    def is_start_smaller(start: str, end: str) -> bool:
-        """判断开始日期是否比结束日期小
-
-        Args:
-            start (str): 开始日期
-            end (str): 结束日期
-
-        Returns:
-            bool
-        """
-        year_st, month_st, day_st = start.split('-')
-        year_ed, month_ed, day_ed = end.split('-')
-        # 年份小, 满足
-        if int(year_st) < int(year_ed):
-            return True
-        # 年份相等, 比月份
-        if int(year_st) == int(year_ed):
-            # 月份小, 满足
-            if int(month_st) < int(month_ed):
-                return True
-            # 月份相等, 比日期
-            if int(month_st) == int(month_ed):
-                return True if int(day_st) <= int(day_ed) else False
-            # 月份大, 不满足
-            return False
-        # 年份大, 不满足
-        return False
-        
     # 长度判断
     if len(date) != 2:
         # logger.debug(f'结果列表不是标准长度: {date}')
         return []
 
-    ## ------------------------- 时间点, ['<=', 'YYYY-MM-DD'] --------------------- ##
+    ## ------------------------- 时间点, ['<=', date] --------------------- ##
     if date[0] in OP:
-        if len(date[1]) != 10:
-            # logger.debug(f'结果不是标准长度: {date}')
+        if not isinstance(date[1], datetime.date):
+            # logger.debug(f'结果不是日期: {date}')
             return []
-        date[1] = date_correct(date[1])
         return [tuple(date)]
     
-    ## ---------------------- 时间段, ['YYYY-MM-DD', 'YYYY-MM-DD'] ---------------- ##
+    ## ---------------------- 时间段, [date, date] ---------------- ##
     st = date[0]
     ed = date[1]
-    # 判断长度是否合法
-    if len(st) != 10 or len(ed) != 10:
-        # logger.debug(f'结果不是标准长度: {date}')
+    # 判断是否为日期
+    if not isinstance(st, datetime.date) or not isinstance(ed, datetime.date):
+        # logger.debug(f'结果不是日期: {date}')
         return []
     # 判断日期大小是否合法
-    if not is_start_smaller(st, ed):
+    if st > ed:
         # logger.debug(f'结果不符合常识: {date}')
         return []
-    # 纠正各个月份的日期
-    date[0] = date_correct(st)
-    date[1] = date_correct(ed)
     return [tuple(date)]
 
-        
-def combine_result(total_groups: Tuple) -> List:
+
+class DateRange(NamedTuple):
+    """时间段, 首尾都包含
+    """
+    start: datetime.date
+    end: datetime.date
+
+
+class DatePoint(NamedTuple):
+    """时间点, op为`>=`, `<=`, `=`之一
+    """
+    op: str
+    date: datetime.date
+
+
+def to_objects(res: List[Tuple]) -> List[Union[DateRange, DatePoint]]:
+    """将`get_legal_output`的结果转为DateRange/DatePoint, 即`cdt(as_objects=True)`的返回值
+
+    Args:
+        res (List[Tuple]): `get_legal_output`的结果
+
+    Returns:
+        List[Union[DateRange, DatePoint]]: 对应的结果对象
+
+    Examples:
+        >>> to_objects([('>=', datetime.date(2024, 7, 9))])
+        [DatePoint(op='>=', date=datetime.date(2024, 7, 9))]
+    """
+    return [DatePoint(first, second) if first in OP else DateRange(first, second) for first, second in res]
+
+
+def to_strings(res: List[Tuple]) -> List[Tuple[str, str]]:
+    """将`get_legal_output`的结果转为'YYYY-MM-DD', 即`cdt`默认的返回值
+
+    Examples:
+        >>> to_strings([('>=', datetime.date(2024, 7, 9))])
+        [('>=', '2024-07-09')]
+    """
+    return [(first, format_date(second)) if first in OP else (format_date(first), format_date(second))
+            for first, second in res]
+
+        
+# `周`后面可以跟的星期几
+WEEKDAY_CHAR = frozenset('1234567一二三四五六七')
+
+
+def skip_chars(text: str, pos: int, chars: str) -> int:
+    """方法segment的辅助方法, 从pos开始跳过连续的chars中的字符, 返回新的位置
+    """
+    length = len(text)
+    while pos < length and text[pos] in chars:
+        pos += 1
+    return pos
+
+
+def segment(text: str) -> Tuple:
+    r"""将文本切分为年, 季, 月, 周, 日五个分组, 供`combine_result`使用
+
+    与下面的正则的`search(text).groups()`结果完全一致, 但不需要回溯, 只扫描一遍:
+    (\S+年前*后*)?(\S+季前*后*)?(\S+月份*前*后*)?(\S*[0-9一二两三四五六七八九十]*周前*后*[1-7一二三四五六七]*)?(\S+[0-9一二两三四五六七八九十]*[号日天]前*后*)?
+
+    正则总是在位置0匹配, 所以只看第一个空白之前的部分. 每个分组依次从上个分组结束的位置开始,
+    贪婪地取到该粒度最后一个标志字, 再带上后面的`份`, `前`, `后`和星期几. 除`周`以外,
+    标志字前面至少要有一个字符
+
+    Args:
+        text (str): 前处理后的文本
+
+    Returns:
+        Tuple: (年, 季, 月, 周, 日), 没有的为None
+
+    Examples:
+        >>> segment('18年4月十号')
+        ('18年', None, '4月', None, '十号')
+    """
+    # 第一个空白之前的部分, 以空白开头的为空
+    token = text.split(None, 1)[0] if text and not text[0].isspace() else ''
+    year = season = month = week = day = None
+    pos = 0
+    # 年
+    idx = token.rfind('年', pos + 1)
+    if idx != -1:
+        idx = skip_chars(token, skip_chars(token, idx + 1, '前'), '后')
+        year = token[pos:idx]
+        pos = idx
+    # 季
+    idx = token.rfind('季', pos + 1)
+    if idx != -1:
+        idx = skip_chars(token, skip_chars(token, idx + 1, '前'), '后')
+        season = token[pos:idx]
+        pos = idx
+    # 月
+    idx = token.rfind('月', pos + 1)
+    if idx != -1:
+        idx = skip_chars(token, skip_chars(token, skip_chars(token, idx + 1, '份'), '前'), '后')
+        month = token[pos:idx]
+        pos = idx
+    # 周, 前面可以没有字符
+    idx = token.rfind('周', pos)
+    if idx != -1:
+        idx = skip_chars(token, skip_chars(token, skip_chars(token, idx + 1, '前'), '后'), WEEKDAY_CHAR)
+        week = token[pos:idx]
+        pos = idx
+    # 日
+    idx = max(token.rfind('号', pos + 1), token.rfind('日', pos + 1), token.rfind('天', pos + 1))
+    if idx != -1:
+        idx = skip_chars(token, skip_chars(token, idx + 1, '前'), '后')
+        day = token[pos:idx]
+    return year, season, month, week, day
+
+
+def with_year(day: datetime.date, year: int) -> datetime.date:
+    """换成另一年的同一天, 月末仍为月末, 如`2023-02-28`换到2024年为`2024-02-29`
+    """
+    if day.day == CALENDAR.days_in_month(day.year, day.month):
+        return CALENDAR.month_end(year, day.month)
+    return make_date(year, day.month, day.day)
+
+
+def with_day(month: DateLike, day: DateLike) -> datetime.date:
+    """`month`所在的年月, `day`的日, 超过该月天数的取月末
+    """
+    return make_date(month.year, month.month, day.day)
+
+
+def clamp_day(day: DateLike) -> datetime.date:
+    """超过该月天数的日取月末, 如`6月31日`为`6月30日`
+    """
+    return with_day(day, day)
+
+
+def month_before_end(month: DateLike) -> datetime.date:
+    """`month`所在月份的上个月的月末, 如`2024-03-01`为`2024-02-29`, `2024-01-01`为`2023-12-31`
+    """
+    if month.month == 1:
+        return CALENDAR.month_end(month.year - 1, 12)
+    return CALENDAR.month_end(month.year, month.month - 1)
+
+
+def combine_result(total_groups: Tuple, reference_date: Union[ReferenceDate, DateContext] = None) -> List:
     """组织各个函数的结果, 以天为粒度返回结果时间点或者时间段
 
     Args:
         total_groups (Tuple): 通过全部规则搜索后的分组
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间或其锚点.
+                                    Defaults to None, 即当前时间.
 
     Returns:
         List: 时间点或者时间段, 没有符合的则返回空列表
     """
     try:
         # logger.debug(f'{total_groups}')
-        ## ------------------------ 每个子函数的结果 -------------------------##
+        now = get_date_context(reference_date)
+        ## ------------------- 每个子函数的结果, 只调用有分组的函数 ------------------##
+        year = season = month = week = day = None
         # 年
-        year = year_trans(total_groups[0]) if total_groups[0] else None
+        if total_groups[0]:
+            DISPATCH_STATS['year'] += 1
+            year = year_trans(total_groups[0], reference_date=now)
         # 季
         if total_groups[1]:
-            season = season_trans(total_groups[1], year_flag=1) if total_groups[0] else season_trans(total_groups[1])
-        else:
-            season = None
+            DISPATCH_STATS['season'] += 1
+            season = season_trans(total_groups[1], year_flag=bool(total_groups[0]), reference_date=now)
         # 月
         if total_groups[2]:
-            month = month_trans(total_groups[2], year_flag=1) if total_groups[0] else month_trans(total_groups[2])
-        else:
-            month = None    
+            DISPATCH_STATS['month'] += 1
+            month = month_trans(total_groups[2], year_flag=bool(total_groups[0]), reference_date=now)
         # 周
-        week = week_trans(total_groups[3]) if total_groups[3] else None
+        if total_groups[3]:
+            DISPATCH_STATS['week'] += 1
+            week = week_trans(total_groups[3], reference_date=now)
         # 日
         if total_groups[4]:
-            day = day_trans(total_groups[4], month_flag=1) if total_groups[2] else day_trans(total_groups[4])
-        else:
-            day = None
+            DISPATCH_STATS['day'] += 1
+            day = day_trans(total_groups[4], month_flag=bool(total_groups[2]), reference_date=now)
+        # 月份不合法(如`13月`)时其余部分组合出来的结果不可信. 其他分组没能转换时照旧用其余部分,
+        # 如`2月30号`为整个2月
+        if isinstance(month, InvalidMonth):
+            return []
         
         ## ------------------------ 结果的组合逻辑 -------------------------##
         # 只有年            
@@ -1368,61 +2148,323 @@ def combine_result(total_groups: Tuple) -> List:
         # 只有周
         if week and not (year or season or month or day):
             return week 
-        # 只有天
+        # 只有天, `n号前/后`的日期在这里按参考月份截断
         if day and not (year or season or month or week):
+            if day[0] in OP:
+                return [day[0], clamp_day(day[1])]
             return day 
         
         # 年/季节, 都是时间段
         if (year and season) and not (month or week or day):
-            res_year = year[0].split('-')[0]    
-            return [res_year + season[0][4:], res_year + season[1][4:]]
+            if year[0] in OP:
+                return []
+            res_year = year[0].year
+            return [season[0].replace(year=res_year), season[1].replace(year=res_year)]
         
         # 年/月, 都是时间段
         if (year and month) and not (season or week or day):
-            res_year = year[0].split('-')[0]
+            res_year = year[0].year
             if month[0] in OP:
                 # 2019年1月前这种的特殊处理, 年份-1
-                if month[0] == '<=' and month[1][-6:] == '-12-31':
-                    return [month[0], str(int(res_year) - 1) + month[1][4:]]
-                return [month[0], res_year + month[1][4:]]
-            return [res_year + month[0][4:], res_year + month[1][4:]]
+                if month[0] == '<=' and (month[1].month, month[1].day) == (12, 31):
+                    return [month[0], datetime.date(res_year - 1, 12, 31)]
+                return [month[0], with_year(month[1], res_year)]
+            return [with_year(month[0], res_year), with_year(month[1], res_year)]
         
         # 月/日, 月是时间段, 日是{时间点, 时间段}
         if (month and day) and not (year or season or week):
             # 7月30日, 返回的是时间点
             if day[0] in OP:
-                # 1号之前的处理
-                if day[1][-2:] == '31' and day[0] == '<=':
-                    # 1月1日, 年份-1, 月份=12
-                    if month[0][5:7] == '01':
-                        year_res = str(int(month[0][:4]) - 1)
-                        month_res = '12'
-                        return [day[0], year_res + '-' + month_res + '-31']
-                    # 4月1日的特殊处理, 月份-1
-                    month_res = str(int(month[0][5:7]) - 1)
-                    month_res = '0' + month_res if len(month_res) == 1 else month_res
-                    return [day[0], month[0][0:5] + month_res + '-31']
-                return [day[0], month[0][:-3] + day[1][-3:]]
+                # 1号之前的处理, 此时的日期为上个月的月末
+                if day[0] == '<=' and (day[1].year, day[1].month) != (now.this_year, now.this_month):
+                    return [day[0], month_before_end(month[0])]
+                return [day[0], with_day(month[0], day[1])]
             
             # 7月前30日, 返回的是时间段
-            return [month[0][:-3] + day[0][-3:], month[0][:-3] + day[1][-3:]]
+            return [with_day(month[0], day[0]), with_day(month[0], day[1])]
         
         
         # 年/月/日 , 年月是时间段, 日是时间点
         if (year and month and day) and not (season or week):
             if day[0] in OP:
-                res_year = year[0].split('-')[0]
-                res_month = month[0].split('-')[1]
-                res_day = day[1].split('-')[2]
-                return [day[0], res_year + '-' + res_month + '-' + res_day]
+                res_month = UnclampedDate(year[0].year, month[0].month, 1)
+                # 2024年3月1号前, 同样是上个月的月末
+                if day[0] == '<=' and (day[1].year, day[1].month) != (now.this_year, now.this_month):
+                    return [day[0], month_before_end(res_month)]
+                return [day[0], with_day(res_month, day[1])]
         return []
     
-    except Exception:
-        traceback.print_exc()
+    except TimeoutError:
+        raise
+    except Exception as e:
+        report_error('combine_result', ''.join(filter(None, total_groups)), e)
         return []
 
 
-def cdt(text: str) -> List:
+class CacheInfo(NamedTuple):
+    """结果缓存的统计
+    """
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class ResultCache(object):
+    """有界的LRU结果缓存, 键为(前处理后的文本, 参考日期)
+
+    参考日期是键的一部分, 换日之后`今天`, `上个月`等相对说法自然不会命中旧的结果,
+    旧的结果按LRU逐渐被淘汰
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        assert maxsize > 0, f'maxsize <= 0'
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[List]:
+        with self._lock:
+            res = self._data.get(key)
+            if res is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return res
+
+    def put(self, key: Tuple[str, str], res: List) -> None:
+        with self._lock:
+            self._data[key] = res
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.evictions, self.maxsize, len(self._data))
+
+
+# 默认不开启缓存
+_RESULT_CACHE: Optional[ResultCache] = None
+
+
+def enable_cache(maxsize: int = 1024) -> ResultCache:
+    """开启`cdt`的结果缓存, 已经开启的会被替换为新的空缓存
+
+    Args:
+        maxsize (int, optional): 最多缓存的结果数. Defaults to 1024.
+
+    Returns:
+        ResultCache: 新的缓存
+    """
+    global _RESULT_CACHE
+    _RESULT_CACHE = ResultCache(maxsize)
+    return _RESULT_CACHE
+
+
+def disable_cache() -> None:
+    """关闭并丢弃结果缓存
+    """
+    global _RESULT_CACHE
+    _RESULT_CACHE = None
+
+
+def cache_info() -> Optional[CacheInfo]:
+    """结果缓存的命中, 未命中, 淘汰次数, 没有开启缓存返回None
+    """
+    cache = _RESULT_CACHE
+    return cache.info() if cache is not None else None
+
+
+def dispatch_info() -> Dict[str, int]:
+    """分派的计数, 见`DISPATCH_STATS`
+    """
+    return dict(DISPATCH_STATS)
+
+
+def reset_dispatch_info() -> None:
+    """清空分派的计数
+    """
+    DISPATCH_STATS.clear()
+
+
+# ---------------------------------- 埋点 ---------------------------------- #
+
+# 各个阶段对应的函数名. 开启埋点时用计时的包装替换模块中的同名函数, 关闭时换回原函数,
+# 所以关闭时没有任何额外开销
+PROFILE_STAGES = {
+    'preprocess': ('text_preprocess',),
+    'segment': ('segment',),
+    'translate': ('year_trans', 'season_trans', 'month_trans', 'week_trans', 'day_trans'),
+    'combine': ('combine_result',),
+    'legalize': ('get_legal_output',),
+}
+
+# 每条规则的调用次数, 命中次数和累计耗时(秒), 以及每个阶段的调用次数和不含子阶段的累计耗时(秒)
+RULE_ATTEMPTS = Counter()
+RULE_HITS = Counter()
+RULE_TIME = Counter()
+STAGE_CALLS = Counter()
+STAGE_TIME = Counter()
+# 正在计时的阶段, 每层记录子阶段的耗时, 用于扣除
+_STAGE_STACK: List[float] = []
+_PROFILING = False
+
+
+class RuleStats(NamedTuple):
+    """一条规则的统计
+    """
+    attempts: int
+    hits: int
+    seconds: float
+
+
+class StageStats(NamedTuple):
+    """一个阶段的统计, 耗时不含嵌套在其中的其他阶段
+    """
+    calls: int
+    seconds: float
+
+
+class ProfileInfo(NamedTuple):
+    """`profile_info`的返回值
+    """
+    rules: Dict[str, RuleStats]
+    stages: Dict[str, StageStats]
+
+
+class InstrumentedPattern(object):
+    """开启埋点时替换`Rule.compiled`, 记录规则的调用次数, 命中次数和耗时
+
+    `search`一次算一次调用, `sub`, `finditer`有匹配即算命中. 其余属性转给原正则
+    """
+
+    def __init__(self, name: str, pattern: 're.Pattern'):
+        self.name = name
+        self.pattern = pattern
+
+    def __getattr__(self, attr: str):
+        return getattr(self.pattern, attr)
+
+    def record(self, hit: bool, cost: float) -> None:
+        RULE_ATTEMPTS[self.name] += 1
+        RULE_TIME[self.name] += cost
+        if hit:
+            RULE_HITS[self.name] += 1
+
+    def search(self, *args, **kwargs) -> Optional['re.Match']:
+        st = time.perf_counter()
+        res = self.pattern.search(*args, **kwargs)
+        self.record(res is not None, time.perf_counter() - st)
+        return res
+
+    def sub(self, *args, **kwargs) -> str:
+        st = time.perf_counter()
+        res, count = self.pattern.subn(*args, **kwargs)
+        self.record(count > 0, time.perf_counter() - st)
+        return res
+
+    def finditer(self, *args, **kwargs) -> Iterator['re.Match']:
+        st = time.perf_counter()
+        matches = list(self.pattern.finditer(*args, **kwargs))
+        self.record(bool(matches), time.perf_counter() - st)
+        return iter(matches)
+
+
+def timed_stage(stage: str, func: Callable) -> Callable:
+    """给阶段函数计时的包装, 耗时扣除其中嵌套的阶段
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        _STAGE_STACK.append(0.0)
+        st = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            cost = time.perf_counter() - st
+            STAGE_CALLS[stage] += 1
+            STAGE_TIME[stage] += cost - _STAGE_STACK.pop()
+            if _STAGE_STACK:
+                _STAGE_STACK[-1] += cost
+    return wrapper
+
+
+def enable_profiling() -> None:
+    """开启埋点: 每条规则的调用次数, 命中次数和耗时, 以及各个阶段的耗时, 见`profile_info`
+
+    统计不加锁, 多线程下为近似值. 进程池的子进程各自统计, 不会汇总到主进程
+    """
+    global _PROFILING
+    if _PROFILING:
+        return
+    for rule in RULES.values():
+        rule.__dict__['compiled'] = InstrumentedPattern(rule.name, rule.compiled)
+    for chain in CHAINS.values():
+        chain.merged = False
+    module = globals()
+    for stage, names in PROFILE_STAGES.items():
+        for name in names:
+            module[name] = timed_stage(stage, module[name])
+    _PROFILING = True
+
+
+def disable_profiling() -> None:
+    """关闭埋点, 换回原正则和原函数. 已有的统计保留
+    """
+    global _PROFILING
+    if not _PROFILING:
+        return
+    for rule in RULES.values():
+        rule.__dict__['compiled'] = rule.compiled.pattern
+    for chain in CHAINS.values():
+        chain.merged = True
+    module = globals()
+    for names in PROFILE_STAGES.values():
+        for name in names:
+            module[name] = module[name].__wrapped__
+    _PROFILING = False
+
+
+def profile_info() -> ProfileInfo:
+    """埋点统计的快照, 规则按累计耗时从大到小排列
+
+    Examples:
+        >>> enable_profiling()
+        >>> cdt('上周三', reference_date='2021-07-14')
+        [('=', '2021-07-07')]
+        >>> profile_info().rules['recent_weekday']
+        RuleStats(attempts=1, hits=1, seconds=2.1e-06)
+    """
+    rules = {name: RuleStats(RULE_ATTEMPTS[name], RULE_HITS[name], RULE_TIME[name])
+             for name in sorted(RULE_ATTEMPTS, key=RULE_TIME.__getitem__, reverse=True)}
+    stages = {stage: StageStats(STAGE_CALLS[stage], STAGE_TIME[stage])
+              for stage in PROFILE_STAGES if STAGE_CALLS[stage]}
+    return ProfileInfo(rules, stages)
+
+
+def reset_profile_info() -> None:
+    """清空埋点统计
+    """
+    for stats in (RULE_ATTEMPTS, RULE_HITS, RULE_TIME, STAGE_CALLS, STAGE_TIME):
+        stats.clear()
+
+
+def cdt(text: str, reference_date: Union[ReferenceDate, DateContext] = None, as_objects: bool = False) -> List:
     """将中文的日期转化为标准时间日期符串
     
     支持年, 季, 月, 周, 日,以及他们的合理组合, 返回的粒度都为`日`
@@ -1431,9 +2473,14 @@ def cdt(text: str) -> List:
     
     Args:
         text (str): 输入文本
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间, 相对的说法都以此
+                                    推算, 可用于按日志原始时间重新处理历史数据. Defaults to None,
+                                    即当前时间.
+        as_objects (bool, optional): 返回DateRange/DatePoint而不是字符串元组. Defaults to False.
     
     Returns:
-        List: 转化过后的时间, `和`表示的长度为2, 正常的长度为1, 不能转化或者转化出错返回空列表
+        List: 转化过后的时间, `和`表示的长度为2, 正常的长度为1, 不能转化或者转化出错返回空列表,
+              超出`set_budget`的预算返回`BudgetExceeded`
         
     Examples:
         >>> cdt('上三')
@@ -1453,213 +2500,701 @@ def cdt(text: str) -> List:
         
         >>> cdt('张飞和关羽三月份和七月份的饭量')
         [('2021-03-01', '2021-03-31'), ('2021-07-01', '2021-07-31')]
+
+        >>> cdt('去年', as_objects=True)
+        [DateRange(start=datetime.date(2020, 1, 1), end=datetime.date(2020, 12, 31))]
     """
     try:
-        text = text_preprocess(text)
-        # logger.debug(f'after text_preprocess: {text}')
-        total_rule = r"(\S+年前*后*)?(\S+季前*后*)?(\S+月份*前*后*)?(\S*[0-9一二两三四五六七八九十]*周前*后*[1-7一二三四五六七]*)?(\S+[0-9一二两三四五六七八九十]*[号日天]前*后*)?"
-        
-        # ---------------------- 到, res = [('YYYY-MM-DD, YYYY-MM-DD')] ---------------- #
-        if '到' in text:
-            split_list = text.split('到')
-            # logger.debug(f'根据`到`分割后的列表: {split_list}')
-            until_flag = False
-            # 找到匹配的时间就返回
-            for idx in range(len(split_list) - 1):
-                time_st = split_list[idx]
-                time_ed = split_list[idx+1]
-                time_st_find = re.search(total_rule, time_st)
-                time_ed_find = re.search(total_rule, time_ed)
-                st_groups = time_st_find.groups()
-                ed_groups = time_ed_find.groups()
-                # 排除普通的`和`的情况
-                if any(st_groups) and any(ed_groups):
-                    until_flag = True
-                    break
-            if until_flag == True:
-                st_res = combine_result(st_groups)
-                ed_res = combine_result(ed_groups)
-                # 前面是时间点
-                if st_res[0] in OP:
-                    res = [st_res[1], ed_res[1]]
-                    return get_legal_output(res)
-                # 前面是时间段
-                if st_res[0] not in OP:
-                    res = [st_res[0], ed_res[1]]
-                    return get_legal_output(res)
-                    
-        # ---- 和, res = [('YYYY-MM-DD, YYYY-MM-DD'), ('YYYY-MM-DD', 'YYYY-MM-DD')] --- #
-        if '和' in text:
-            split_list = text.split('和')
-            # logger.debug(f'根据`和`分割后的列表: {split_list}')
-            and_flag = False
-            # 找到匹配的时间就返回
-            for idx in range(len(split_list) - 1):
-                time_st = split_list[idx]
-                time_ed = split_list[idx+1]
-                time_st_find = re.search(total_rule, time_st)
-                time_ed_find = re.search(total_rule, time_ed)
-                st_groups = time_st_find.groups()
-                ed_groups = time_ed_find.groups()
-                # 排除一般的`和`的情况
-                if any(st_groups) and any(ed_groups):
-                    and_flag = True
-                    break
-            if and_flag:
-                st_res = combine_result(st_groups)
-                ed_res = combine_result(ed_groups)
-                # 将两个时间合并起来
-                res1 = get_legal_output(st_res)
-                res2 = get_legal_output(ed_res)
-                if res1 and res2:
-                    res1.extend(res2)
-                    return res1
-        
-        # ------------------- 一般情况, res = [('YYYY-MM-DD, YYYY-MM-DD')] ------------- #
-        time_find = re.search(total_rule, text)
-        groups = time_find.groups()
-        # 一般情况
-        if any(groups):
-            res = combine_result(groups)
-            return get_legal_output(res)
-        # `最近`没有指明时间, 默认为`最近10天`
-        if '最近' in text:
-            return cdt('最近10天')
+        # 预过滤: 不是字符串, 或者没有任何触发字符的文本不是日期
+        if not isinstance(text, str) or TRIGGER_CHAR.isdisjoint(text):
+            DISPATCH_STATS['rejected'] += 1
+            return []
+        # 超长的输入不处理
+        if _MAX_TEXT_LENGTH is not None and len(text) > _MAX_TEXT_LENGTH:
+            DISPATCH_STATS['over_length'] += 1
+            return BudgetExceeded('length')
+        DISPATCH_STATS['translated'] += 1
+        now = get_date_context(reference_date)
+        # 嵌套的调用沿用外层的截止时间
+        if _TIME_BUDGET is None or _BUDGET.deadline is not None:
+            res = preprocess_translate(text, now)
+        else:
+            _BUDGET.deadline = time.perf_counter() + _TIME_BUDGET
+            try:
+                res = preprocess_translate(text, now)
+            except TimeoutError:
+                DISPATCH_STATS['timeout'] += 1
+                return BudgetExceeded('timeout')
+            finally:
+                _BUDGET.deadline = None
+        # 只在这里把日期转为字符串或者结果对象
+        return to_objects(res) if as_objects else to_strings(res)
+
+    except TimeoutError:
+        # 交给最外层的调用处理
+        raise
+    except Exception as e:
+        report_error('cdt', text, e)
         return []
+
+
+def preprocess_translate(text: str, now: DateContext) -> List:
+    """前处理, 再查缓存或者转换
+    """
+    text = text_preprocess(text)
+    # logger.debug(f'after text_preprocess: {text}')
+    cache = _RESULT_CACHE
+    if cache is None:
+        return translate(text, now)
+    key = (text, now.today)
+    res = cache.get(key)
+    if res is None:
+        res = translate(text, now)
+        cache.put(key, res)
+    return list(res)
+
+
+def translate(text: str, now: DateContext) -> List:
+    """`cdt`的主体, 输入为前处理后的文本
+
+    Args:
+        text (str): `text_preprocess`处理后的文本
+        now (DateContext): 参考时间的锚点
+
+    Returns:
+        List: 同`cdt`
+    """
+    # ---------------------- 到, res = [('YYYY-MM-DD, YYYY-MM-DD')] ---------------- #
+    if '到' in text:
+        split_list = text.split('到')
+        # logger.debug(f'根据`到`分割后的列表: {split_list}')
+        until_flag = False
+        # 找到匹配的时间就返回, 每一段只切分一次
+        st_groups = segment(split_list[0])
+        for idx in range(1, len(split_list)):
+            remaining_budget()
+            ed_groups = segment(split_list[idx])
+            # 排除普通的`和`的情况
+            if any(st_groups) and any(ed_groups):
+                until_flag = True
+                break
+            st_groups = ed_groups
+        if until_flag == True:
+            st_res = combine_result(st_groups, reference_date=now)
+            ed_res = combine_result(ed_groups, reference_date=now)
+            # 前面是时间点
+            if st_res[0] in OP:
+                res = [st_res[1], ed_res[1]]
+                return get_legal_output(res)
+            # 前面是时间段
+            if st_res[0] not in OP:
+                res = [st_res[0], ed_res[1]]
+                return get_legal_output(res)
+                
+    # ---- 和, res = [('YYYY-MM-DD, YYYY-MM-DD'), ('YYYY-MM-DD', 'YYYY-MM-DD')] --- #
+    if '和' in text:
+        split_list = text.split('和')
+        # logger.debug(f'根据`和`分割后的列表: {split_list}')
+        and_flag = False
+        # 找到匹配的时间就返回, 每一段只切分一次
+        st_groups = segment(split_list[0])
+        for idx in range(1, len(split_list)):
+            remaining_budget()
+            ed_groups = segment(split_list[idx])
+            # 排除一般的`和`的情况
+            if any(st_groups) and any(ed_groups):
+                and_flag = True
+                break
+            st_groups = ed_groups
+        if and_flag:
+            st_res = combine_result(st_groups, reference_date=now)
+            ed_res = combine_result(ed_groups, reference_date=now)
+            # 将两个时间合并起来
+            res1 = get_legal_output(st_res)
+            res2 = get_legal_output(ed_res)
+            if res1 and res2:
+                res1.extend(res2)
+                return res1
     
-    except Exception:
-        traceback.print_exc()
+    # ------------------- 一般情况, res = [('YYYY-MM-DD, YYYY-MM-DD')] ------------- #
+    groups = segment(text)
+    # 一般情况
+    if any(groups):
+        res = combine_result(groups, reference_date=now)
+        return get_legal_output(res)
+    # `最近`没有指明时间, 默认为`最近10天`
+    if '最近' in text:
+        return preprocess_translate('最近10天', now)
+    return []
+
+
+def cdt_batch(texts: Iterable[str], reference_date: Union[ReferenceDate, DateContext] = None,
+              as_objects: bool = False) -> List[List]:
+    """批量转换, 整批文本共用一个参考时间, 锚点(当年, 当月, 上周日, 当前季度等)只推算一次
+
+    Args:
+        texts (Iterable[str]): 输入文本
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间. Defaults to None,
+                                    即当前时间.
+        as_objects (bool, optional): 同`cdt`. Defaults to False.
+
+    Returns:
+        List[List]: 与输入顺序一致的转换结果, 每一项和`cdt`的返回值相同
+
+    Examples:
+        >>> cdt_batch(['去年', '上周三'], reference_date='2021-07-14')
+        [[('2020-01-01', '2020-12-31')], [('=', '2021-07-07')]]
+    """
+    ctx = get_date_context(reference_date)
+    return [cdt(text, reference_date=ctx, as_objects=as_objects) for text in texts]
+
+
+class WorkerSettings(NamedTuple):
+    """主进程中的设置, spawn/forkserver启动的子进程不会继承, 由initializer重新设置
+
+    Attributes:
+        max_length (Optional[int]): 同`set_budget`
+        timeout (Optional[float]): 同`set_budget`
+        cache_size (Optional[int]): 结果缓存的大小, 没有开启缓存时为None
+        rule_order (Dict[str, List[Optional[str]]]): 各个规则链的顺序, 同`rule_order`
+        calendar_range (Tuple[int, int]): 日历表覆盖的年份, 同`set_calendar_range`
+        number_memo (Tuple[int, int]): `number_translator`备忘表的大小和最大长度, 同`set_number_memo`
+    """
+    max_length: Optional[int]
+    timeout: Optional[float]
+    cache_size: Optional[int]
+    rule_order: Dict[str, List[Optional[str]]]
+    calendar_range: Tuple[int, int]
+    number_memo: Tuple[int, int]
+
+
+def worker_settings() -> WorkerSettings:
+    """当前进程的设置, 作为`warm_worker`的参数传给子进程
+    """
+    cache = _RESULT_CACHE
+    return WorkerSettings(_MAX_TEXT_LENGTH, _TIME_BUDGET, cache.maxsize if cache is not None else None,
+                          rule_order(), (CALENDAR.first_year, CALENDAR.last_year),
+                          (NUMBER_MEMO.maxsize, NUMBER_MEMO.max_length))
+
+
+def apply_worker_settings(settings: WorkerSettings) -> None:
+    """在子进程中恢复`worker_settings`记录的设置
+    """
+    set_budget(settings.max_length, settings.timeout)
+    if settings.cache_size is None:
+        disable_cache()
+    else:
+        enable_cache(settings.cache_size)
+    # 顺序都由组内排序得到, 以排名作为命中次数再排一次即可还原
+    reorder_rules({name: -idx for names in settings.rule_order.values() for idx, name in enumerate(names) if name})
+    set_calendar_range(*settings.calendar_range)
+    set_number_memo(*settings.number_memo)
+
+
+def warm_worker(settings: Optional[WorkerSettings] = None, initializer: Optional[Callable] = None,
+                initargs: Tuple = ()) -> None:
+    """进程池的initializer, 编译全部规则后先走一遍各个粒度的转换
+
+    Args:
+        settings (Optional[WorkerSettings], optional): 主进程的`worker_settings()`, 先于预热恢复.
+                                    Defaults to None, 即使用子进程自己的设置.
+        initializer (Optional[Callable], optional): 预热之后再调用的initializer. Defaults to None.
+        initargs (Tuple, optional): `initializer`的参数. Defaults to ().
+    """
+    if settings is not None:
+        apply_worker_settings(settings)
+    warmup()
+    cdt_batch(['18年4月十号到二零二零年5月4日', '去年第一季度和上周三', '最近三个月'])
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def iter_batches(texts: Iterable[str], size: int) -> Iterator[List[str]]:
+    """按`size`条一批切分输入, 不会一次性读入全部文本
+    """
+    batch = []
+    for text in texts:
+        batch.append(text)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def cdt_parallel(texts: Iterable[str], workers: Optional[int] = None, chunksize: int = 256,
+                 reference_date: Union[ReferenceDate, DateContext] = None, as_objects: bool = False,
+                 initializer: Optional[Callable] = None, initargs: Tuple = ()) -> Iterator[List]:
+    """多进程批量转换, 按输入顺序流式返回结果
+
+    输入按`chunksize`条一批分给进程池, 同时在处理中的批次不超过`2 * workers`,
+    因此无论输入多大, 内存占用都是有界的. 参考时间在主进程中确定一次, 所有进程共用.
+    预算, 缓存, 规则顺序等设置也由主进程传给子进程, 见`worker_settings`
+
+    Args:
+        texts (Iterable[str]): 输入文本, 可以是文件对象等惰性的迭代器
+        workers (Optional[int], optional): 进程数. Defaults to None, 即CPU核数. 为1时不启动进程池
+        chunksize (int, optional): 每批的文本条数. Defaults to 256.
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间. Defaults to None,
+                                    即当前时间.
+        as_objects (bool, optional): 同`cdt`. Defaults to False.
+        initializer (Optional[Callable], optional): 子进程预热之后调用的initializer, 需要可以pickle.
+                                    Defaults to None.
+        initargs (Tuple, optional): `initializer`的参数. Defaults to ().
+
+    Yields:
+        List: 与输入顺序一致的转换结果, 每一项和`cdt`的返回值相同
+
+    Examples:
+        >>> list(cdt_parallel(['去年', '上周三'], workers=2, reference_date='2021-07-14'))
+        [[('2020-01-01', '2020-12-31')], [('=', '2021-07-07')]]
+    """
+    ctx = get_date_context(reference_date)
+    batches = iter_batches(texts, chunksize)
+    if workers == 1:
+        for batch in batches:
+            yield from cdt_batch(batch, reference_date=ctx, as_objects=as_objects)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=warm_worker,
+                             initargs=(worker_settings(), initializer, initargs)) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(cdt_batch, batch, ctx, as_objects))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# ---------------------------------- 异步接口 ---------------------------------- #
+
+# 每次提交给执行器的最多条数
+ASYNC_BATCH_SIZE = 256
+
+# `acdt`/`acdt_many`所用的执行器, None时为事件循环默认的线程池
+_ASYNC_EXECUTOR = None
+# 每个事件循环一个`AsyncBatcher`
+_ASYNC_BATCHERS = weakref.WeakKeyDictionary()
+
+
+def set_async_executor(executor: Optional['Executor']) -> None:
+    """设置`acdt`/`acdt_many`使用的执行器
+
+    线程池中的转换仍然和事件循环争抢GIL, 需要完全隔离时用进程池(建议以`warm_worker`为initializer,
+    `worker_settings()`为initargs).
+    执行器由调用方负责关闭
+
+    Args:
+        executor (Optional[Executor]): 线程池或进程池, None时恢复为事件循环默认的线程池
+    """
+    global _ASYNC_EXECUTOR
+    _ASYNC_EXECUTOR = executor
+
+
+class AsyncBatcher(object):
+    """把同一轮事件循环中并发的`acdt`合并成一次`cdt_batch`提交
+
+    请求先排队, 在事件循环的下一次迭代中按(参考时间, as_objects)分组, 每`max_batch`条提交一次.
+    提交前已经超时或者取消的请求直接丢弃
+    """
+
+    def __init__(self, loop: 'asyncio.AbstractEventLoop', executor: Optional['Executor'],
+                 max_batch: int = ASYNC_BATCH_SIZE):
+        assert max_batch > 0, f'max_batch <= 0'
+        self.loop = loop
+        self.executor = executor
+        self.max_batch = max_batch
+        self.requests = 0
+        self.submissions = 0
+        self._pending = []
+        self._scheduled = False
+
+    def submit(self, text: str, ctx: DateContext, as_objects: bool) -> 'asyncio.Future':
+        future = self.loop.create_future()
+        self._pending.append((text, (ctx, as_objects), future))
+        self.requests += 1
+        if not self._scheduled:
+            self._scheduled = True
+            self.loop.call_soon(self.flush)
+        return future
+
+    def flush(self) -> None:
+        self._scheduled = False
+        pending, self._pending = self._pending, []
+        groups = {}
+        for text, key, future in pending:
+            if not future.done():
+                groups.setdefault(key, []).append((text, future))
+        for (ctx, as_objects), items in groups.items():
+            for idx in range(0, len(items), self.max_batch):
+                texts, futures = zip(*items[idx: idx + self.max_batch])
+                self.submissions += 1
+                done = self.loop.run_in_executor(self.executor, cdt_batch, texts, ctx, as_objects)
+                done.add_done_callback(lambda done, futures=futures: self.deliver(done, futures))
+
+    @staticmethod
+    def deliver(done: 'asyncio.Future', futures: Tuple['asyncio.Future', ...]) -> None:
+        if done.cancelled():
+            for future in futures:
+                future.cancel()
+            return
+        exc = done.exception()
+        for idx, future in enumerate(futures):
+            # 等待方已经超时或者取消
+            if future.done():
+                continue
+            if exc is None:
+                future.set_result(done.result()[idx])
+            else:
+                future.set_exception(exc)
+
+
+def get_batcher(loop: 'asyncio.AbstractEventLoop') -> AsyncBatcher:
+    """当前事件循环和执行器对应的`AsyncBatcher`, 执行器变更后新建
+    """
+    batcher = _ASYNC_BATCHERS.get(loop)
+    if batcher is None or batcher.executor is not _ASYNC_EXECUTOR:
+        batcher = _ASYNC_BATCHERS[loop] = AsyncBatcher(loop, _ASYNC_EXECUTOR)
+    return batcher
+
+
+async def acdt(text: str, reference_date: Union[ReferenceDate, DateContext] = None, as_objects: bool = False,
+               timeout: Optional[float] = None) -> List:
+    """`cdt`的异步版本, 在执行器中转换, 不阻塞事件循环
+
+    同一轮事件循环中并发的调用合并成一次提交. 没有触发字符的文本直接返回, 不经过执行器
+
+    Args:
+        text (str): 输入文本
+        reference_date (Union[ReferenceDate, DateContext], optional): 同`cdt`. Defaults to None.
+        as_objects (bool, optional): 同`cdt`. Defaults to False.
+        timeout (Optional[float], optional): 等待的秒数. Defaults to None, 即一直等待.
+
+    Returns:
+        List: 同`cdt`
+
+    Raises:
+        asyncio.TimeoutError: 超时. 已经在线程中开始的转换不能中断, 会在后台完成, 结果被丢弃
+
+    Examples:
+        >>> await asyncio.gather(acdt('去年', reference_date='2021-07-14'), acdt('上周三', reference_date='2021-07-14'))
+        [[('2020-01-01', '2020-12-31')], [('=', '2021-07-07')]]
+    """
+    import asyncio
+
+    # 和`cdt`相同的预过滤, 不是字符串的输入(如None)也直接返回
+    if not isinstance(text, str) or TRIGGER_CHAR.isdisjoint(text):
+        DISPATCH_STATS['rejected'] += 1
+        return []
+    ctx = get_date_context(reference_date)
+    future = get_batcher(asyncio.get_running_loop()).submit(text, ctx, as_objects)
+    return await asyncio.wait_for(future, timeout)
+
+
+async def acdt_many(texts: Iterable[str], reference_date: Union[ReferenceDate, DateContext] = None,
+                    as_objects: bool = False, timeout: Optional[float] = None,
+                    chunksize: int = ASYNC_BATCH_SIZE) -> List[List]:
+    """`cdt_batch`的异步版本, 按`chunksize`条一批提交给执行器
+
+    Args:
+        texts (Iterable[str]): 输入文本
+        reference_date (Union[ReferenceDate, DateContext], optional): 同`cdt`. Defaults to None.
+        as_objects (bool, optional): 同`cdt`. Defaults to False.
+        timeout (Optional[float], optional): 整批等待的秒数. Defaults to None, 即一直等待.
+        chunksize (int, optional): 每次提交的条数. Defaults to ASYNC_BATCH_SIZE.
+
+    Returns:
+        List[List]: 与输入顺序一致的转换结果
+
+    Raises:
+        asyncio.TimeoutError: 超时. 还没有开始的批次会被取消
+    """
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    ctx = get_date_context(reference_date)
+    futures = [loop.run_in_executor(_ASYNC_EXECUTOR, cdt_batch, batch, ctx, as_objects)
+               for batch in iter_batches(texts, chunksize)]
+    if not futures:
         return []
+    try:
+        batches = await asyncio.wait_for(asyncio.gather(*futures), timeout)
+    finally:
+        for future in futures:
+            future.cancel()
+    return list(itertools.chain.from_iterable(batches))
+
+
+# `cdt_frame`中`op`列的取值, 时间段为`between`
+FRAME_OP = ['between', '>=', '<=', '=']
+
+
+def cdt_frame(values, reference_date: Union[ReferenceDate, DateContext] = None, workers: int = 1):
+    """转换pandas Series或者NumPy数组中的文本, 返回类型化的列. 需要安装pandas
+
+    先去重, 只转换不同的取值, 再按原顺序展开, 耗时和内存随不同取值的个数增长, 而不是行数
+
+    Args:
+        values (Union[pd.Series, np.ndarray, Iterable[str]]): 输入文本, 缺失值视为不匹配
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间. Defaults to None,
+                                    即当前时间.
+        workers (int, optional): 转换去重后的文本所用的进程数, 同`cdt_parallel`. Defaults to 1.
+
+    Returns:
+        pd.DataFrame: 与输入等长(Series时沿用其index), 列为
+                      `start` (datetime64): 开始日期, `<=`时为NaT
+                      `end` (datetime64): 结束日期, `>=`时为NaT
+                      `op` (category): `between`, `>=`, `<=`, `=`, 不匹配时为缺失值
+                      `matched` (bool): 是否转换出结果
+                      `和`的结果有两个时间段, 只保留第一个.
+                      日期按datetime64[D]计算, pandas 2.0之后以其支持的最粗精度datetime64[s]存放
+
+    Examples:
+        >>> cdt_frame(pd.Series(['去年', '三年后', '你好', '去年']), reference_date='2021-07-14')
+                start        end       op  matched
+        0  2020-01-01 2020-12-31  between     True
+        1  2024-07-14        NaT       >=     True
+        2         NaT        NaT      NaN    False
+        3  2020-01-01 2020-12-31  between     True
+    """
+    import numpy as np
+    import pandas as pd
+
+    ctx = get_date_context(reference_date)
+    if not isinstance(values, (pd.Series, pd.Index, np.ndarray)):
+        values = np.asarray(list(values), dtype=object)
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    results = cdt_parallel((str(value) for value in uniques), workers=workers, reference_date=ctx, as_objects=True)
+
+    # 每个不同取值一行, 最后多一行给缺失值(codes为-1)
+    size = len(uniques) + 1
+    start = np.full(size, np.datetime64('NaT'), dtype='datetime64[D]')
+    end = np.full(size, np.datetime64('NaT'), dtype='datetime64[D]')
+    op = np.full(size, -1, dtype=np.int8)
+    for idx, res in enumerate(results):
+        if not res:
+            continue
+        first = res[0]
+        if isinstance(first, DateRange):
+            start[idx], end[idx], op[idx] = first.start, first.end, 0
+        else:
+            op[idx] = FRAME_OP.index(first.op)
+            if first.op != '<=':
+                start[idx] = first.date
+            if first.op != '>=':
+                end[idx] = first.date
+
+    index = values.index if isinstance(values, pd.Series) else None
+    op = op[codes]
+    return pd.DataFrame({
+        'start': start[codes],
+        'end': end[codes],
+        'op': pd.Categorical.from_codes(op, categories=FRAME_OP),
+        'matched': op >= 0,
+    }, index=index)
+
+
+# 单个日期说法的最大长度, 超过的部分不再跨块等待, 保证流式抽取的内存有界
+MAX_SPAN_LENGTH = 64
+# 日期说法首尾的连接词没有意义, 去掉后再转换
+SPAN_CONNECTOR = '到至和'
+# 只和前后的字一起才有意义的字, 在开头(`现在`的`在`)或者末尾(`之前`, `以后`, `之内`的`之`, `以`)时一并去掉,
+# 如`在三月和五月之间`中的`在`和`之`
+SPAN_DANGLING_HEAD = '在'
+SPAN_DANGLING_TAIL = '之以'
+
+
+class DateMatch(NamedTuple):
+    """长文本中找到的一处日期说法
+
+    Attributes:
+        start (int): 在整个输入中的起始位置(字符)
+        end (int): 在整个输入中的结束位置(字符, 不包含)
+        text (str): 原文
+        result (List): 该说法的转换结果, 和`cdt`的返回值相同
+    """
+    start: int
+    end: int
+    text: str
+    result: List
+
+
+def iter_chunks(source: Union[str, TextIO, Iterable[str]], chunk_size: int = 4096) -> Iterator[str]:
+    """将字符串, 文件对象或者行的迭代器统一为文本块的迭代器
+    """
+    if isinstance(source, str):
+        for st in range(0, len(source), chunk_size):
+            yield source[st:st + chunk_size]
+    elif hasattr(source, 'read'):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from source
+
+
+def iter_dates(source: Union[str, TextIO, Iterable[str]], reference_date: Union[ReferenceDate, DateContext] = None,
+               as_objects: bool = False, chunk_size: int = 4096) -> Iterator[DateMatch]:
+    """流式地找出长文本中的每一处日期说法
+
+    按块读取输入, 每块只扫描一次, 只有块末尾尚未结束的候选片段(不超过`MAX_SPAN_LENGTH`)
+    会留到下一块, 内存占用与输入长度无关
+
+    Args:
+        source (Union[str, TextIO, Iterable[str]]): 长文本, 文本文件对象, 或者逐行的迭代器
+        reference_date (Union[ReferenceDate, DateContext], optional): 参考时间. Defaults to None,
+                                    即当前时间.
+        as_objects (bool, optional): 同`cdt`. Defaults to False.
+        chunk_size (int, optional): 字符串和文件对象每次读取的字符数. Defaults to 4096.
+
+    Yields:
+        DateMatch: 按出现顺序的日期说法, 位置为整个输入中的字符偏移
+
+    Examples:
+        >>> list(iter_dates('客户说去年下半年买的, 上周三又坏了', reference_date='2021-07-14'))
+        [DateMatch(start=3, end=8, text='去年下半年', result=[('2020-07-01', '2020-12-31')]),
+         DateMatch(start=12, end=15, text='上周三', result=[('=', '2021-07-07')])]
+    """
+    ctx = get_date_context(reference_date)
+    pattern = RULES['date_span'].compiled
+    # offset为buf[0]在整个输入中的位置, carry为上一块末尾尚未结束的候选片段
+    offset, carry = 0, ''
+    for chunk in iter_chunks(source, chunk_size):
+        buf = carry + chunk
+        consumed = len(buf)
+        for m in pattern.finditer(buf):
+            if m.end() == len(buf) and m.end() - m.start() < MAX_SPAN_LENGTH:
+                consumed = m.start()
+                break
+            match = match_span(m.group(), offset + m.start(), ctx, as_objects)
+            if match:
+                yield match
+        carry = buf[consumed:]
+        offset += consumed
+    if carry:
+        match = match_span(carry, offset, ctx, as_objects)
+        if match:
+            yield match
+
+
+def match_span(span: str, start: int, ctx: DateContext, as_objects: bool = False) -> Optional[DateMatch]:
+    """转换一个候选片段, 不是日期说法的返回None
+    """
+    # `现`, `前`, `后`, `内`也在片段的字符中, 开头的`在`前面和末尾的`之`, `以`后面一定不是它们
+    stripped = span.lstrip(SPAN_CONNECTOR + SPAN_DANGLING_HEAD)
+    start += len(span) - len(stripped)
+    stripped = stripped.rstrip(SPAN_CONNECTOR + SPAN_DANGLING_TAIL)
+    if TRIGGER_CHAR.isdisjoint(stripped):
+        return None
+    res = cdt(stripped, reference_date=ctx, as_objects=as_objects)
+    if not res:
+        return None
+    return DateMatch(start, start + len(stripped), stripped, res)
+
+
+
+def read_rows(lines: Iterable[str], input_format: str, column: Optional[str],
+              errors: Optional[Counter] = None) -> Iterator[Tuple[object, str]]:
+    """命令行的输入, 逐行解析为(原始行, 待转换文本)
+
+    tsv取第`column`列(从1开始, 默认为1), jsonl取`column`字段(默认为`text`).
+    jsonl中解析不了或者不是对象的行不中断整个批次, 原样放在`line`/`row`字段中, 文本为空,
+    按原因计入`errors`
+    """
+    import json
+
+    if input_format == 'jsonl':
+        key = column or 'text'
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                if errors is not None:
+                    errors['invalid json'] += 1
+                yield {'line': line.rstrip('\r\n'), 'error': 'invalid json'}, ''
+                continue
+            if not isinstance(row, dict):
+                if errors is not None:
+                    errors['not an object'] += 1
+                yield {'row': row, 'error': 'not an object'}, ''
+                continue
+            yield row, str(row.get(key) or '')
+    else:
+        idx = int(column or 1) - 1
+        for line in lines:
+            row = line.rstrip('\r\n').split('\t')
+            yield row, row[idx] if idx < len(row) else ''
+
+
+def format_row(row: object, text: str, res: List, output_format: str) -> str:
+    """命令行的输出, tsv在原始行末尾追加一列json. jsonl在原始行中加入`dates`字段,
+    输入为tsv时输出{"text": ..., "row": [各列], "dates": ...}, 保留原始各列以便对回原始数据
+    """
+    import json
+
+    dates = json.dumps(res, ensure_ascii=False)
+    if output_format == 'tsv':
+        fields = row if isinstance(row, list) else [text]
+        return '\t'.join(fields) + '\t' + dates + '\n'
+    obj = dict(row) if isinstance(row, dict) else {'text': text, 'row': row}
+    obj['dates'] = res
+    return json.dumps(obj, ensure_ascii=False) + '\n'
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """命令行入口, 从文件或标准输入逐行读取, 转换结果写到标准输出
+
+    Examples:
+        $ python -m chinses_date_translator --input queries.tsv --column 2 --format jsonl
+        $ cat queries.jsonl | python -m chinses_date_translator --input-format jsonl --column query --workers 8
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='python -m chinses_date_translator', description='中文日期批量转换')
+    parser.add_argument('--input', default='-', help='输入文件, 默认为标准输入')
+    parser.add_argument('--output', default='-', help='输出文件, 默认为标准输出')
+    parser.add_argument('--input-format', choices=['tsv', 'jsonl'], default='tsv', help='输入格式, 默认为tsv')
+    parser.add_argument('--column', default=None, help='tsv的列号(从1开始, 默认为1)或者jsonl的字段名(默认为text)')
+    parser.add_argument('--format', choices=['jsonl', 'tsv'], default='jsonl', help='输出格式, 默认为jsonl')
+    parser.add_argument('--workers', type=int, default=1, help='进程数, 默认为1, 即不启动进程池')
+    parser.add_argument('--chunksize', type=int, default=256, help='每批分给进程池的行数')
+    parser.add_argument('--reference-date', default=None, help='参考时间, 如2021-07-14, 默认为当天')
+    args = parser.parse_args(argv)
+
+    # 标准输入输出同样以1MiB的缓冲重新打开, closefd=False, 关闭时不会关掉原来的文件描述符
+    buffering = 1 << 20
+    fin = open(sys.stdin.fileno() if args.input == '-' else args.input,
+               encoding='utf-8', buffering=buffering, closefd=args.input != '-')
+    fout = open(sys.stdout.fileno() if args.output == '-' else args.output, 'w',
+                encoding='utf-8', buffering=buffering, closefd=args.output != '-')
+    try:
+        # 一份给转换, 一份留给输出, 两者之间只差正在处理的批次
+        errors = Counter()
+        rows, texts = itertools.tee(read_rows(fin, args.input_format, args.column, errors))
+        results = cdt_parallel((text for _, text in texts), workers=args.workers, chunksize=args.chunksize,
+                               reference_date=args.reference_date)
+        count = 0
+        st = time.perf_counter()
+        for (row, text), res in zip(rows, results):
+            fout.write(format_row(row, text, res, args.format))
+            count += 1
+        fout.flush()
+        cost = time.perf_counter() - st
+    finally:
+        fin.close()
+        fout.close()
+    print(f'{count} rows in {cost:.2f}s, {count / max(cost, 1e-9):.0f} rows/s', file=sys.stderr)
+    for reason, num in errors.items():
+        print(f'{num} rows with {reason}, written with empty dates', file=sys.stderr)
+
 
-   
 if __name__ == '__main__':
-    
-    # 一些测试的例子 
-    texts = [
-        #! union
-        # '2019年4月10日',
-        # '2019年4月10日到2020年5月16日',
-        # '2018年到2019年',
-        # '第1季度到第四季度',
-        # '2018年第2季度到2021年第三季度',
-        # '18年4月到二零二零年5月',
-        # '4月19号到十二月7日',
-        
-        # '14年十二月八号至19年4月29日',
-        # '18年4月十号到二零二零年5月4日',
-        # '昨天到今天到明天',
-        # '2019年到18年',
-        # '95年到14年',
-        # '98年和14年',
-        # '2000年第一季度',
-        # '2018年4月',
-        # '6月十五号',
-        
-        # '2016年十月三十号',
-        # '上周末',
-        # '2018年前两个季度',
-        # '前三季度',
-        # '20年前2个月',
-        # '前三个月',
-        # '95年第一季度',
-        # '08年第一场雪',
-        # '2017年3月到6月',
-        # '2018年第一季度到第三季度',
-
-        #!  year
-        # '一九年上半年',
-        # '最近半年的天气咋样?',
-        # '上半年',
-        # '去年下半年',
-        # '最近三年',
-        # '前三年',
-        # '5年前',
-        # '5年后',
-        # '5年内',
-
-        #! season
-        # '这个季度',
-        # '第三季',
-        # '最近1个季度',
-        # '上个季度',
-        # '前三个季度',
-        # '去年前三个季度',
-        # '这1季',
-        
-        #! month
-        # '近三个月',
-        # '这个月',
-        # '本月',
-        # '前三个月',
-        # '五月份',
-        # '4月前',
-        # '4个月前',
-        # '5月份以后',
-        # '5个月后',
-        # '去年5月前',
-        # '一个月',
-        
-        #! week
-        # '这一周',
-        # '周三',
-        # '这周',
-        # '这周五',
-        # '最近一周',
-        # '前1周',
-        # '上周礼拜五',
-        # '上礼拜三到这星期五',
-        # '上周周一到周四',
-        # '三周前',
-        # '前三周',
-        # '三周后',
-                        
-        #! day
-        # '今天',
-        # '2号到今天',
-        # '2号到30号',
-        # '前五天',
-        # '十八日',
-        # '五天前',
-        # '五号前',
-        # '30号',
-        # '五月一号到三号',
-        # '五月前十天',
-        # '3天后',
-        # '5月3号前',
-        # '1月1日前',
-        # '十五号到昨天',
-
-        #! 到
-        # '6月到七月',
-        # '18年6月1号到30号',
-        # '19年第一季度到第二季度',
-        # '去年到今天',
-        # '去年到今年',
-        # '去年一月一号到2021年7月13日',
-        # '去年1月1号到今年',
-        # '去年到现在',
-        
-        #! 和
-        # '2019年八月1日和十月20日',
-        # '2015年4月和去年3月',
-        # '1号和5号',
-        # '2019年和今年',
-        # '张飞和关羽四月份的体重',
-        # '张飞和关羽三月份和七月份的饭量',
-        # '张飞和关羽去年三月到六月的运动量',
-        # '第一季度',
-        
-        #! 最近
-        # '最近销量咋样啊',
-        # '最近3天去哪儿玩了',
-        
-        #! 现在
-        '今天房价如何?',
-        '这个人现在是这么状态?',
-        '现在在哪?',
-    ]
-    
-    for text in texts:
-        res = cdt(text)
-        print(f'{res}')
-        print('-' * 100)
+    main()